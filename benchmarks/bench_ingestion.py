@@ -0,0 +1,113 @@
+"""
+Benchmark ingestion from the consumer throughput queue: one reserve/delete per sample vs. pipelined batches,
+and pipelined batches of multi-sample reports (see fs.report_protocol).
+
+Requires ./run_beanstalkd.sh to be running locally, e.g.
+  PYTHONPATH=`pwd` python benchmarks/bench_ingestion.py --samples 20000
+"""
+import argparse
+import json
+import time
+
+import greenstalk
+
+from fs.base_process import DEFAULT_BATCH_SIZE
+from fs.beanstalk_batch import reserve_batch, delete_batch
+from fs.report_protocol import encode_report, decode_report
+
+TUBE = "bench_ingestion"
+
+
+def fill(queue, num_samples, num_consumers=15):
+    for i in range(num_samples):
+        queue.put(json.dumps({"consumer_id": f"consumer-{i % num_consumers}", "throughput": 75, "producer_count": 10}))
+
+
+def fill_reports(queue, num_samples, samples_per_report, num_consumers=15):
+    for i in range(num_samples // samples_per_report):
+        samples = [(1600000000.0 + 5 * j, 75, 10) for j in range(samples_per_report)]
+        queue.put(encode_report(f"consumer-{i % num_consumers}", samples))
+
+
+def drain_single(queue):
+    """
+    One reserve/delete per sample, as ingestion was before the pipelined batches
+    """
+    samples = 0
+    while True:
+        try:
+            job = queue.reserve(timeout=0)
+        except greenstalk.TimedOutError:
+            return samples
+
+        json.loads(job.body)
+        queue.delete(job)
+        samples += 1
+
+
+def drain_batch(queue, batch_size):
+    """
+    Equivalent to BaseProcess.get_data_batch()
+    """
+    samples = 0
+    while True:
+        jobs = reserve_batch(queue, batch_size, timeout=0)
+        if len(jobs) == 0:
+            return samples
+
+        for job in jobs:
+            json.loads(job.body)
+        delete_batch(queue, jobs)
+        samples += len(jobs)
+
+
+def drain_reports(queue, batch_size):
+    """
+    Equivalent to BaseProcess.get_data_batch(), with multi-sample reports
+    """
+    samples = 0
+    while True:
+        jobs = reserve_batch(queue, batch_size, timeout=0)
+        if len(jobs) == 0:
+            return samples
+
+        for job in jobs:
+            samples += len(decode_report(job.body))
+        delete_batch(queue, jobs)
+
+
+def measure(label, queue, num_samples, drain, fill=fill):
+    fill(queue, num_samples)
+
+    start_s = time.perf_counter()
+    samples = drain(queue)
+    elapsed_s = time.perf_counter() - start_s
+
+    print(f"{label:<24} {samples:>8} samples in {elapsed_s:.3f}s = {samples / elapsed_s:>10.0f} samples/s")
+
+
+def run():
+    parser = argparse.ArgumentParser(description='Consumer throughput queue ingestion benchmark')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=12000)
+    parser.add_argument('--samples', type=int, default=10000)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--samples-per-report', type=int, default=12)
+    args = parser.parse_args()
+
+    queue = greenstalk.Client(host=args.host, port=args.port, use=TUBE, watch=TUBE)
+    try:
+        # make sure the tube is empty before we start
+        drain_batch(queue, args.batch_size)
+
+        measure("reserve/delete", queue, args.samples, drain_single)
+        measure(f"batch ({args.batch_size})", queue, args.samples, lambda q: drain_batch(q, args.batch_size))
+        measure(f"batch, {args.samples_per_report} per report", queue, args.samples,
+                lambda q: drain_reports(q, args.batch_size),
+                lambda q, n: fill_reports(q, n, args.samples_per_report))
+    finally:
+        queue.close()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,73 @@
+"""
+Benchmark the per-sample cost of the throughput window update in ThroughputProcess.check_sample():
+a list per (consumer, producer count), sliced and averaged with statistics.mean vs. a RollingWindow.
+
+  PYTHONPATH=`pwd` python benchmarks/bench_rolling_window.py --consumers 100 200 500
+"""
+import argparse
+import random
+import time
+from collections import defaultdict
+from statistics import mean
+
+from fs.rolling_window import RollingWindow
+
+WINDOW_SIZE = 8
+
+
+def get_samples(num_consumers, num_samples, num_producers=10):
+    return [(f"consumer-{i % num_consumers}", random.uniform(0.5, 0.8), num_producers) for i in range(num_samples)]
+
+
+def run_lists(samples, window_size=WINDOW_SIZE):
+    """
+    Equivalent to the original check_sample()
+    """
+    consumer_throughput_dict = defaultdict(lambda: defaultdict(list))
+    for consumer_id, throughput_in_gbps, num_producers in samples:
+        consumer_throughput_dict[consumer_id][str(num_producers)].append(throughput_in_gbps)
+        if len(consumer_throughput_dict[consumer_id][str(num_producers)]) >= window_size:
+            consumer_throughput_dict[consumer_id][str(num_producers)] = \
+                consumer_throughput_dict[consumer_id][str(num_producers)][-window_size:]
+            mean(consumer_throughput_dict[consumer_id][str(num_producers)])
+
+
+def run_windows(samples, window_size=WINDOW_SIZE):
+    """
+    Equivalent to check_sample() with ThroughputProcess.get_window()
+    """
+    windows = {}
+    for consumer_id, throughput_in_gbps, num_producers in samples:
+        key = (consumer_id, num_producers)
+        window = windows.get(key)
+        if window is None:
+            window = windows[key] = RollingWindow(window_size)
+        window.append(throughput_in_gbps)
+        if window.is_full():
+            window.mean()
+
+
+def bench(fn, samples):
+    start = time.perf_counter()
+    fn(samples)
+    return (time.perf_counter() - start) / len(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling window benchmark")
+    parser.add_argument("--consumers", type=int, nargs="+", default=[15, 100, 200, 500])
+    parser.add_argument("--samples-per-consumer", type=int, default=1000)
+    args = parser.parse_args()
+
+    for num_consumers in args.consumers:
+        samples = get_samples(num_consumers, num_consumers * args.samples_per_consumer)
+
+        list_s = bench(run_lists, samples)
+        window_s = bench(run_windows, samples)
+
+        print(f"{num_consumers} consumers: list+mean {list_s * 1e6:.2f} us/sample, "
+              f"RollingWindow {window_s * 1e6:.2f} us/sample ({list_s / window_s:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
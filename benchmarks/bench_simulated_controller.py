@@ -0,0 +1,41 @@
+"""
+Run a whole controller configuration matrix against the simulated cluster, reporting the simulated time covered
+and the wall clock time taken (i.e. the controller overhead).
+
+  PYTHONPATH=`pwd` python benchmarks/bench_simulated_controller.py --controller consumer
+"""
+import argparse
+import logging
+import time
+
+from fs.batch_size_controller import BatchSizeController
+from fs.consumer_controller import ConsumerController
+from fs.partition_count_controller import PartitionCountController
+from fs.replication_factor_controller import ReplicationFactorController
+from fs.simulator import simulated
+
+CONTROLLERS = {"batch-size": BatchSizeController, "consumer": ConsumerController,
+               "partition-count": PartitionCountController, "replication-factor": ReplicationFactorController}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated controller benchmark")
+    parser.add_argument("--controller", choices=sorted(CONTROLLERS), default="consumer")
+    parser.add_argument("--verbose", action="store_true", help="keep the INFO logging (to console and file)")
+    args = parser.parse_args()
+
+    controller = simulated(CONTROLLERS[args.controller])()
+    if not args.verbose:
+        logging.getLogger("fs").setLevel(logging.WARNING)
+
+    start_s = time.perf_counter()
+    controller.run()
+    elapsed_s = time.perf_counter() - start_s
+
+    simulated_s = controller.clock.time()
+    print(f"{controller.run_uid}: {len(controller.configurations)} configurations, "
+          f"{simulated_s / 3600:.1f} simulated hours in {elapsed_s:.2f}s ({simulated_s / elapsed_s:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Minimal non-blocking beanstalkd client for asyncio.
+
+Implements only the commands needed by the throughput monitor, with the same
+responses/errors as greenstalk (the response parsing is shared with greenstalk).
+"""
+import asyncio
+
+import greenstalk
+
+DEFAULT_TUBE = 'default'
+
+
+class AsyncBeanstalkClient:
+    """
+    asyncio beanstalkd client.
+
+    Use AsyncBeanstalkClient.connect() to create a connected client.
+    """
+
+    def __init__(self, reader, writer, encoding='utf-8'):
+        self._reader = reader
+        self._writer = writer
+        self.encoding = encoding
+
+    @classmethod
+    async def connect(cls, host, port, use=DEFAULT_TUBE, watch=DEFAULT_TUBE, encoding='utf-8'):
+        reader, writer = await asyncio.open_connection(host, port)
+        client = cls(reader, writer, encoding)
+
+        if use != DEFAULT_TUBE:
+            await client.use(use)
+
+        if watch != DEFAULT_TUBE:
+            await client.watch(watch)
+            await client.ignore(DEFAULT_TUBE)
+
+        return client
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+
+    async def _close_out_of_step(self, operation, e):
+        """
+        Close the connection after a failed batch, see fs.beanstalk_batch.close_out_of_step()
+        """
+        try:
+            await self.close()
+        except OSError:
+            pass
+
+        return ConnectionError(f"beanstalkd {operation} batch failed, connection closed: {e!r}")
+
+    async def _read_response(self, expected):
+        line = await self._reader.readline()
+        return greenstalk._parse_response(line, expected)
+
+    async def _read_job(self):
+        job_id, size = (int(n) for n in await self._read_response(b'RESERVED'))
+        chunk = (await self._reader.readexactly(size + 2))[:-2]
+        body = chunk if self.encoding is None else chunk.decode(self.encoding)
+        return greenstalk.Job(job_id, body)
+
+    async def _send_cmd(self, cmd, expected):
+        self._writer.write(cmd + b'\r\n')
+        await self._writer.drain()
+        return await self._read_response(expected)
+
+    async def use(self, tube):
+        await self._send_cmd(b'use %b' % tube.encode('ascii'), b'USING')
+
+    async def watch(self, tube):
+        n, = await self._send_cmd(b'watch %b' % tube.encode('ascii'), b'WATCHING')
+        return int(n)
+
+    async def ignore(self, tube):
+        n, = await self._send_cmd(b'ignore %b' % tube.encode('ascii'), b'WATCHING')
+        return int(n)
+
+    async def put(self, body, priority=greenstalk.DEFAULT_PRIORITY, delay=greenstalk.DEFAULT_DELAY,
+                  ttr=greenstalk.DEFAULT_TTR):
+        if isinstance(body, str):
+            body = body.encode(self.encoding)
+        n, = await self._send_cmd(b'put %d %d %d %d\r\n%b' % (priority, delay, ttr, len(body), body), b'INSERTED')
+        return int(n)
+
+    async def reserve(self, timeout):
+        self._writer.write(b'reserve-with-timeout %d\r\n' % timeout)
+        await self._writer.drain()
+        return await self._read_job()
+
+    async def delete(self, job):
+        await self._send_cmd(b'delete %d' % greenstalk._to_id(job), b'DELETED')
+
+    async def reserve_batch(self, max_jobs, timeout=1):
+        """
+        Pipelined reserve, see fs.beanstalk_batch.reserve_batch()
+
+        :param max_jobs:
+        :param timeout: seconds to wait for the first job
+        :return: list of greenstalk.Job
+        """
+        commands = [b'reserve-with-timeout %d\r\n' % timeout]
+        commands.extend([b'reserve-with-timeout 0\r\n'] * (max_jobs - 1))
+        self._writer.write(b''.join(commands))
+        await self._writer.drain()
+
+        jobs = []
+        deadline_soon = None
+        try:
+            for _ in range(max_jobs):
+                try:
+                    jobs.append(await self._read_job())
+                except greenstalk.TimedOutError:
+                    continue
+                except greenstalk.DeadlineSoonError as e:
+                    deadline_soon = e
+        except Exception as e:
+            # the jobs reserved so far are released by closing the connection
+            raise await self._close_out_of_step("reserve", e) from e
+
+        if deadline_soon is not None and len(jobs) == 0:
+            raise deadline_soon
+
+        return jobs
+
+    async def delete_batch(self, jobs):
+        """
+        Pipelined delete, see fs.beanstalk_batch.delete_batch()
+
+        :param jobs:
+        :return: list of job ids which could not be deleted
+        """
+        if len(jobs) == 0:
+            return []
+
+        job_ids = [greenstalk._to_id(job) for job in jobs]
+        self._writer.write(b''.join([b'delete %d\r\n' % job_id for job_id in job_ids]))
+        await self._writer.drain()
+
+        failed = []
+        try:
+            for job_id in job_ids:
+                try:
+                    await self._read_response(b'DELETED')
+                except greenstalk.NotFoundError:
+                    failed.append(job_id)
+        except Exception as e:
+            raise await self._close_out_of_step("delete", e) from e
+
+        return failed
@@ -0,0 +1,230 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import greenstalk
+
+from fs.async_beanstalk import AsyncBeanstalkClient
+from fs.base_process import DEFAULT_BATCH_SIZE
+from fs.cluster_snapshot import parse_running_pods
+from fs.process_stages import StageError
+from fs.queue_backend import BeanstalkQueue
+from fs.report_protocol import decode_report
+from fs.utils import addlogger, SCRIPT_DIR, CONSUMER_THROUGHPUT_TUBE
+
+# how often the producer count is refreshed in the background
+DEFAULT_REFRESH_INTERVAL_S = 5
+
+# maximum number of ingested batches waiting to be analysed
+MAX_PENDING_BATCHES = 16
+
+
+@addlogger
+class AsyncProducerScaler:
+    """
+    Producer scaler for a process driven by the AsyncThroughputMonitor.
+
+    Scale requests return immediately and are applied by an asyncio task (the latest request wins),
+    and the producer count is refreshed in the background, so neither blocks sample ingestion.
+
+    Note - must be created inside the running event loop
+    """
+    def __init__(self, refresh_interval_s=DEFAULT_REFRESH_INTERVAL_S):
+        self.refresh_interval_s = refresh_interval_s
+        self.producer_count = 0
+        self.desired_producer_count = None
+        self._scale_requested = asyncio.Event()
+
+    def scale_producers(self, producer_count):
+        self.desired_producer_count = producer_count
+        self._scale_requested.set()
+
+    def get_producer_count(self):
+        return self.producer_count
+
+    async def run_script(self, *args):
+        p = await asyncio.create_subprocess_exec('/bin/bash', '-e', *args, stdout=asyncio.subprocess.PIPE,
+                                                 cwd=SCRIPT_DIR)
+        out, _ = await p.communicate()
+        return out.decode("UTF-8")
+
+    async def refresh(self):
+        self.producer_count = parse_running_pods(await self.run_script("./get-running-pods.sh")).producers
+
+    async def refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval_s)
+            await self.refresh()
+
+    async def apply(self):
+        self._scale_requested.clear()
+        producer_count = self.desired_producer_count
+        self.__log.info(f"Scaling producers to {producer_count}")
+        await self.run_script("./scale-producers.sh", str(producer_count))
+        await self.refresh()
+
+    async def actuate_loop(self):
+        while True:
+            await self._scale_requested.wait()
+            await self.apply()
+
+    async def flush(self):
+        """
+        Apply any outstanding scale request
+        :return:
+        """
+        if self._scale_requested.is_set():
+            await self.apply()
+
+
+class ThreadedQueueClient:
+    """
+    The batch operations of a blocking queue backend (e.g. memory, shm), run on a thread of their own
+    so as not to block the event loop
+    """
+    def __init__(self, queue):
+        self.queue = queue
+        # note - a single thread, so the queue is only read by one thread at a time (e.g. a shm ring)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ThreadedQueueClient")
+
+    async def call(self, operation, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, operation, *args)
+
+    async def reserve_batch(self, max_jobs, timeout=1):
+        return await self.call(self.queue.reserve_batch, max_jobs, timeout)
+
+    async def delete_batch(self, jobs):
+        return await self.call(self.queue.delete_batch, jobs)
+
+    async def close(self):
+        # note - waits for a reserve still in progress (e.g. of a cancelled ingest) before closing the queue
+        await asyncio.to_thread(self.executor.shutdown)
+        self.queue.close()
+
+
+@addlogger
+class AsyncThroughputMonitor:
+    """
+    Run a throughput process (e.g. StressTestProcess, SoakTestProcess) as asyncio tasks
+    inside the calling process, rather than forking it.
+
+    Sample ingestion, analysis and producer scaling run as separate tasks, so they overlap.
+
+    An error which ends the ingest or scaling tasks stops the process, and is raised (as StageError)
+    once the analysis has returned, as per fs.process_stages.
+    """
+    def __init__(self, process, queue, tube=CONSUMER_THROUGHPUT_TUBE, batch_size=DEFAULT_BATCH_SIZE,
+                 scaler_factory=AsyncProducerScaler):
+        """
+        :param queue: consumer throughput queue (QueueBackend), the samples are read from a connection of its own
+        :param tube: watched by the connection
+        :param scaler_factory: creates the producer scaler (inside the event loop)
+        """
+        self.process = process
+        self.queue = queue
+        self.tube = tube
+        self.batch_size = batch_size
+        self.scaler_factory = scaler_factory
+        # (task name, error) which ended a task, if any
+        self.error = None
+
+    def run(self):
+        asyncio.run(self.run_async())
+
+    async def connect(self):
+        """
+        :return: client with async reserve_batch/delete_batch/close, watching only the tube
+        """
+        # note - beanstalkd is read without blocking, the other backends on a thread
+        if isinstance(self.queue, BeanstalkQueue):
+            return await AsyncBeanstalkClient.connect(self.queue.host, self.queue.port, watch=self.tube)
+
+        return ThreadedQueueClient(self.queue.connection(watch=self.tube))
+
+    def on_task_done(self, task):
+        """
+        Stop the process if the task ended on an error (the tasks otherwise run until cancelled)
+        """
+        if task.cancelled() or task.exception() is None:
+            return
+
+        self.__log.error(f"Error: {task.get_name()} stopped, {task.exception()!r}")
+        if self.error is None:
+            self.error = (task.get_name(), task.exception())
+        self.process.stop()
+
+    async def run_async(self):
+        self.__log.info("Started.")
+
+        scaler = self.scaler_factory()
+        self.process.attach_scaler(scaler)
+
+        client = await self.connect()
+        batches = asyncio.Queue(maxsize=MAX_PENDING_BATCHES)
+
+        # the process expects to know the producer count from the start
+        await scaler.refresh()
+        self.process.on_start()
+
+        tasks = [asyncio.create_task(self.ingest(client, batches), name="ingest"),
+                 asyncio.create_task(scaler.refresh_loop(), name="refresh"),
+                 asyncio.create_task(scaler.actuate_loop(), name="actuate")]
+        for task in tasks:
+            task.add_done_callback(self.on_task_done)
+        try:
+            await self.analyse(batches)
+        finally:
+            for task in tasks:
+                task.cancel()
+            # note - errors are reported by on_task_done
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self.error is not None:
+            try:
+                await client.close()
+            except OSError:
+                # e.g. closed by the server
+                pass
+            name, error = self.error
+            raise StageError(f"{name} stopped, {error!r}") from error
+
+        self.process.complete()
+
+        # e.g. cancelling an outstanding producer increment
+        await scaler.flush()
+        await client.close()
+
+        self.__log.info("Completed.")
+
+    async def ingest(self, client, batches):
+        while True:
+            try:
+                jobs = await client.reserve_batch(self.batch_size, timeout=1)
+                if len(jobs) == 0:
+                    continue
+
+                samples = []
+                for job in jobs:
+                    try:
+                        samples.extend(decode_report(job.body))
+                    except ValueError:
+                        self.__log.warning(f"Warning: unable to decode job {job.id}, discarding.")
+
+                failed = await client.delete_batch(jobs)
+                if len(failed) > 0:
+                    self.__log.warning(f"Warning: unable to delete jobs {failed}")
+
+                await batches.put(samples)
+            except greenstalk.UnknownResponseError:
+                self.__log.warning("Warning: unknown response from beanstalkd server.")
+            except greenstalk.DeadlineSoonError:
+                self.__log.warning("Warning: job timeout in next second.")
+
+    async def analyse(self, batches):
+        while not self.process.is_stopped():
+            try:
+                samples = await asyncio.wait_for(batches.get(), timeout=1)
+            except asyncio.TimeoutError:
+                continue
+
+            if self.process.process_samples(samples):
+                return
@@ -1,13 +1,43 @@
 import os
-import subprocess
 from datetime import datetime
-import json
 import greenstalk
 
+from fs.beanstalk_batch import reserve_batch, delete_batch
+from fs.clock import system_clock
+from fs.cluster_snapshot import ROLE_PRODUCER
+from fs.pod_count_cache import pod_counts
 from fs.read_write_jsonl_mixin import ReadWriteJSONLMixin
+from fs.report_protocol import decode_report
+from fs.shell_pool import shell_pool
 from fs.utils import SCRIPT_DIR, addlogger
 from fs.stoppable_process import StoppableProcess
 
+# maximum number of jobs drained from the queue per call to get_data_batch()
+DEFAULT_BATCH_SIZE = 64
+
+
+def get_metrics_path(base_path, configuration):
+    """
+    :return: path of the metrics file of the configuration
+    """
+    metrics_filename = "{0}_metrics_{1}.csv".format(configuration["configuration_uid"], configuration["sequence_number"])
+    return os.path.join(base_path, metrics_filename)
+
+
+def get_details_path(base_path, configuration):
+    """
+    :return: path of the details file of the configuration (see BaseProcess.write_details)
+    """
+    details_filename = "{0}_details_{1}.jsonl".format(configuration["configuration_uid"], configuration["sequence_number"])
+    return os.path.join(base_path, details_filename)
+
+
+def get_samples_prefix(base_path, configuration):
+    """
+    :return: path prefix of the sample log of the configuration (see SampleRecorder)
+    """
+    samples_prefix = "{0}_samples_{1}".format(configuration["configuration_uid"], configuration["sequence_number"])
+    return os.path.join(base_path, samples_prefix)
 
 @addlogger
 class BaseProcess(StoppableProcess, ReadWriteJSONLMixin):
@@ -17,6 +47,15 @@ class BaseProcess(StoppableProcess, ReadWriteJSONLMixin):
         self.configuration = configuration
         self.base_directory = os.path.dirname(os.path.abspath(__file__))
 
+        # optional producer scaler (see attach_scaler)
+        self.scaler = None
+
+        # applies the producer count on a thread of its own, when set (see fs.process_stages)
+        self.actuator = None
+
+        # e.g. a ManualClock when replaying recorded samples
+        self.clock = system_clock
+
         # note - do not include the date in the path
         # (so as to avoid "midnight boundaries" and therefore data split over multiple files...)
         self.base_path = os.path.join(self.base_directory, "..", "log", configuration["run_uid"])
@@ -52,37 +91,63 @@ class BaseProcess(StoppableProcess, ReadWriteJSONLMixin):
         # merge the two dictionaries
         data = dict(data, **d)
 
-        metrics_filename = "{0}_metrics_{1}.csv".format(configuration["configuration_uid"], configuration["sequence_number"])
-        metrics_file = os.path.join(self.base_path, metrics_filename)
+        metrics_file = get_metrics_path(self.base_path, configuration)
 
         # expects a list, so pass in dict wrapped in a list
         self.dump_jsonl([data], metrics_file, append=True)
 
+    def write_details(self, configuration, data):
+        """
+        Write JSON to details file, e.g. per consumer statistics.
+        Note - the metrics are aggregated into CSV (see aggregate-stats.py), so hold only single values
+
+        :param configuration:
+        :param data:
+        :return:
+        """
+        details_file = get_details_path(self.base_path, configuration)
+
+        # expects a list, so pass in dict wrapped in a list
+        self.dump_jsonl([data], details_file, append=True)
+
     """
     Base process
     """
-    def get_data(self, consumer_throughput_queue, timeout=1):
-        data = None
-
-        try:
-            job = consumer_throughput_queue.reserve(timeout)
+    def get_data_batch(self, consumer_throughput_queue, max_jobs=DEFAULT_BATCH_SIZE, timeout=1):
+        """
+        Drain up to max_jobs samples from the queue,
+        with the reserves and the deletes each pipelined into a single round trip
 
-            if job is None:
-                # self.__log("Nothing on consumer throughput queue...")
-                return None
+        :param consumer_throughput_queue:
+        :param max_jobs:
+        :param timeout: seconds to wait for the first sample
+        :return: list of decoded samples (empty if nothing on the queue)
+        """
+        data = []
 
-            data = json.loads(job.body)
+        try:
+            # e.g. an in-memory queue implements its own batch operations
+            batch_queue = hasattr(consumer_throughput_queue, "reserve_batch")
+            if batch_queue:
+                jobs = consumer_throughput_queue.reserve_batch(max_jobs, timeout)
+            else:
+                jobs = reserve_batch(consumer_throughput_queue, max_jobs, timeout)
+
+            for job in jobs:
+                try:
+                    # one or more samples per job
+                    data.extend(decode_report(job.body))
+                except ValueError:
+                    self.__log.warning(f"Warning: unable to decode job {job.id}, discarding.")
 
             # Finally delete from queue
-            try:
-                consumer_throughput_queue.delete(job)
-            except OSError as e:
-                self.__log.warning(f"Warning: unable to delete job {job}, {e}", e)
-
-        except greenstalk.TimedOutError:
-            # mute for output sake
-            # self.__log("Warning: nothing in consumer throughput queue.")
-            pass
+            if batch_queue:
+                failed = consumer_throughput_queue.delete_batch(jobs)
+            else:
+                failed = delete_batch(consumer_throughput_queue, jobs)
+            if len(failed) > 0:
+                self.__log.warning(f"Warning: unable to delete jobs {failed}")
+
         except greenstalk.UnknownResponseError:
             self.__log.warning("Warning: unknown response from beanstalkd server.")
         except greenstalk.DeadlineSoonError:
@@ -92,29 +157,53 @@ class BaseProcess(StoppableProcess, ReadWriteJSONLMixin):
 
         return data
 
-    def bash_command_with_output(self, additional_args, working_directory):
-        args = ['/bin/bash', '-e'] + additional_args
-        # self.__log.info(args)
-        p = subprocess.Popen(args, stdout=subprocess.PIPE, cwd=working_directory)
-        p.wait()
-        out = p.communicate()[0].decode("UTF-8")
-        return out
+    def bash_command_with_output(self, additional_args, working_directory, timeout_s=None):
+        # self.__log.info(additional_args)
+        result = shell_pool.run(additional_args, working_directory, timeout_s)
+        if result.exit_code != 0:
+            self.__log.warning(f"Warning: {additional_args} exited with code {result.exit_code}: {result.stderr}")
+        return result.stdout
+
+    def attach_scaler(self, scaler):
+        """
+        Delegate producer scaling to another object, e.g. when the process is driven in-process
+        by the asyncio monitor rather than run as a separate process.
+
+        The scaler must implement scale_producers(producer_count) and get_producer_count()
+
+        :param scaler:
+        :return:
+        """
+        self.scaler = scaler
 
     def k8s_scale_producers(self, producer_count):
+        if self.actuator is not None:
+            self.actuator.request(producer_count)
+            return
+
+        self.apply_producer_count(producer_count)
+
+    def apply_producer_count(self, producer_count):
+        if self.scaler is not None:
+            self.scaler.scale_producers(producer_count)
+            return
+
         filename = "./scale-producers.sh"
         args = [filename, str(producer_count)]
         self.bash_command_with_output(args, SCRIPT_DIR)
 
-    def get_producer_count(self):
-        filename = "./get-producers-count.sh"
-        args = [filename]
+        # the cached producer count is now out of date
+        pod_counts.invalidate(ROLE_PRODUCER)
 
-        producer_count = 0
-        try:
-            producer_count = int(self.bash_command_with_output(args, SCRIPT_DIR))
-        except ValueError:
-            pass
+    def get_producer_count(self):
+        if self.actuator is not None:
+            # as last read by the actuator
+            return self.actuator.get_producer_count()
 
-        return producer_count
+        return self.read_producer_count()
 
+    def read_producer_count(self):
+        if self.scaler is not None:
+            return self.scaler.get_producer_count()
 
+        return pod_counts.snapshot().producers
@@ -0,0 +1,106 @@
+"""
+Pipelined batch operations for the beanstalkd client.
+
+greenstalk sends one command and waits for its response, so draining the queue
+costs two round trips per job (reserve + delete). beanstalkd processes the
+commands on a connection in order, so we can write a whole batch of commands
+in a single send and then read the responses back in the same order.
+
+If a batch fails part way through (e.g. an unknown response), the remaining
+responses cannot be read back, so the connection is closed rather than left out
+of step: beanstalkd releases the jobs reserved by a closed connection, so none
+are left reserved. The failure is raised as a ConnectionError.
+
+Note - this uses the connection internals of greenstalk (see Pipfile.lock, 1.0.1)
+"""
+import greenstalk
+
+
+def close_out_of_step(client, operation, e):
+    """
+    Close a connection which is out of step after a failed batch
+
+    :param client: greenstalk.Client
+    :param operation: e.g. "reserve"
+    :param e: the exception which failed the batch
+    :return: ConnectionError to raise
+    """
+    try:
+        client.close()
+    except OSError:
+        pass
+
+    return ConnectionError(f"beanstalkd {operation} batch failed, connection closed: {e!r}")
+
+
+def reserve_batch(client, max_jobs, timeout=1):
+    """
+    Reserve up to max_jobs jobs in a single round trip.
+
+    The first reserve waits up to timeout seconds (as per reserve(timeout)),
+    the remainder do not wait at all, so the call returns as soon as the ready jobs are drained.
+
+    :param client: greenstalk.Client
+    :param max_jobs: maximum number of jobs to reserve
+    :param timeout: seconds to wait for the first job
+    :return: list of greenstalk.Job (empty if nothing was ready)
+    """
+    commands = [b'reserve-with-timeout %d\r\n' % timeout]
+    commands.extend([b'reserve-with-timeout 0\r\n'] * (max_jobs - 1))
+    client._sock.sendall(b''.join(commands))
+
+    jobs = []
+    deadline_soon = None
+
+    # note - every response must be read, otherwise the connection is out of step
+    try:
+        for _ in range(max_jobs):
+            line = client._reader.readline()
+            try:
+                job_id, size = (int(n) for n in greenstalk._parse_response(line, b'RESERVED'))
+            except greenstalk.TimedOutError:
+                continue
+            except greenstalk.DeadlineSoonError as e:
+                deadline_soon = e
+                continue
+
+            chunk = client._read_chunk(size)
+            body = chunk if client.encoding is None else chunk.decode(client.encoding)
+            jobs.append(greenstalk.Job(job_id, body))
+    except Exception as e:
+        # the jobs reserved so far are released by closing the connection
+        raise close_out_of_step(client, "reserve", e) from e
+
+    if deadline_soon is not None and len(jobs) == 0:
+        raise deadline_soon
+
+    return jobs
+
+
+def delete_batch(client, jobs):
+    """
+    Delete the jobs in a single round trip.
+
+    :param client: greenstalk.Client
+    :param jobs: list of greenstalk.Job (or job ids)
+    :return: list of job ids which could not be deleted
+    """
+    if len(jobs) == 0:
+        return []
+
+    job_ids = [greenstalk._to_id(job) for job in jobs]
+    client._sock.sendall(b''.join([b'delete %d\r\n' % job_id for job_id in job_ids]))
+
+    failed = []
+    try:
+        for job_id in job_ids:
+            line = client._reader.readline()
+            try:
+                greenstalk._parse_response(line, b'DELETED')
+            except greenstalk.NotFoundError:
+                failed.append(job_id)
+    except Exception as e:
+        # note - the jobs not yet deleted are released, so may be reserved again
+        raise close_out_of_step(client, "delete", e) from e
+
+    return failed
@@ -0,0 +1,216 @@
+"""
+Stop criteria for the stress/soak tests, decided from the throughput sample stream itself:
+when a consumer's throughput has warmed up after a producer change, and whether it then holds
+above the tolerance or drops below it (saturation onset), with the confidence in each decision.
+
+Selected per configuration, e.g. {"stop_detector": STOP_DETECTOR_CUSUM}
+"""
+import math
+from collections import namedtuple
+
+from fs.rolling_window import RollingWindow
+
+# discard a fixed number of samples after each producer change, stop after 3 consecutive windows below tolerance
+STOP_DETECTOR_WINDOW = "window"
+
+# trend test for the warm-up, one-sided CUSUM for the saturation onset
+STOP_DETECTOR_CUSUM = "cusum"
+
+STATE_WARMING_UP = "warming_up"
+STATE_UNDECIDED = "undecided"
+STATE_OK = "ok"
+STATE_SATURATED = "saturated"
+
+# samples in the trailing window tested for a trend during the warm-up
+DEFAULT_WARMUP_WINDOW = 4
+
+# the warm-up is assumed over after this many samples, trend or not
+DEFAULT_MAX_WARMUP_SAMPLES = 12
+
+# |t| of the trailing window slope below which the throughput is taken to have stopped changing
+DEFAULT_TREND_T = 2.0
+
+# CUSUM reference value and decision interval, in standard deviations
+DEFAULT_CUSUM_K = 0.5
+DEFAULT_CUSUM_H = 4.0
+
+# confidence required to judge a producer count ok
+DEFAULT_CONFIDENCE = 0.95
+
+# samples after the warm-up before a producer count can be judged ok
+DEFAULT_MIN_STEADY_SAMPLES = 2
+
+# lower bound on the throughput standard deviation, relative to the tolerance (a few samples can agree closely)
+MIN_RELATIVE_STDDEV = 0.01
+
+# state: as above, confidence: in that state (None while warming up or undecided), changed: since the previous sample
+Detection = namedtuple("Detection", ["state", "confidence", "changed"])
+
+
+def normal_cdf(z):
+    return 0.5 * (1 + math.erf(z / math.sqrt(2)))
+
+
+def trend_t(values):
+    """
+    :return: t statistic of the least squares slope of the values (in order), 0 if there is no residual variance
+    """
+    n = len(values)
+    x_mean = (n - 1) / 2
+    y_mean = sum(values) / n
+
+    sxx = sum((x - x_mean) ** 2 for x in range(n))
+    sxy = sum((x - x_mean) * (y - y_mean) for x, y in enumerate(values))
+    slope = sxy / sxx
+
+    residuals = sum((y - y_mean - slope * (x - x_mean)) ** 2 for x, y in enumerate(values))
+    if residuals == 0:
+        return 0.0
+
+    return slope / math.sqrt(residuals / (n - 2) / sxx)
+
+
+class ThroughputStream:
+    """
+    Detector state of a single consumer at a single producer count
+    """
+    __slots__ = ["window", "warmup_samples", "warmed_up", "count", "mean", "m2", "cusum", "onset_count", "onset_total",
+                 "state"]
+
+    def __init__(self, warmup_window):
+        self.window = RollingWindow(warmup_window)
+        self.warmup_samples = 0
+        self.warmed_up = False
+
+        # mean/variance of the samples since the warm-up (Welford)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+        # lower one-sided CUSUM, and the samples since it was last zero (i.e. since the onset of any drop)
+        self.cusum = 0.0
+        self.onset_count = 0
+        self.onset_total = 0.0
+
+        self.state = STATE_WARMING_UP
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def stddev(self):
+        if self.count >= 2:
+            return math.sqrt(self.m2 / (self.count - 1))
+
+        # the noise during the warm-up
+        return math.sqrt(self.window.variance())
+
+
+class ChangePointDetector:
+    """
+    Per consumer and producer count:
+    a) the warm-up is over once the trailing window of samples has no significant trend (or after max_warmup_samples)
+    b) then a lower one-sided CUSUM of the samples against the tolerance detects the saturation onset,
+       with the confidence that the mean since the onset is below the tolerance
+    c) otherwise, the producer count is ok once the mean since the warm-up is above the tolerance with confidence
+    """
+    def __init__(self, warmup_window=DEFAULT_WARMUP_WINDOW, max_warmup_samples=DEFAULT_MAX_WARMUP_SAMPLES,
+                 trend_t=DEFAULT_TREND_T, cusum_k=DEFAULT_CUSUM_K, cusum_h=DEFAULT_CUSUM_H,
+                 confidence=DEFAULT_CONFIDENCE, min_steady_samples=DEFAULT_MIN_STEADY_SAMPLES):
+        self.warmup_window = warmup_window
+        self.max_warmup_samples = max_warmup_samples
+        self.trend_t = trend_t
+        self.cusum_k = cusum_k
+        self.cusum_h = cusum_h
+        self.confidence = confidence
+        self.min_steady_samples = min_steady_samples
+
+        # (consumer_id, producer count) -> ThroughputStream
+        self.streams = {}
+
+    def reset(self):
+        """
+        Forget every stream, e.g. on a producer change
+        """
+        self.streams = {}
+
+    def get_stream(self, consumer_id, producer_count):
+        key = (consumer_id, producer_count)
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = self.streams[key] = ThroughputStream(self.warmup_window)
+
+        return stream
+
+    def add(self, consumer_id, producer_count, throughput, tolerance):
+        """
+        :param consumer_id:
+        :param producer_count:
+        :param throughput: of the sample
+        :param tolerance: throughput below which the producer count has failed
+        :return: Detection
+        """
+        stream = self.get_stream(consumer_id, producer_count)
+        previous_state = stream.state
+
+        state, confidence = self.detect(stream, throughput, tolerance)
+        stream.state = state
+
+        return Detection(state, confidence, state != previous_state)
+
+    def detect(self, stream, throughput, tolerance):
+        """
+        :return: (state, confidence)
+        """
+        if not stream.warmed_up:
+            stream.window.append(throughput)
+            stream.warmup_samples += 1
+            if stream.warmup_samples >= self.max_warmup_samples or \
+                    (stream.window.is_full() and abs(trend_t(stream.window.last())) < self.trend_t):
+                stream.warmed_up = True
+            return STATE_WARMING_UP, None
+
+        stream.add(throughput)
+        stddev = max(stream.stddev(), MIN_RELATIVE_STDDEV * tolerance)
+
+        # lower CUSUM: accumulates while the throughput is below the tolerance
+        stream.cusum = max(0.0, stream.cusum + (tolerance - throughput) / stddev - self.cusum_k)
+        if stream.cusum == 0:
+            stream.onset_count = 0
+            stream.onset_total = 0.0
+        else:
+            stream.onset_count += 1
+            stream.onset_total += throughput
+
+        if stream.cusum > self.cusum_h:
+            onset_mean = stream.onset_total / stream.onset_count
+            return STATE_SATURATED, normal_cdf((tolerance - onset_mean) / (stddev / math.sqrt(stream.onset_count)))
+
+        if stream.count >= self.min_steady_samples:
+            confidence = normal_cdf((stream.mean - tolerance) / (stddev / math.sqrt(stream.count)))
+            if confidence >= self.confidence:
+                return STATE_OK, confidence
+
+        return STATE_UNDECIDED, None
+
+    def count_ok(self, producer_count):
+        """
+        :return: number of consumers judged ok at the producer count
+        """
+        return sum(1 for (_, p), stream in self.streams.items() if p == producer_count and stream.state == STATE_OK)
+
+
+def get_stop_detector(configuration):
+    """
+    :param configuration: stop_detector (default window)
+    :return: ChangePointDetector, or None for the fixed window criteria
+    """
+    name = configuration.get("stop_detector", STOP_DETECTOR_WINDOW)
+    if name == STOP_DETECTOR_WINDOW:
+        return None
+    if name == STOP_DETECTOR_CUSUM:
+        return ChangePointDetector()
+
+    raise ValueError(f"Unknown stop detector {name}, expected one of {[STOP_DETECTOR_WINDOW, STOP_DETECTOR_CUSUM]}")
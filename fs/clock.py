@@ -0,0 +1,51 @@
+import threading
+import time
+
+
+class SystemClock:
+    """
+    Wall clock time, monotonic time and sleeping, as per the time module
+    """
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class ManualClock:
+    """
+    Virtual clock which only moves when told to, e.g. for replaying recorded samples or simulating a cluster
+    faster than real time. Sleeping advances the clock (immediately), so waits and deadlines cost nothing.
+    """
+    def __init__(self, start=0.0):
+        self.now = start
+        # e.g. setup steps sleeping in parallel threads
+        self.lock = threading.Lock()
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        if seconds > 0:
+            with self.lock:
+                self.now += seconds
+
+    def set(self, now):
+        """
+        Move the clock forward to now (never backwards)
+        """
+        with self.lock:
+            self.now = max(self.now, now)
+
+
+system_clock = SystemClock()
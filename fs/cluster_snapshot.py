@@ -0,0 +1,86 @@
+import time
+from typing import NamedTuple
+
+from fs.shell_pool import shell_pool
+from fs.utils import SCRIPT_DIR, KAFKA_NAMESPACE, PRODUCER_CONSUMER_NAMESPACE
+
+# a listing taking longer than this is abandoned (and the counts are all zero)
+SNAPSHOT_TIMEOUT_S = 30
+
+ROLE_ZOOKEEPER = "zookeeper"
+ROLE_BROKER = "broker"
+ROLE_CONSUMER = "consumer"
+ROLE_PRODUCER = "producer"
+
+# (namespace, pod name prefix) -> role
+POD_ROLES = {(KAFKA_NAMESPACE, "zookeeper"): ROLE_ZOOKEEPER,
+             (KAFKA_NAMESPACE, "kafka"): ROLE_BROKER,
+             (PRODUCER_CONSUMER_NAMESPACE, "consumer"): ROLE_CONSUMER,
+             (PRODUCER_CONSUMER_NAMESPACE, "producer"): ROLE_PRODUCER}
+
+# role -> (namespace, pod name prefix)
+ROLE_PODS = {role: namespace_prefix for namespace_prefix, role in POD_ROLES.items()}
+
+
+class ClusterSnapshot(NamedTuple):
+    """
+    Running pod counts by role, taken from a single pod listing
+    """
+    zookeepers: int = 0
+    brokers: int = 0
+    consumers: int = 0
+    producers: int = 0
+    taken_at: float = 0
+
+    def count(self, role):
+        if role == ROLE_ZOOKEEPER:
+            return self.zookeepers
+        elif role == ROLE_BROKER:
+            return self.brokers
+        elif role == ROLE_CONSUMER:
+            return self.consumers
+        elif role == ROLE_PRODUCER:
+            return self.producers
+
+        raise ValueError(f"Unknown role {role}")
+
+
+def parse_running_pods(output, taken_at=0):
+    """
+    Count the pods by role
+
+    :param output: output of get-running-pods.sh, one "<namespace> <name>" line per pod
+    :param taken_at:
+    :return: ClusterSnapshot
+    """
+    counts = {ROLE_ZOOKEEPER: 0, ROLE_BROKER: 0, ROLE_CONSUMER: 0, ROLE_PRODUCER: 0}
+
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) != 2:
+            continue
+
+        namespace, name = fields
+        for (role_namespace, prefix), role in POD_ROLES.items():
+            if namespace == role_namespace and name.startswith(prefix):
+                counts[role] += 1
+                break
+
+    return ClusterSnapshot(zookeepers=counts[ROLE_ZOOKEEPER], brokers=counts[ROLE_BROKER],
+                           consumers=counts[ROLE_CONSUMER], producers=counts[ROLE_PRODUCER], taken_at=taken_at)
+
+
+def fetch_cluster_snapshot():
+    """
+    List the running pods in all namespaces (one kubectl call)
+
+    :return: ClusterSnapshot (all zero if the pods could not be listed)
+    """
+    taken_at = time.time()
+
+    result = shell_pool.run(["./get-running-pods.sh"], SCRIPT_DIR, timeout_s=SNAPSHOT_TIMEOUT_S)
+
+    if result.timed_out:
+        return parse_running_pods("", taken_at)
+
+    return parse_running_pods(result.stdout, taken_at)
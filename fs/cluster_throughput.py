@@ -0,0 +1,169 @@
+import collections
+import time
+
+import numpy as np
+
+from fs.streaming_stats import StreamingStats
+
+# consumers report their throughput every 5s
+DEFAULT_INTERVAL_S = 5
+
+# how many intervals a bucket is kept open for reports which arrive late
+DEFAULT_MAX_LATENESS_INTERVALS = 2
+
+# how many consecutive intervals a consumer's last throughput is carried forward when it misses a report
+DEFAULT_MAX_CARRY_INTERVALS = 1
+
+# how many of the most recent closed intervals are kept (an hour), the rest are only in the streaming stats
+DEFAULT_MAX_RECENT_INTERVALS = 720
+
+
+class ClusterThroughputAggregator:
+    """
+    Cluster throughput: the throughput samples of all the consumers, bucketed into aligned time intervals and summed.
+
+    A bucket is closed once samples more than max_lateness_intervals newer have arrived (later samples for it
+    are dropped). A consumer with no sample in a closed bucket has its last throughput carried forward
+    for up to max_carry_intervals, after which it is assumed to have stopped.
+
+    Memory is constant over a soak: only the most recent max_recent_intervals closed intervals are kept,
+    the summaries come from streaming stats of every interval (overall and per producer count).
+    """
+    def __init__(self, interval_s=DEFAULT_INTERVAL_S, max_lateness_intervals=DEFAULT_MAX_LATENESS_INTERVALS,
+                 max_carry_intervals=DEFAULT_MAX_CARRY_INTERVALS, max_recent_intervals=DEFAULT_MAX_RECENT_INTERVALS,
+                 on_close=None):
+        """
+        :param on_close: called with each closed interval, on_close(time, throughput_gbps, producer_count,
+                         reporting, imputed)
+        """
+        self.interval_s = interval_s
+        self.max_lateness_intervals = max_lateness_intervals
+        self.max_carry_intervals = max_carry_intervals
+        self.on_close = on_close
+
+        # bucket -> {consumer_id: throughput (Gbps)}
+        self.open_buckets = {}
+        # bucket -> max producer count reported
+        self.open_producer_counts = {}
+        self.latest_bucket = None
+        self.closed_through = None
+
+        # consumer_id -> (last throughput, number of consecutive buckets missed)
+        self.last_throughput = {}
+
+        # the most recent closed buckets, in time order: (time, total, producer count, reporting, imputed)
+        self.recent = collections.deque(maxlen=max_recent_intervals)
+        self.closed_count = 0
+
+        # cluster throughput of the intervals which had reports, overall and by producer count
+        self.throughput_stats = StreamingStats()
+        self.producer_count_stats = {}
+
+        self.late_samples = 0
+
+    def add(self, consumer_id, throughput_gbps, producer_count=0, timestamp=None):
+        """
+        :param consumer_id:
+        :param throughput_gbps:
+        :param producer_count: reported with the sample
+        :param timestamp: of the sample (seconds), otherwise now
+        """
+        if timestamp is None:
+            timestamp = time.time()
+
+        bucket = int(timestamp // self.interval_s)
+        if self.closed_through is not None and bucket <= self.closed_through:
+            self.late_samples += 1
+            return
+
+        # the latest report wins, should a consumer report twice in an interval
+        self.open_buckets.setdefault(bucket, {})[consumer_id] = throughput_gbps
+        self.open_producer_counts[bucket] = max(self.open_producer_counts.get(bucket, 0), producer_count)
+
+        if self.latest_bucket is None or bucket > self.latest_bucket:
+            self.latest_bucket = bucket
+            self.close_through(bucket - self.max_lateness_intervals - 1)
+
+    def close_through(self, last_bucket):
+        """
+        Close every bucket up to and including last_bucket
+        """
+        if self.closed_through is None:
+            if len(self.open_buckets) == 0:
+                return
+            self.closed_through = min(self.open_buckets) - 1
+
+        for bucket in range(self.closed_through + 1, last_bucket + 1):
+            self.close(bucket)
+            self.closed_through = bucket
+
+    def close(self, bucket):
+        samples = self.open_buckets.pop(bucket, {})
+        producer_count = self.open_producer_counts.pop(bucket, 0)
+
+        total = 0.0
+        imputed = 0
+        for consumer_id in list(self.last_throughput):
+            if consumer_id in samples:
+                continue
+
+            last_throughput, missed = self.last_throughput[consumer_id]
+            if missed < self.max_carry_intervals:
+                total += last_throughput
+                imputed += 1
+                self.last_throughput[consumer_id] = (last_throughput, missed + 1)
+            else:
+                # stopped reporting
+                del self.last_throughput[consumer_id]
+
+        for consumer_id, throughput_gbps in samples.items():
+            total += throughput_gbps
+            self.last_throughput[consumer_id] = (throughput_gbps, 0)
+
+        interval = (bucket * self.interval_s, total, producer_count, len(samples), imputed)
+        self.recent.append(interval)
+        self.closed_count += 1
+
+        # skip any gaps in the reports
+        if len(samples) > 0:
+            self.throughput_stats.add(total)
+            self.producer_count_stats.setdefault(producer_count, StreamingStats()).add(total)
+
+        if self.on_close is not None:
+            self.on_close(*interval)
+
+    def flush(self):
+        """
+        Close all the open buckets (e.g. at the end of a test)
+        """
+        if self.latest_bucket is not None:
+            self.close_through(self.latest_bucket)
+
+    def series(self):
+        """
+        :return: dict of NumPy arrays (one entry per recent closed interval): time (s), throughput_gbps
+                 (cluster total), producer_count, reporting (# consumers), imputed (# consumers carried forward)
+        """
+        times, totals, producer_counts, reporting, imputed = zip(*self.recent) if self.recent else ([],) * 5
+        return {"time": np.array(times, dtype=np.float64),
+                "throughput_gbps": np.array(totals, dtype=np.float64),
+                "producer_count": np.array(producer_counts, dtype=np.int64),
+                "reporting": np.array(reporting, dtype=np.int64),
+                "imputed": np.array(imputed, dtype=np.int64)}
+
+    def summary(self, producer_count=None):
+        """
+        :param producer_count: only include the intervals at this producer count (otherwise all)
+        :return: dict of the mean/min/max/p50 cluster throughput (Gbps) over the intervals which had reports
+                 (p50 to within the streaming stats' relative accuracy)
+        """
+        if producer_count is None:
+            stats = self.throughput_stats
+        else:
+            stats = self.producer_count_stats.get(producer_count, StreamingStats())
+
+        if stats.count == 0:
+            return {"intervals": 0}
+
+        return {"intervals": stats.count, "mean": stats.mean, "min": stats.min, "max": stats.max,
+                "p50": stats.quantile(0.5)}
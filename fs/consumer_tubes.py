@@ -0,0 +1,115 @@
+"""
+Per configuration consumer throughput tubes.
+
+Each configuration's samples are published to (and watched on) a tube of its own, so switching configurations
+is a watch/ignore rather than a drain of the shared tube, and stale samples cannot leak into the next configuration.
+beanstalkd removes a tube once it is empty and no longer used or watched, so the jobs left in a retired tube
+are deleted in the background.
+"""
+import queue
+import threading
+
+import greenstalk
+
+from fs.beanstalk_batch import reserve_batch, delete_batch
+from fs.utils import CONSUMER_THROUGHPUT_TUBE, BEANSTALKD_HOST, BEANSTALKD_PORT, addlogger
+
+CONSUMER_THROUGHPUT_TUBE_PREFIX = CONSUMER_THROUGHPUT_TUBE + "_"
+
+# jobs deleted per round trip when collecting a tube
+COLLECT_BATCH_SIZE = 256
+
+
+def get_consumer_throughput_tube(configuration):
+    """
+    :return: the tube the configuration's consumer throughput samples are published to
+    """
+    return CONSUMER_THROUGHPUT_TUBE_PREFIX + configuration["configuration_uid"]
+
+
+def is_consumer_throughput_tube(tube):
+    """
+    :return: True for the shared tube and the per configuration tubes
+    """
+    return tube == CONSUMER_THROUGHPUT_TUBE or tube.startswith(CONSUMER_THROUGHPUT_TUBE_PREFIX)
+
+
+def connect_tube(tube):
+    """
+    :return: a new beanstalkd connection, watching only the tube
+    """
+    return greenstalk.Client(host=BEANSTALKD_HOST, port=BEANSTALKD_PORT, watch=tube)
+
+
+def drain_tube(client, batch_size=COLLECT_BATCH_SIZE):
+    """
+    Delete every ready job on the tubes the client is watching
+
+    :return: number of jobs deleted
+    """
+    # e.g. an in-memory queue implements its own batch operations
+    batch_queue = hasattr(client, "reserve_batch")
+
+    deleted = 0
+    while True:
+        if batch_queue:
+            jobs = client.reserve_batch(batch_size, 0)
+            failed = client.delete_batch(jobs)
+        else:
+            jobs = reserve_batch(client, batch_size, 0)
+            failed = delete_batch(client, jobs)
+
+        deleted += len(jobs) - len(failed)
+        if len(jobs) < batch_size:
+            return deleted
+
+
+@addlogger
+class TubeCollector:
+    """
+    Drains retired tubes on a background thread, each over a connection of its own
+    """
+    def __init__(self, connect=connect_tube):
+        """
+        :param connect: connect(tube), returning a client watching only the tube
+        """
+        self.connect = connect
+        self.pending = queue.Queue()
+        self.thread = None
+
+    def collect(self, tube):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="TubeCollector", daemon=True)
+            self.thread.start()
+
+        self.pending.put(tube)
+
+    def run(self):
+        while True:
+            tube = self.pending.get()
+            if tube is None:
+                return
+
+            try:
+                client = self.connect(tube)
+                try:
+                    deleted = drain_tube(client)
+                    # e.g. a shared memory queue, whose tubes outlive their readers and writers
+                    if hasattr(client, "unlink"):
+                        client.unlink(tube)
+                finally:
+                    client.close()
+                self.__log.info(f"Collected tube {tube}, deleted {deleted} jobs.")
+            except (greenstalk.Error, ConnectionError) as e:
+                self.__log.warning(f"Warning: unable to collect tube {tube}, {e}")
+
+    def join(self):
+        """
+        Wait for the tubes collected so far, e.g. at the end of a run
+        """
+        if self.thread is None:
+            return
+
+        self.pending.put(None)
+        self.thread.join()
+        self.thread = None
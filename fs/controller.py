@@ -1,19 +1,36 @@
+import glob
 import logging
 import subprocess
-import time
 import os
 from datetime import datetime
 from math import ceil
 
-import greenstalk
 import requests
 import json
 import uuid
+from fs.async_monitor import AsyncThroughputMonitor
+from fs.base_process import get_metrics_path, get_details_path, get_samples_prefix
+from fs.gcloud_operations import GcloudOperationTracker
+from fs.change_point import STOP_DETECTOR_WINDOW
+from fs.clock import system_clock
+from fs.consumer_tubes import TubeCollector, connect_tube, drain_tube, get_consumer_throughput_tube, \
+    is_consumer_throughput_tube
+from fs.cluster_snapshot import ROLE_ZOOKEEPER, ROLE_BROKER, ROLE_CONSUMER, ROLE_PRODUCER
+from fs.pod_count_cache import pod_counts, DEFAULT_POD_COUNT_TTL_S
+from fs.ramp_strategy import RAMP_LINEAR
+from fs.readiness import ReadinessWaiter
+from fs.run_journal import RunJournal, ResumeError, EVENT_PHASE, EVENT_CONFIGURATIONS, EVENT_CONFIGURATION_COMPLETED, \
+    EVENT_RUN_COMPLETED
+from fs.scheduler import TransitionCostModel, schedule
+from fs.setup_pipeline import SetupPipeline, SetupStep
+from fs.shell_pool import shell_pool
 from fs.stress_test_process import StressTestProcess
-from fs.soak_test_process import SoakTestProcess
+from fs.transitions import classify_transition, changed_keys, NODE_POOL_KEYS, TRANSITION_NAMES, \
+    RESCALE_CONSUMERS, REDEPLOY_KAFKA, REBUILD_NODE_POOLS
+from fs.soak_test_process import SoakTestProcess, SOAK_FIXED, DEFAULT_SOAK_CI_TARGET, DEFAULT_SOAK_MAX_S
 from fs.utils import SCRIPT_DIR, PRODUCER_CONSUMER_NAMESPACE, KAFKA_NAMESPACE, KAFKA_DEPLOY_DIR, BURROW_DIR, \
     PRODUCERS_CONSUMERS_DEPLOY_DIR, CLUSTER_NAME, CLUSTER_ZONE, SERVICE_ACCOUNT_EMAIL, \
-    ENDPOINT_URL, addlogger, MONITORING_DIR, LOCAL_PROVISIONER_DEPLOY_DIR
+    ENDPOINT_URL, addlogger, MONITORING_DIR, LOCAL_PROVISIONER_DEPLOY_DIR, CONSUMER_THROUGHPUT_TUBE
 
 stop_threads = False
 
@@ -23,17 +40,66 @@ DEFAULT_MESSAGE_SIZE_KB = 750
 # see fs-terraform/gcp/consumer-node-pool.tf
 CONSUMER_NODE_POOL_MAX = 18
 
+# gcloud parameters which are flags, i.e. key only
+GCLOUD_FLAGS = ["quiet", "async"]
+
+KAFKA_NODE_POOL = "kafka-node-pool"
+ZK_NODE_POOL = "zk-node-pool"
+
+# how the stress/soak tests are run: as a separate process, or as asyncio tasks within the controller
+MONITOR_PROCESS = "process"
+MONITOR_ASYNC = "async"
+
+# how long to wait for the Burrow external IP to be assigned, and how often to check
+BURROW_IP_DEADLINE_S = 300
+BURROW_IP_POLL_INTERVAL_S = 5
+
+# path is of the form ~/../log/run_AD56F8
+LOG_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "log")
+
+
+def get_journal_path(run_uid, log_directory=LOG_DIRECTORY):
+    return os.path.join(log_directory, run_uid, f"{run_uid}_journal.jsonl")
+
+
+def check_resumable(run_uid, log_directory=LOG_DIRECTORY):
+    """
+    Check that an interrupted run can be resumed, without creating anything
+
+    :param run_uid: e.g. run_AD56F8
+    :param log_directory:
+    :return:
+    """
+    journal_path = get_journal_path(run_uid, log_directory)
+    if not os.path.exists(journal_path):
+        raise ResumeError(f"No journal found for {run_uid} ({journal_path}), unable to resume.")
+
 
 @addlogger
 class Controller:
 
-    def __init__(self, queue):
+    def __init__(self, queue, run_uid=None, clock=system_clock):
+        """
+        :param queue: consumer throughput queue
+        :param run_uid: of an interrupted run to resume (otherwise a new run is started)
+        :param clock: e.g. a ManualClock, to run in virtual time (shared with the stress/soak test processes)
+        """
+        self.clock = clock
         self.configurations = []
         self.now = datetime.now()
 
         self.consumer_throughput_queue = queue
+        # the tube being watched (the queue is expected to start out watching the shared tube)
+        self.consumer_throughput_tube = CONSUMER_THROUGHPUT_TUBE
+        # drains the tubes of previous configurations
+        self.tube_collector = TubeCollector(self.connect_tube)
         self.stress_test_process = None
         self.soak_test_process = None
+        self.readiness_waiter = ReadinessWaiter(clock=clock)
+
+        # what has to be rebuilt before the next configuration can be set up (nothing is standing at the start)
+        self.transition = REBUILD_NODE_POOLS
+        self.node_pools_provisioned = False
 
         # template configuration
         self.configuration_template = {"number_of_brokers": 3, "start_producer_count": 1, "max_producer_count": 26,
@@ -42,17 +108,29 @@ class Controller:
                                        "broker_machine_type": "n1-standard-8", "disk_size": 100, "disk_type": "pd-ssd",
                                        "ignore_throughput_threshold": False, "teardown_broker_nodes": True,
                                        "replication_factor": 1, "num_zk": 1, "batch_size_bytes": DEFAULT_BATCH_SIZE_BYTES,
-                                       "message_size_kb": DEFAULT_MESSAGE_SIZE_KB}
+                                       "message_size_kb": DEFAULT_MESSAGE_SIZE_KB, "monitor": MONITOR_PROCESS,
+                                       "pod_count_ttl_s": DEFAULT_POD_COUNT_TTL_S, "ramp_strategy": RAMP_LINEAR,
+                                       "stop_detector": STOP_DETECTOR_WINDOW, "per_configuration_tubes": False,
+                                       "soak_mode": SOAK_FIXED, "soak_ci_target": DEFAULT_SOAK_CI_TARGET,
+                                       "soak_max_s": DEFAULT_SOAK_MAX_S}
+
+        # reorder the configurations to minimise the time spent rebuilding the cluster between them
+        self.schedule_configurations = True
+
+        self.resume = run_uid is not None
+        self.provisioned_configuration = None
+        self.run_uid = run_uid if self.resume else "run_" + self.get_uid()
+
+        self.log_directory = LOG_DIRECTORY
+        # note - checked before the log directory of the run is created
+        if self.resume:
+            check_resumable(self.run_uid, self.log_directory)
 
-        self.run_uid = "run_" + self.get_uid()
         self.configure_logging()
+        self.journal = RunJournal(get_journal_path(self.run_uid, self.log_directory))
 
     def configure_logging(self):
-        # log directory
-        base_directory = os.path.dirname(os.path.abspath(__file__))
-        
-        # path is of the form ~/../log/run_AD56F8
-        base_path = os.path.join(base_directory, "..", "log", self.run_uid)
+        base_path = os.path.join(self.log_directory, self.run_uid)
 
         if not os.path.exists(base_path):
             os.makedirs(base_path)
@@ -85,42 +163,207 @@ class Controller:
         pass
 
     def run(self):
-        self.load_configurations()
+        if self.resume:
+            completed = self.load_journal()
+        else:
+            self.load_configurations()
+
+            self.__log.info(f"Loaded {len(self.configurations)} configurations.")
+
+            if self.schedule_configurations:
+                self.configurations = self.schedule(self.configurations)
 
-        self.__log.info(f"Loaded {len(self.configurations)} configurations.")
+            self.journal.record(EVENT_CONFIGURATIONS, configurations=self.configurations)
+            completed = set()
 
-        sequence_number = 1
-        for configuration in self.configurations:
-            now_s = time.time()
+        # sequence numbers of the configurations still to run
+        pending = [n for n in range(1, len(self.configurations) + 1) if n not in completed]
+
+        if self.resume:
+            self.reconcile_cluster(self.configurations[pending[0] - 1] if len(pending) > 0 else None)
+
+        self.collect_stale_tubes()
+
+        for sequence_number in pending:
+            configuration = self.configurations[sequence_number - 1]
+            now_s = self.clock.time()
 
             self.__log.info(f"Configuration {sequence_number} of {len(self.configurations)}: {configuration}")
 
             # add the sequence number to the configuration
             configuration["sequence_number"] = sequence_number
 
-            self.provision_node_pools(configuration)
+            if self.resume:
+                # e.g. the stress test metrics of a configuration interrupted during its soak test
+                self.discard_partial_results(configuration)
+
+            # how stale a pod count may be (shared with the stress/soak test processes)
+            pod_counts.ttl_s = configuration["pod_count_ttl_s"]
+
+            self.__log.info(f"Transition: {TRANSITION_NAMES[self.transition]}")
+
+            # only provision if the node pools cannot be reused
+            transition = self.transition
+            if transition == REBUILD_NODE_POOLS:
+                phase_start_s = self.clock.monotonic()
+                provisioned = self.provision_node_pools(configuration)
+                self.record_phase(configuration, "provision", transition, phase_start_s, provisioned)
+            else:
+                provisioned = True
 
             # only run if everything is ok
-            if self.setup_configuration(configuration):
+            setup_ok = False
+            if provisioned:
+                phase_start_s = self.clock.monotonic()
+                setup_ok = self.setup_configuration(configuration, transition)
+                self.record_phase(configuration, "setup", transition, phase_start_s, setup_ok)
+
+            if setup_ok:
                 # run the configuration
                 self.run_configuration(configuration)
 
             self.upload_metrics(configuration)
 
-            # now teardown and unprovision
-            self.teardown_configuration(configuration)
+            # now teardown, keeping whatever the next configuration can reuse
+            remaining = [n for n in pending if n > sequence_number]
+            if len(remaining) > 0:
+                next_configuration = self.configurations[remaining[0] - 1]
+            else:
+                next_configuration = None
+            phase_start_s = self.clock.monotonic()
+            self.teardown_configuration(configuration, next_configuration, setup_ok)
+            self.record_phase(configuration, "teardown", self.transition, phase_start_s)
+
+            self.journal.record(EVENT_CONFIGURATION_COMPLETED, sequence_number=sequence_number,
+                                configuration_uid=configuration.get("configuration_uid"), ok=setup_ok)
 
             # reset the stop threads flag
             global stop_threads
             stop_threads = False
 
-            then_s = time.time()
+            then_s = self.clock.time()
             elapsed_s = then_s - now_s
             self.__log.info(f"Last configuration took {elapsed_s}s to complete.")
-            estimated_time_until_completion_hours = elapsed_s * (len(self.configurations) - sequence_number) / (60*60)
+            estimated_time_until_completion_hours = elapsed_s * len(remaining) / (60*60)
             self.__log.info(f"Estimated time until completion: {estimated_time_until_completion_hours} hours.")
 
-            sequence_number += 1
+        self.journal.record(EVENT_RUN_COMPLETED)
+
+        self.__log.info("Waiting for the consumer throughput tubes to be collected...")
+        self.tube_collector.join()
+
+        self.__log.info(f"Script latencies (s): {shell_pool.summary()}")
+
+    def discard_partial_results(self, configuration):
+        """
+        Remove the metrics, details and sample log written by an interrupted attempt at the configuration,
+        so that running it again does not append to them
+
+        :param configuration:
+        :return:
+        """
+        base_path = os.path.join(self.log_directory, self.run_uid)
+        samples_prefix = get_samples_prefix(base_path, configuration)
+        paths = [get_metrics_path(base_path, configuration), get_details_path(base_path, configuration)] + \
+            glob.glob(glob.escape(samples_prefix) + ".*")
+
+        for path in paths:
+            if os.path.exists(path):
+                self.__log.info(f"Removing {path} of the interrupted attempt.")
+                os.remove(path)
+
+    def load_journal(self):
+        """
+        Restore the configurations of the run being resumed (in their original order, with their original uids)
+
+        :return: set of the sequence numbers of the configurations already completed
+        """
+        records = RunJournal.read(self.journal.path)
+
+        configurations = [r["configurations"] for r in records if r["event"] == EVENT_CONFIGURATIONS]
+        if len(configurations) == 0:
+            raise ResumeError(f"No configurations found in journal {self.journal.path}, unable to resume.")
+        self.configurations = configurations[-1]
+
+        completed = set([r["sequence_number"] for r in records if r["event"] == EVENT_CONFIGURATION_COMPLETED])
+        self.__log.info(f"Resuming {self.run_uid}: {len(completed)} of {len(self.configurations)} "
+                        f"configurations already completed.")
+
+        # the configuration the standing node pools (if any) were provisioned for
+        provisioned = [r["configuration_uid"] for r in records
+                       if r["event"] == EVENT_PHASE and r["phase"] == "provision" and r.get("ok", True)]
+        self.provisioned_configuration = None
+        if len(provisioned) > 0:
+            self.provisioned_configuration = next((c for c in self.configurations
+                                                   if c.get("configuration_uid") == provisioned[-1]), None)
+
+        return completed
+
+    def get_node_pools(self):
+        """
+        :return: names of the node pools in the cluster
+        """
+        output = self.run_gcloud_command("container node-pools list",
+                                         {"cluster": CLUSTER_NAME, "format": "'value(name)'"})
+        return output.decode("UTF-8").split()
+
+    def reconcile_cluster(self, next_configuration):
+        """
+        Bring the cluster left behind by an interrupted run to a known state:
+        no deployments, and either no node pools or node pools which the next configuration can reuse
+
+        :param next_configuration: the first configuration still to run (None if there are none)
+        """
+        self.__log.info("Reconciling cluster state...")
+
+        self.configure_gcloud(CLUSTER_NAME, CLUSTER_ZONE)
+
+        # Remove producers & consumers, kafka brokers & ZK
+        self.k8s_delete_namespace(PRODUCER_CONSUMER_NAMESPACE)
+        self.k8s_delete_namespace(KAFKA_NAMESPACE)
+
+        self.flush_consumer_throughput_queue()
+
+        node_pools = [node_pool for node_pool in self.get_node_pools() if node_pool in (KAFKA_NODE_POOL, ZK_NODE_POOL)]
+        if len(node_pools) == 2 and self.provisioned_configuration is not None and \
+                classify_transition(self.provisioned_configuration, next_configuration) < REBUILD_NODE_POOLS:
+            self.__log.info(f"Reusing node pools {node_pools}.")
+            self.node_pools_provisioned = True
+            self.transition = REDEPLOY_KAFKA
+        else:
+            if len(node_pools) > 0:
+                self.__log.info(f"Removing node pools {node_pools}.")
+                self.delete_node_pools(node_pools)
+                self.undeploy_local_ssd_provisioner()
+            self.node_pools_provisioned = False
+            self.transition = REBUILD_NODE_POOLS
+
+    def schedule(self, configurations):
+        """
+        Reorder the configurations to minimise the total transition cost (learned from previous runs)
+
+        :param configurations:
+        :return: list of configurations
+        """
+        cost_model = TransitionCostModel.from_journals(self.log_directory)
+        scheduled = schedule(configurations)
+
+        naive_cost_s = cost_model.total_cost(configurations)
+        scheduled_cost_s = cost_model.total_cost(scheduled)
+        self.__log.info(f"Scheduled {len(scheduled)} configurations, predicted transition time "
+                        f"{scheduled_cost_s / 60:.0f} minutes (vs. {naive_cost_s / 60:.0f} minutes in the loaded order), "
+                        f"saving {(naive_cost_s - scheduled_cost_s) / 60:.0f} minutes.")
+
+        return scheduled
+
+    def record_phase(self, configuration, phase, transition, start_s, ok=True):
+        """
+        Journal the duration of a phase, from which the transition costs are learned
+
+        :param transition: the transition the phase was part of (teardown: the transition to the next configuration)
+        """
+        self.journal.record(EVENT_PHASE, configuration_uid=configuration.get("configuration_uid"), phase=phase,
+                            transition=transition, duration_s=self.clock.monotonic() - start_s, ok=ok)
 
     def k8s_delete_namespace(self, namespace):
         self.__log.info(f"Deleting namespace: {namespace}")
@@ -129,27 +372,59 @@ class Controller:
         args = [filename, namespace]
         self.bash_command_with_output(args, SCRIPT_DIR)
 
+        pod_counts.invalidate()
+
+    def connect_tube(self, tube):
+        """
+        :return: a new connection to the consumer throughput queue, watching only the tube
+        """
+        # e.g. a fs.queue_backend queue connects to the same backend
+        if hasattr(self.consumer_throughput_queue, "connection"):
+            return self.consumer_throughput_queue.connection(watch=tube)
+
+        return connect_tube(tube)
+
+    def switch_consumer_throughput_tube(self, tube):
+        """
+        Watch the tube instead of the current one, which is then collected in the background
+
+        :param tube:
+        :return:
+        """
+        previous_tube = self.consumer_throughput_tube
+        if tube == previous_tube:
+            return
+
+        self.__log.info(f"Switching consumer throughput tube from {previous_tube} to {tube}")
+        # note - a connection must always watch at least one tube
+        self.consumer_throughput_queue.watch(tube)
+        self.consumer_throughput_queue.ignore(previous_tube)
+        self.consumer_throughput_tube = tube
+
+        self.tube_collector.collect(previous_tube)
+
+    def collect_stale_tubes(self):
+        """
+        Collect the tubes left behind by previous (e.g. interrupted) runs
+        """
+        for tube in self.consumer_throughput_queue.tubes():
+            if is_consumer_throughput_tube(tube) and tube != self.consumer_throughput_tube:
+                self.__log.info(f"Collecting stale tube {tube}")
+                self.tube_collector.collect(tube)
+
     def flush_consumer_throughput_queue(self):
-        # no flush() method exists in greenstalk so need to do it "brute force"
+        """
+        Stop reading the current configuration's tube (it is collected in the background),
+        and discard anything on the shared tube
+        """
         self.__log.info("Flushing consumer throughput queue")
 
-        stats = self.consumer_throughput_queue.stats_tube("consumer_throughput")
-        self.__log.info(stats)
+        self.switch_consumer_throughput_tube(CONSUMER_THROUGHPUT_TUBE)
 
-        done = False
-        while not done:
-            job = None
-            try:
-                job = self.consumer_throughput_queue.reserve(timeout=0)
-            except greenstalk.TimedOutError:
-                pass
+        # normally empty, as the samples are published to the configuration tubes
+        deleted = drain_tube(self.consumer_throughput_queue)
 
-            if job is None:
-                done = True
-            else:
-                self.consumer_throughput_queue.delete(job)
-
-        self.__log.info("Consumer throughput queue flushed.")
+        self.__log.info(f"Consumer throughput queue flushed, deleted {deleted} jobs.")
 
     def stop_threads(self):
         self.__log.info("Stop threads called.")
@@ -160,26 +435,52 @@ class Controller:
         if self.soak_test_process:
             self.soak_test_process.stop()
 
-    def teardown_configuration(self, configuration):
+    def teardown_configuration(self, configuration, next_configuration=None, setup_ok=True):
+        """
+        Teardown only as much as the next configuration requires (everything if there is no next configuration)
+
+        :param configuration:
+        :param next_configuration:
+        :param setup_ok: False if the setup failed, in which case the deployments are not reused
+        :return:
+        """
         self.__log.info(f"4. Teardown configuration: {configuration}")
 
+        transition = classify_transition(configuration, next_configuration)
+        if not setup_ok:
+            transition = max(transition, REDEPLOY_KAFKA)
+        if not self.node_pools_provisioned:
+            transition = REBUILD_NODE_POOLS
+
         # ensure threads are stopped
         self.stop_threads()
 
-        # Remove producers & consumers
-        self.k8s_delete_namespace(PRODUCER_CONSUMER_NAMESPACE)
+        if transition == RESCALE_CONSUMERS:
+            # keep kafka & the consumers, the next configuration only rescales them
+            self.k8s_scale_producers(0)
+        else:
+            # Remove producers & consumers
+            self.k8s_delete_namespace(PRODUCER_CONSUMER_NAMESPACE)
 
-        # Remove kafka brokers & ZK
-        self.k8s_delete_namespace(KAFKA_NAMESPACE)
+            # Remove kafka brokers & ZK
+            self.k8s_delete_namespace(KAFKA_NAMESPACE)
 
         # flush the consumer throughput queue
         self.flush_consumer_throughput_queue()
 
         # finally take down the kafka node pool
-        if configuration["teardown_broker_nodes"]:
-          self.unprovision_node_pools()
-        else:
-          self.__log.info("Broker nodes left standing.")
+        if transition == REBUILD_NODE_POOLS and self.node_pools_provisioned:
+            if configuration["teardown_broker_nodes"]:
+                self.unprovision_node_pools()
+            else:
+                self.__log.info("Broker nodes left standing.")
+                if next_configuration is not None:
+                    changed = changed_keys(configuration, next_configuration, NODE_POOL_KEYS)
+                    if len(changed) > 0:
+                        self.__log.warning(f"Warning: reusing node pools although {changed} changed.")
+                transition = REDEPLOY_KAFKA
+
+        self.transition = transition
 
     def k8s_deploy_zk(self, num_zk):
         """
@@ -192,6 +493,8 @@ class Controller:
         args = [filename, str(num_zk)]
         self.bash_command_with_wait(args, KAFKA_DEPLOY_DIR)
 
+        pod_counts.invalidate(ROLE_ZOOKEEPER)
+
     def k8s_deploy_kafka(self, num_partitions, replication_factor, batch_size_bytes):
         """
         # run a script to deploy kafka
@@ -205,6 +508,8 @@ class Controller:
         args = [filename, str(num_partitions), str(replication_factor), str(batch_size_bytes)]
         self.bash_command_with_wait(args, KAFKA_DEPLOY_DIR)
 
+        pod_counts.invalidate(ROLE_BROKER)
+
     def get_burrow_ip(self):
         filename = "./get-burrow-external-ip.sh"
         args = [filename]
@@ -231,12 +536,18 @@ class Controller:
 
         # wait for burrow external IP to be assigned
         self.__log.info("Waiting for Burrow external IP...")
+        deadline = self.clock.monotonic() + BURROW_IP_DEADLINE_S
         burrow_ip = self.get_burrow_ip()
         while burrow_ip is None or burrow_ip == "":
-            time.sleep(5)
+            if self.clock.monotonic() >= deadline:
+                self.__log.error("Time-out waiting for Burrow external IP.")
+                return False
+
+            self.clock.sleep(BURROW_IP_POLL_INTERVAL_S)
             burrow_ip = self.get_burrow_ip()
 
         self.__log.info(f"Burrow external IP: {burrow_ip}")
+        return True
 
     # run a script to deploy producers/consumers
     def k8s_deploy_producers_consumers(self):
@@ -245,6 +556,9 @@ class Controller:
         args = [filename]
         self.bash_command_with_wait(args, PRODUCERS_CONSUMERS_DEPLOY_DIR)
 
+        pod_counts.invalidate(ROLE_PRODUCER)
+        pod_counts.invalidate(ROLE_CONSUMER)
+
     def k8s_scale_brokers(self, broker_count):
         self.__log.info(f"Scaling brokers, broker_count={broker_count}")
         # run a script to start brokers
@@ -252,55 +566,50 @@ class Controller:
         args = [filename, str(broker_count)]
         self.bash_command_with_wait(args, SCRIPT_DIR)
 
+        pod_counts.invalidate(ROLE_BROKER)
+
     def k8s_configure_producers(self, start_producer_count, message_size):
         self.__log.info(f"Configure producers, start_producer_count={start_producer_count}, message_size={message_size}")
         filename = "./configure-producers.sh"
         args = [filename, str(start_producer_count), str(message_size)]
         self.bash_command_with_wait(args, SCRIPT_DIR)
 
+        pod_counts.invalidate(ROLE_PRODUCER)
+
+    def k8s_scale_producers(self, producer_count):
+        self.__log.info(f"Scaling producers, producer_count={producer_count}")
+        filename = "./scale-producers.sh"
+        args = [filename, str(producer_count)]
+        self.bash_command_with_wait(args, SCRIPT_DIR)
+
+        pod_counts.invalidate(ROLE_PRODUCER)
+
     def k8s_scale_consumers(self, num_consumers):
         self.__log.info(f"Configure consumers, num_consumers={num_consumers}")
         filename = "./scale-consumers.sh"
         args = [filename, str(num_consumers)]
         self.bash_command_with_wait(args, SCRIPT_DIR)
 
-    def get_zookeepers_count(self):
-        filename = "./get-zookeepers-count.sh"
-        args = [filename]
+        pod_counts.invalidate(ROLE_CONSUMER)
 
-        zk_count = 0
-        try:
-            zk_count = int(self.bash_command_with_output(args, SCRIPT_DIR))
-        except ValueError:
-            pass
+    def get_cluster_snapshot(self):
+        """
+        Running pod counts for every role, from a single pod listing (cached)
+        :return: ClusterSnapshot
+        """
+        return pod_counts.snapshot()
 
-        # self.__log.info(f"zk={zk_count}")
-        return zk_count
+    def get_zookeepers_count(self):
+        return self.get_cluster_snapshot().zookeepers
 
     def get_consumers_count(self):
-        filename = "./get-consumers-count.sh"
-        args = [filename]
-
-        consumers_count = 0
-        try:
-            consumers_count = int(self.bash_command_with_output(args, SCRIPT_DIR))
-        except ValueError:
-            pass
-
-        return consumers_count
+        return self.get_cluster_snapshot().consumers
 
     def get_broker_count(self):
-        filename = "./get-brokers-count.sh"
-        args = [filename]
-
-        broker_count = 0
-        try:
-            broker_count = int(self.bash_command_with_output(args, SCRIPT_DIR))
-        except ValueError:
-            pass
+        return self.get_cluster_snapshot().brokers
 
-        # self.__log.info(f"broker_count={broker_count}")
-        return broker_count
+    def get_producer_count(self):
+        return self.get_cluster_snapshot().producers
 
     def check_brokers(self, expected_broker_count):
         return self.get_broker_count() == expected_broker_count
@@ -311,63 +620,46 @@ class Controller:
     def check_consumers(self, expected_consumers_count):
         return self.get_consumers_count() == expected_consumers_count
 
+    def wait_for_pods(self, role, target_count, deadline_s):
+        """
+        Wait for the running pod count of the role to reach the target
+
+        :param role:
+        :param target_count:
+        :param deadline_s: overall time budget for the stage
+        :return: True if the target was reached before the deadline
+        """
+        return self.readiness_waiter.wait_for(role, target_count, deadline_s)
+
     def check_zk_ok(self, configuration):
-        # allow 46s per ZK
-        WAIT_INTERVAL = 10
+        # allow 60s per ZK
         num_zk = configuration["num_zk"]
-        attempts = (60 * num_zk) / WAIT_INTERVAL
-
-        check_zks = self.check_zookeepers(num_zk)
-        i = 1
-        while not check_zks:
-            time.sleep(WAIT_INTERVAL)
-
-            check_zks = self.check_zookeepers(num_zk)
-            self.__log.info(f"Waiting for zks to start...{i}/{attempts}")
-            i += 1
-            if i > attempts:
-                self.__log.error("Time-out waiting for zks to start.")
-                return False
+
+        if not self.wait_for_pods(ROLE_ZOOKEEPER, num_zk, 60 * num_zk):
+            self.__log.error("Time-out waiting for zks to start.")
+            return False
 
         self.__log.info("ZKs started ok.")
         return True
 
     def check_consumers_ok(self, configuration):
-        # allow 10s per consumer
-        WAIT_INTERVAL = 10
+        # allow 45s per consumer
         num_consumers = configuration["num_consumers"]
-        attempts = (45 * num_consumers) / WAIT_INTERVAL
-
-        check_consumers = self.check_zookeepers(num_consumers)
-        i = 1
-        while not check_consumers:
-            time.sleep(WAIT_INTERVAL)
-            check_consumers = self.check_consumers(num_consumers)
-            self.__log.info(f"Waiting for consumers to start...{i}/{attempts}")
-            i += 1
-            if i > attempts:
-                self.__log.error("Time-out waiting for consumers to start.")
-                return False
+
+        if not self.wait_for_pods(ROLE_CONSUMER, num_consumers, 45 * num_consumers):
+            self.__log.error("Time-out waiting for consumers to start.")
+            return False
 
         self.__log.info("Consumers started ok.")
         return True
 
     def check_brokers_ok(self, configuration):
-        WAIT_INTERVAL = 10
+        # allow 120s per broker
         num_brokers = configuration["number_of_brokers"]
-        attempts = (120 * num_brokers) / WAIT_INTERVAL
-
-        check_brokers = self.check_brokers(num_brokers)
-        i = 1
-        while not check_brokers:
-            time.sleep(WAIT_INTERVAL)
-
-            check_brokers = self.check_brokers(num_brokers)
-            self.__log.info(f"Waiting for brokers to start...{i}/{attempts}")
-            i += 1
-            if i > attempts:
-                self.__log.error("Time-out waiting for brokers to start.")
-                return False
+
+        if not self.wait_for_pods(ROLE_BROKER, num_brokers, 120 * num_brokers):
+            self.__log.error("Time-out waiting for brokers to start.")
+            return False
 
         self.__log.info("Brokers started ok.")
         return True
@@ -382,18 +674,22 @@ class Controller:
     def post_broker_timeout_hook(self):
         pass
 
-    def setup_configuration(self, configuration):
-        self.__log.info(f"Setup configuration: {configuration}")
-
-        # configure gcloud (output is kubeconfig.yaml)
-        self.configure_gcloud(CLUSTER_NAME, CLUSTER_ZONE)
-
-        self.k8s_deploy_zk(configuration["num_zk"])
+    def get_setup_steps(self, configuration, transition=REBUILD_NODE_POOLS):
+        """
+        The setup steps and their dependencies.
+        Steps run as soon as their prerequisites are done, e.g. Burrow and the producer/consumer manifests
+        are deployed while the brokers are still starting.
 
-        all_ok = self.check_zk_ok(configuration)
-        if not all_ok:
-            self.__log.info("Aborting configuration - ZK not ok.")
-            return False
+        :param configuration:
+        :param transition: if RESCALE_CONSUMERS, kafka and the producers/consumers are still deployed
+        :return: list of SetupStep
+        """
+        if transition == RESCALE_CONSUMERS:
+            return [
+                SetupStep("scale_consumers", lambda: self.k8s_scale_consumers(str(configuration["num_consumers"]))),
+                SetupStep("consumers_ok", lambda: self.check_consumers_ok(configuration), depends_on=["scale_consumers"],
+                          on_failure=lambda: self.__log.info("Aborting configuration - consumers not ok.")),
+            ]
 
         # deploy kafka brokers
         # where num_partitions = max(#P, #C), where #P = TT / 75)
@@ -401,35 +697,52 @@ class Controller:
         num_partitions = configuration["number_of_partitions"]
         replication_factor = configuration["replication_factor"]
         batch_size_bytes = configuration["batch_size_bytes"]
-        self.k8s_deploy_kafka(num_partitions, replication_factor, batch_size_bytes)
-
-        # Configure # kafka brokers
-        self.k8s_scale_brokers(str(configuration["number_of_brokers"]))
 
-        all_ok = self.check_brokers_ok(configuration)
-        if not all_ok:
+        def brokers_not_ok():
             self.__log.info("Aborting configuration - brokers not ok.")
             self.post_broker_timeout_hook()
-            return False
-
-        # deploy burrow
-        self.k8s_deploy_burrow()
 
         # Note - monitoring is manually deployed to avoid change in external IP
+        return [
+            # configure gcloud (output is kubeconfig.yaml)
+            SetupStep("configure_gcloud", lambda: self.configure_gcloud(CLUSTER_NAME, CLUSTER_ZONE)),
+            SetupStep("deploy_zk", lambda: self.k8s_deploy_zk(configuration["num_zk"]),
+                      depends_on=["configure_gcloud"]),
+            SetupStep("zk_ok", lambda: self.check_zk_ok(configuration), depends_on=["deploy_zk"],
+                      on_failure=lambda: self.__log.info("Aborting configuration - ZK not ok.")),
+            SetupStep("deploy_kafka", lambda: self.k8s_deploy_kafka(num_partitions, replication_factor, batch_size_bytes),
+                      depends_on=["zk_ok"]),
+            # Configure # kafka brokers
+            SetupStep("scale_brokers", lambda: self.k8s_scale_brokers(str(configuration["number_of_brokers"])),
+                      depends_on=["deploy_kafka"]),
+            SetupStep("brokers_ok", lambda: self.check_brokers_ok(configuration), depends_on=["scale_brokers"],
+                      on_failure=brokers_not_ok),
+            SetupStep("deploy_burrow", self.k8s_deploy_burrow, depends_on=["deploy_kafka"]),
+            SetupStep("deploy_producers_consumers", self.k8s_deploy_producers_consumers,
+                      depends_on=["deploy_kafka"]),
+            # consumers join the consumer group once the brokers are up
+            SetupStep("scale_consumers", lambda: self.k8s_scale_consumers(str(configuration["num_consumers"])),
+                      depends_on=["deploy_producers_consumers", "brokers_ok"]),
+            SetupStep("consumers_ok", lambda: self.check_consumers_ok(configuration), depends_on=["scale_consumers"],
+                      on_failure=lambda: self.__log.info("Aborting configuration - consumers not ok.")),
+        ]
+
+    def setup_configuration(self, configuration, transition=REBUILD_NODE_POOLS):
+        self.__log.info(f"Setup configuration: {configuration}")
 
-        # deploy producers/consumers
-        self.k8s_deploy_producers_consumers()
-
-        # scale consumers
-        self.k8s_scale_consumers(str(configuration["num_consumers"]))
-
-        self.__log.info("Waiting for consumers to start...")
-        all_ok = self.check_consumers_ok(configuration)
-        if not all_ok:
-            self.__log.info("Aborting configuration - consumers not ok.")
+        pipeline = SetupPipeline(self.get_setup_steps(configuration, transition), clock=self.clock)
+        if not pipeline.run():
             return False
 
-        # post configuration to the consumer reporting endpoint
+        # samples for this configuration are published to a tube of its own, once the reporting endpoint supports it
+        # (otherwise to the shared tube, flushed between configurations)
+        if configuration.get("per_configuration_tubes", False):
+            configuration["consumer_throughput_tube"] = get_consumer_throughput_tube(configuration)
+        else:
+            configuration["consumer_throughput_tube"] = CONSUMER_THROUGHPUT_TUBE
+        self.switch_consumer_throughput_tube(configuration["consumer_throughput_tube"])
+
+        # post configuration to the consumer reporting endpoint (including the tube to publish to)
         self.post_json(ENDPOINT_URL, configuration)
 
         # perform a post-setup operation if required
@@ -437,26 +750,44 @@ class Controller:
 
         return True
 
-    def bash_command_with_output(self, additional_args, working_directory):
-        args = ['/bin/bash', '-e'] + additional_args
-        # self.__log.info(args)
-        p = subprocess.Popen(args, stdout=subprocess.PIPE, cwd=working_directory)
-        p.wait()
-        out = p.communicate()[0].decode("UTF-8")
-        return out
-
-    def bash_command_with_wait(self, additional_args, working_directory):
-        args = ['/bin/bash', '-e'] + additional_args
-        # self.__log.info(args)
-        try:
-            subprocess.check_call(args, stderr=subprocess.STDOUT, cwd=working_directory)
-        except subprocess.CalledProcessError as e:
-            # There was an error running the command: command exited with non-zero code
-            self.__log.error(f"Process exited with non-zero code {e}")
+    def bash_command_with_output(self, additional_args, working_directory, timeout_s=None):
+        # self.__log.info(additional_args)
+        result = shell_pool.run(additional_args, working_directory, timeout_s)
+        if result.exit_code != 0:
+            self.__log.warning(f"Warning: {additional_args} exited with code {result.exit_code}: {result.stderr}")
+        return result.stdout
+
+    def bash_command_with_wait(self, additional_args, working_directory, timeout_s=None):
+        # self.__log.info(additional_args)
+        # note - logged as it runs, e.g. a long deploy
+        result = shell_pool.run(additional_args, working_directory, timeout_s, on_stdout_line=self.__log.info)
+        if result.exit_code != 0:
+            # There was an error running the command: command exited with non-zero code (or timed out)
+            self.__log.error(f"Process exited with non-zero code {result.exit_code}: {result.stderr}")
             return False
 
         return True
 
+    def run_process(self, process, configuration):
+        """
+        Run a stress/soak test process to completion
+
+        :param process:
+        :param configuration:
+        :return:
+        """
+        process.clock = self.clock
+
+        if configuration.get("monitor", MONITOR_PROCESS) == MONITOR_ASYNC:
+            # run as asyncio tasks in this process
+            AsyncThroughputMonitor(process, self.consumer_throughput_queue, tube=self.consumer_throughput_tube).run()
+        else:
+            # start the process
+            process.start()
+
+            # wait for process to exit
+            process.join()
+
     def get_stress_test_process(self, configuration, queue):
         return StressTestProcess(configuration, queue)
 
@@ -467,10 +798,7 @@ class Controller:
         self.__log.info(f"Running stress test.")
 
         self.stress_test_process = self.get_stress_test_process(configuration, queue)
-        self.stress_test_process.start()
-
-        # wait for thread to exit
-        self.stress_test_process.join()
+        self.run_process(self.stress_test_process, configuration)
 
         self.__log.info(f"Stress test completed.")
 
@@ -486,12 +814,7 @@ class Controller:
         self.__log.info(f"Running soak test.")
 
         self.soak_test_process = self.get_soak_test_process(configuration, queue)
-
-        # start the thread for soak test
-        self.soak_test_process.start()
-
-        # wait for thread to exit
-        self.soak_test_process.join()
+        self.run_process(self.soak_test_process, configuration)
 
         self.__log.info(f"Soak test completed.")
 
@@ -573,7 +896,7 @@ class Controller:
 
         # add "--key=value" parameters to the command
         for key in parameters:
-            if key == "quiet":
+            if key in GCLOUD_FLAGS:
                 # key only, no value
                 gcloud_command += "--" + key + " "
             else:
@@ -615,15 +938,12 @@ class Controller:
 
         self.__log.info(f"Undeployed local SSD provisioner.")
 
-    def provision_kafka_broker_nodes(self, configuration, alpha=False):
-        self.__log.info("Provisioning Kafka broker node pool.")
-
-        # deploy the local ssd provisioner
-        # note - must come first so that PVs are created when node is provisioned
-        self.deploy_local_ssd_provisioner()
-
-        cluster = "gke-kafka-cluster"
-        node_pool = "kafka-node-pool"
+    def get_kafka_node_pool_command(self, configuration, alpha=False):
+        """
+        :return: the Kafka broker node pool create command and parameters
+        """
+        cluster = CLUSTER_NAME
+        node_pool = KAFKA_NODE_POOL
         gcloud_command = "container node-pools create {0}".format(node_pool)
 
         gcloud_parameters = {"cluster": cluster, "num-nodes": configuration["number_of_brokers"],
@@ -635,17 +955,19 @@ class Controller:
         # Local SSD
         # see https://cloud.google.com/sdk/gcloud/reference/alpha/container/node-pools/create#--local-ssd-volumes
         if alpha:
+            gcloud_command = "alpha " + gcloud_command
             gcloud_parameters["local-ssd-volumes"] = "count=1,type=nvme,format=fs"
         else:
             gcloud_parameters["local-ssd-count"] = 1
 
-        self.run_gcloud_command(gcloud_command, gcloud_parameters)
-
-    def provision_zk_nodes(self, configuration):
-        self.__log.info("Provisioning ZK node pool.")
+        return gcloud_command, gcloud_parameters
 
-        cluster = "gke-kafka-cluster"
-        node_pool = "zk-node-pool"
+    def get_zk_node_pool_command(self, configuration):
+        """
+        :return: the ZK node pool create command and parameters
+        """
+        cluster = CLUSTER_NAME
+        node_pool = ZK_NODE_POOL
         gcloud_command = "container node-pools create {0}".format(node_pool)
 
         gcloud_parameters = {"cluster": cluster, "num-nodes": configuration["num_zk"],
@@ -654,47 +976,94 @@ class Controller:
                              "min-nodes": 1, "node-labels": "zk-node=true", "tags": "zk-node",
                              "service-account": SERVICE_ACCOUNT_EMAIL}
 
-        self.run_gcloud_command(gcloud_command, gcloud_parameters)
+        return gcloud_command, gcloud_parameters
 
     def post_provision_node_pools_hook(self):
         pass
 
+    def run_node_pool_operations(self, commands, operation_type):
+        """
+        Run the node pool commands concurrently (gcloud --async), waiting for all of them to complete
+
+        :param commands: dict of node pool -> (command, parameters)
+        :param operation_type: CREATE_NODE_POOL or DELETE_NODE_POOL
+        :return: list of the node pools which failed
+        """
+        results = GcloudOperationTracker(self.run_gcloud_command, clock=self.clock).run(commands, operation_type)
+
+        failed = [node_pool for node_pool, error in results.items() if error is not None]
+        for node_pool in failed:
+            self.__log.error(f"{operation_type} {node_pool} failed: {results[node_pool]}")
+
+        return failed
+
     def provision_node_pools(self, configuration):
+        """
+        Provision the Kafka and ZK node pools concurrently
+
+        :param configuration:
+        :return: True if both node pools were provisioned
+        """
         self.__log.info("Provisioning node pools...")
 
-        # provision using gcloud, not terraform
-        self.provision_kafka_broker_nodes(configuration)
+        # deploy the local ssd provisioner
+        # note - must come first so that PVs are created when node is provisioned
+        self.deploy_local_ssd_provisioner()
 
-        # also provision using gcloud, not terraform
-        self.provision_zk_nodes(configuration)
+        # provision using gcloud, not terraform
+        commands = {KAFKA_NODE_POOL: self.get_kafka_node_pool_command(configuration),
+                    ZK_NODE_POOL: self.get_zk_node_pool_command(configuration)}
+        failed = self.run_node_pool_operations(commands, "CREATE_NODE_POOL")
+
+        if len(failed) > 0:
+            # partial failure - remove whatever was created, so that the next configuration starts from scratch
+            created = [node_pool for node_pool in commands if node_pool not in failed]
+            self.__log.error(f"Node pool provisioning failed for {failed}, removing {created}.")
+            self.delete_node_pools(created)
+            self.node_pools_provisioned = False
+            return False
 
+        self.node_pools_provisioned = True
         self.__log.info("Node pools provisioned.")
 
         # hook for doing something custom at this point
         self.post_provision_node_pools_hook()
 
+        return True
+
+    def delete_node_pools(self, node_pools):
+        """
+        Delete the node pools concurrently
+
+        :param node_pools:
+        :return: list of the node pools which could not be deleted
+        """
+        commands = {}
+        for node_pool in node_pools:
+            gcloud_command = "container node-pools delete {0}".format(node_pool)
+            gcloud_parameters = {"cluster": CLUSTER_NAME, "quiet": True}
+            commands[node_pool] = (gcloud_command, gcloud_parameters)
+
+        return self.run_node_pool_operations(commands, "DELETE_NODE_POOL")
+
     def unprovision_node_pools(self):
         """
         Unprovision via gcloud
 
-        :return:
+        :return: True if both node pools were deleted
         """
         self.__log.info(f"Unprovision node pools...")
 
-        cluster = "gke-kafka-cluster"
-        node_pool = "kafka-node-pool"
-        gcloud_command = "container node-pools delete {0}".format(node_pool)
-        gcloud_parameters = {"cluster": cluster, "quiet": True}
-        self.run_gcloud_command(gcloud_command, gcloud_parameters)
+        failed = self.delete_node_pools([KAFKA_NODE_POOL, ZK_NODE_POOL])
+        self.node_pools_provisioned = False
 
         # undeploy the local ssd provisioner
+        # note - once the kafka node pool has gone
         self.undeploy_local_ssd_provisioner()
 
-        node_pool = "zk-node-pool"
-        gcloud_command = "container node-pools delete {0}".format(node_pool)
-        gcloud_parameters = {"cluster": cluster, "quiet": True}
-        self.run_gcloud_command(gcloud_command, gcloud_parameters)
+        if len(failed) > 0:
+            self.__log.error(f"Unable to unprovision node pools {failed}.")
+            return False
 
         self.__log.info("Node pools unprovisioned.")
-
-
+        return True
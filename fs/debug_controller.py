@@ -1,6 +1,5 @@
-import greenstalk
-
 from fs.controller import Controller
+from fs.queue_backend import create_queue
 from fs.utils import addlogger
 
 
@@ -52,7 +51,7 @@ class DebugController(Controller):
 
 # GOOGLE_APPLICATION_CREDENTIALS=./kafka-k8s-trial-4287e941a38f.json
 if __name__ == '__main__':
-    consumer_throughput_queue = greenstalk.Client(host='127.0.0.1', port=12000, watch='consumer_throughput')
+    consumer_throughput_queue = create_queue()
     c = DebugController(consumer_throughput_queue)
     c.flush_consumer_throughput_queue()
     c.run()
@@ -0,0 +1,143 @@
+import json
+import subprocess
+from datetime import datetime
+
+from fs.clock import system_clock
+from fs.utils import addlogger
+
+OPERATION_DONE = "DONE"
+
+# node pool operations usually take 3-6 minutes
+DEFAULT_POLL_INTERVAL_S = 10
+DEFAULT_OPERATION_TIMEOUT_S = 30 * 60
+
+# allowance for the local clock being ahead of GCP's, when matching an operation to its submission by start time
+CLOCK_SKEW_S = 5
+
+
+@addlogger
+class GcloudOperationTracker:
+    """
+    Track asynchronous gcloud container operations (e.g. node-pools create/delete --async) to completion,
+    by listing the cluster operations (as per scripts/get-operations.sh).
+    """
+    def __init__(self, run_gcloud_command, poll_interval_s=DEFAULT_POLL_INTERVAL_S,
+                 timeout_s=DEFAULT_OPERATION_TIMEOUT_S, clock=system_clock):
+        """
+        :param run_gcloud_command: function(command, parameters) returning the command output (see Controller)
+        :param poll_interval_s:
+        :param timeout_s: for all of the operations to complete
+        :param clock: for the polling interval and the timeout
+        """
+        self.run_gcloud_command = run_gcloud_command
+        self.poll_interval_s = poll_interval_s
+        self.timeout_s = timeout_s
+        self.clock = clock
+
+    def list_operations(self):
+        """
+        :return: list of operation dicts, most recent first
+        """
+        output = self.run_gcloud_command("container operations list",
+                                         {"sort-by": "'~startTime'", "limit": 50, "format": "json"})
+        return json.loads(output)
+
+    @staticmethod
+    def get_start_time(operation):
+        """
+        :return: the startTime of the operation (e.g. 2020-06-01T10:00:00.123456789Z) as a timestamp, None if missing
+        """
+        start_time = operation.get("startTime")
+        if not start_time:
+            return None
+
+        # note - fromisoformat() takes at most microseconds
+        date_time, _, fraction = start_time.rstrip("Z").partition(".")
+        return datetime.fromisoformat(f"{date_time}.{fraction[:6] or 0}+00:00").timestamp()
+
+    @staticmethod
+    def find_operation(operations, node_pool, operation_type, submitted_at):
+        """
+        Find the most recent operation of the given type (e.g. CREATE_NODE_POOL) targeting the node pool,
+        started since it was submitted (rather than e.g. the previous configuration's, of the same node pool)
+
+        :param submitted_at: timestamp of the submission
+        :return: operation dict (or None)
+        """
+        for operation in operations:
+            if operation.get("operationType") == operation_type and \
+                    operation.get("targetLink", "").endswith("/nodePools/" + node_pool):
+                start_time = GcloudOperationTracker.get_start_time(operation)
+                if start_time is not None and start_time >= submitted_at - CLOCK_SKEW_S:
+                    return operation
+
+        return None
+
+    @staticmethod
+    def get_error(operation):
+        if "error" in operation:
+            return operation["error"].get("message", str(operation["error"]))
+
+        return operation.get("statusMessage") or None
+
+    def submit(self, command, parameters):
+        """
+        Submit a command with --async
+
+        :return: the operation name, None if the operation name was not returned, or False if the submission failed
+        """
+        try:
+            output = self.run_gcloud_command(command, dict(parameters, **{"async": True, "format": "'value(name)'"}))
+        except subprocess.CalledProcessError as e:
+            self.__log.error(f"Error submitting {command}: {e}")
+            return False
+
+        name = output.decode("UTF-8").strip() if isinstance(output, bytes) else str(output).strip()
+        return name or None
+
+    def run(self, commands, operation_type):
+        """
+        Submit all the node pool commands, then wait for all the operations to complete
+
+        :param commands: dict of node pool -> (command, parameters)
+        :param operation_type: e.g. CREATE_NODE_POOL, DELETE_NODE_POOL
+        :return: dict of node pool -> error message (None if successful)
+        """
+        results = {}
+        operation_names = {}
+        submitted_at = {}
+        for node_pool, (command, parameters) in commands.items():
+            submitted_at[node_pool] = self.clock.time()
+            name = self.submit(command, parameters)
+            if name is False:
+                results[node_pool] = "submission failed"
+            else:
+                operation_names[node_pool] = name
+
+        deadline = self.clock.monotonic() + self.timeout_s
+        while len(operation_names) > 0:
+            self.clock.sleep(self.poll_interval_s)
+
+            try:
+                operations = self.list_operations()
+            except (subprocess.CalledProcessError, ValueError) as e:
+                self.__log.warning(f"Warning: unable to list operations, {e}")
+                operations = []
+
+            for node_pool, name in list(operation_names.items()):
+                if name is not None:
+                    operation = next((o for o in operations if o.get("name") == name), None)
+                else:
+                    operation = self.find_operation(operations, node_pool, operation_type, submitted_at[node_pool])
+
+                if operation is not None and operation.get("status") == OPERATION_DONE:
+                    results[node_pool] = self.get_error(operation)
+                    del operation_names[node_pool]
+                    self.__log.info(f"{operation_type} {node_pool} done, error: {results[node_pool]}")
+
+            if self.clock.monotonic() > deadline:
+                for node_pool in operation_names:
+                    results[node_pool] = "timed out"
+                break
+
+        return results
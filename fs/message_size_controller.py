@@ -1,8 +1,7 @@
 import types
 
-import greenstalk
-
 from fs.controller import Controller
+from fs.queue_backend import create_queue
 from fs.soak_test_process import SoakTestProcess
 from fs.stress_test_process import StressTestProcess
 from fs.utils import addlogger
@@ -84,7 +83,7 @@ class StressTestProcess2(StressTestProcess):
 
 # GOOGLE_APPLICATION_CREDENTIALS=./kafka-k8s-trial-4287e941a38f.json
 if __name__ == '__main__':
-    consumer_throughput_queue = greenstalk.Client(host='127.0.0.1', port=12000, watch='consumer_throughput')
+    consumer_throughput_queue = create_queue()
     c = MessageSizeController(consumer_throughput_queue)
     c.flush_consumer_throughput_queue()
     c.run()
@@ -0,0 +1,121 @@
+import os
+import threading
+
+from fs.clock import system_clock
+from fs.cluster_snapshot import fetch_cluster_snapshot
+from fs.utils import addlogger
+
+# how long a pod count is considered fresh
+DEFAULT_POD_COUNT_TTL_S = 5
+
+# the snapshot is no longer refreshed in the background if not read for this many TTLs
+IDLE_TTL_MULTIPLE = 10
+
+
+@addlogger
+class PodCountCache:
+    """
+    Rate-limited cache of the running pod counts (see ClusterSnapshot).
+
+    - snapshot() returns the cached snapshot while it is younger than the TTL, otherwise takes a new one
+      (concurrent callers share a single kubectl call)
+    - invalidate() is called after our own scale calls, so the next read takes a new snapshot
+    - a background thread refreshes the snapshot while it is in use, so reads rarely wait on kubectl
+      (the thread stops once the snapshot is idle, and is started again by the next read)
+
+    The cache is fork-safe: a forked child keeps the cached snapshot and starts its own refresh thread.
+    """
+    def __init__(self, fetch=fetch_cluster_snapshot, ttl_s=DEFAULT_POD_COUNT_TTL_S, background_refresh=True,
+                 clock=system_clock):
+        self.fetch = fetch
+        self.ttl_s = ttl_s
+        self.background_refresh = background_refresh
+        self.clock = clock
+
+        # (snapshot, fetched at)
+        self._snapshot = None
+        self._read_at = float("-inf")
+        self._invalidated_at = float("-inf")
+        self._reset_threading()
+
+        os.register_at_fork(after_in_child=self._reset_threading)
+
+    def _reset_threading(self):
+        # note - after a fork, locks may have been held by a thread which does not exist in the child
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._refresh_thread = None
+
+    def is_fresh(self, now):
+        if self._snapshot is None:
+            return False
+
+        # note - a fetch which started before the invalidation does not count
+        fetched_at = self._snapshot[1]
+        return now - fetched_at < self.ttl_s and fetched_at > self._invalidated_at
+
+    def snapshot(self):
+        now = self.clock.monotonic()
+        self._read_at = now
+        self._start_refresh_thread()
+
+        if self.is_fresh(now):
+            return self._snapshot[0]
+
+        return self._load(now)
+
+    def get(self, role):
+        return self.snapshot().count(role)
+
+    def _load(self, requested_at):
+        with self._fetch_lock:
+            # another caller may have taken a snapshot while we were waiting
+            if self._snapshot is not None and self._snapshot[1] >= requested_at:
+                return self._snapshot[0]
+
+            fetched_at = self.clock.monotonic()
+            snapshot = self.fetch()
+            self._snapshot = (snapshot, fetched_at)
+            return snapshot
+
+    def invalidate(self, role=None):
+        """
+        Mark the cached counts as stale.
+
+        Note - one snapshot holds every role, so all roles are invalidated
+
+        :param role: the role which has changed
+        :return:
+        """
+        self._invalidated_at = self.clock.monotonic()
+
+    def _start_refresh_thread(self):
+        if not self.background_refresh or self._refresh_thread is not None:
+            return
+
+        with self._lock:
+            if self._refresh_thread is None:
+                self._refresh_thread = threading.Thread(target=self._refresh_loop, daemon=True)
+                self._refresh_thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            self.clock.sleep(self.ttl_s / 2)
+
+            now = self.clock.monotonic()
+            with self._lock:
+                # note - a read which missed the thread exiting starts a new one (under the same lock)
+                if now - self._read_at >= self.ttl_s * IDLE_TTL_MULTIPLE:
+                    self._refresh_thread = None
+                    return
+
+            # refresh the snapshot while in use, if stale (or will be before the next pass)
+            if not self.is_fresh(now + self.ttl_s / 2):
+                try:
+                    self._load(now)
+                except Exception as e:
+                    self.__log.warning(f"Warning: unable to refresh the pod counts, {e}")
+
+
+# shared by the controller and the test processes
+pod_counts = PodCountCache()
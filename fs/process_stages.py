@@ -0,0 +1,192 @@
+"""
+The stages of a throughput process (see ThroughputProcess.run), each on a thread of its own:
+
+  ingest    SampleIngester, drains the consumer throughput queue into a bounded queue of sample batches
+  analyse   the process itself, checks each batch against the tolerance and decides the producer count
+  actuate   ScalingActuator, applies the producer count (kubectl), coalescing requests made while busy
+
+so a slow kubectl call holds up neither the ingestion of samples nor their analysis.
+
+An error which stops the ingest or actuate stage is raised in the analysis (as StageError) the next time
+it hands over to that stage, so the process fails as it would have without the stages.
+"""
+import queue
+import threading
+import time
+
+from fs.utils import addlogger
+
+# batches of samples waiting to be analysed, beyond which ingestion waits (the samples stay on the queue)
+DEFAULT_INGEST_QUEUE_SIZE = 16
+
+# how often the actuator reads the producer count when not scaling
+DEFAULT_PRODUCER_COUNT_REFRESH_S = 5
+
+
+class StageError(Exception):
+    pass
+
+
+@addlogger
+class SampleIngester:
+    """
+    Ingest stage
+    """
+    def __init__(self, get_batch, max_batches=DEFAULT_INGEST_QUEUE_SIZE):
+        """
+        :param get_batch: get_batch(), returning a list of samples (waiting a while if there are none)
+        :param max_batches: bound on the batches waiting to be analysed
+        """
+        self.get_batch = get_batch
+        self.batches = queue.Queue(max_batches)
+        self.stopped = threading.Event()
+        self.thread = None
+        # the error which stopped the stage, if any
+        self.error = None
+
+        # seconds from a batch being drained to it being handed to the analysis, worst case
+        self.max_lag_s = 0.0
+        self.batch_count = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="SampleIngester", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.ingest()
+        except Exception as e:
+            self.__log.exception(f"Error: ingestion stopped, {e!r}")
+            self.error = e
+
+    def ingest(self):
+        while not self.stopped.is_set():
+            samples = self.get_batch()
+            if len(samples) == 0:
+                continue
+
+            ingested_at = time.monotonic()
+            while not self.stopped.is_set():
+                try:
+                    self.batches.put((ingested_at, samples), timeout=1)
+                    break
+                except queue.Full:
+                    self.__log.warning("Warning: analysis is behind, waiting to ingest.")
+
+    def get(self, timeout=1):
+        """
+        :return: the next batch of samples (empty if there was none within the timeout)
+        :raises StageError: once the batches ingested before an error have been analysed
+        """
+        try:
+            ingested_at, samples = self.batches.get(timeout=timeout)
+        except queue.Empty:
+            if self.error is not None:
+                raise StageError(f"Ingestion stopped, {self.error!r}") from self.error
+            return []
+
+        self.batch_count += 1
+        self.max_lag_s = max(self.max_lag_s, time.monotonic() - ingested_at)
+        return samples
+
+    def stop(self):
+        """
+        Stop ingesting (the batches not yet analysed are dropped, as the samples of a completed test)
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+@addlogger
+class ScalingActuator:
+    """
+    Actuate stage. Only the latest producer count requested is applied: any requested while a scale
+    is in flight replace each other. Also keeps the producer count read, so the analysis need not wait on kubectl.
+    """
+    def __init__(self, scale, read_producer_count, refresh_s=DEFAULT_PRODUCER_COUNT_REFRESH_S):
+        """
+        :param scale: scale(producer_count), blocking until applied
+        :param read_producer_count: read_producer_count(), the running producer count
+        :param refresh_s: how often the producer count is read when not scaling
+        """
+        self.scale = scale
+        self.read_producer_count = read_producer_count
+        self.refresh_s = refresh_s
+
+        self.condition = threading.Condition()
+        # the latest producer count requested, and not yet applied
+        self.desired_producer_count = None
+        self.stopped = False
+        self.thread = None
+        # the error which stopped the stage, if any
+        self.error = None
+
+        self.producer_count = read_producer_count()
+
+        self.applied_count = 0
+        self.coalesced_count = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="ScalingActuator", daemon=True)
+        self.thread.start()
+
+    def check(self):
+        """
+        :raises StageError: if the stage has stopped on an error
+        """
+        if self.error is not None:
+            raise StageError(f"Actuation stopped, {self.error!r}") from self.error
+
+    def get_producer_count(self):
+        """
+        :return: the producer count as last read
+        """
+        self.check()
+        return self.producer_count
+
+    def request(self, producer_count):
+        self.check()
+        with self.condition:
+            if self.desired_producer_count is not None:
+                self.coalesced_count += 1
+            self.desired_producer_count = producer_count
+            self.condition.notify()
+
+    def run(self):
+        try:
+            self.actuate()
+        except Exception as e:
+            self.__log.exception(f"Error: actuation stopped, {e!r}")
+            self.error = e
+
+    def actuate(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.stopped or self.desired_producer_count is not None,
+                                        self.refresh_s)
+                producer_count = self.desired_producer_count
+                self.desired_producer_count = None
+                stopped = self.stopped
+
+            if producer_count is not None:
+                self.__log.info(f"Applying producer count {producer_count}")
+                self.scale(producer_count)
+                self.applied_count += 1
+            elif stopped:
+                return
+
+            self.producer_count = self.read_producer_count()
+
+    def stop(self):
+        """
+        Stop once the outstanding request (if any) has been applied
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
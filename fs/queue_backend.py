@@ -0,0 +1,489 @@
+"""
+Consumer throughput queue backends. Each implements the subset of the greenstalk.Client interface used here
+(put/reserve/delete, use/watch/ignore, tubes/stats_tube, close), plus:
+  reserve_batch(max_jobs, timeout)/delete_batch(jobs), as per fs.beanstalk_batch
+  connection(use, watch), a new connection to the same queue
+Errors are as per greenstalk (e.g. greenstalk.TimedOutError when nothing is ready in time).
+
+  beanstalk  beanstalkd (see run_beanstalkd.sh), for consumers reporting from the cluster
+  memory     in this process, e.g. for tests and simulated runs
+  shm        lock-free single producer, single consumer ring buffer in shared memory, per tube,
+             for a producer on the same host (e.g. a local consumer reporting endpoint)
+"""
+import glob
+import itertools
+import os
+import struct
+import threading
+import time
+from collections import defaultdict, deque
+from multiprocessing import resource_tracker, shared_memory
+
+import greenstalk
+
+from fs.beanstalk_batch import reserve_batch, delete_batch
+from fs.utils import BEANSTALKD_HOST, BEANSTALKD_PORT, CONSUMER_THROUGHPUT_TUBE
+
+QUEUE_BEANSTALK = "beanstalk"
+QUEUE_MEMORY = "memory"
+QUEUE_SHM = "shm"
+
+# bytes of each shared memory ring (per tube)
+DEFAULT_RING_CAPACITY = 4 * 1024 * 1024
+
+# shared memory segment names are "<prefix>_<tube>"
+DEFAULT_RING_PREFIX = "fs_queue"
+
+# where POSIX shared memory segments are listed (Linux)
+SHM_DIRECTORY = "/dev/shm"
+
+# how often an empty ring is polled while waiting in reserve
+RING_POLL_INTERVAL_S = 0.001
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class QueueBackend:
+    """
+    Interface of the queue backends (see above)
+    """
+    def put(self, body):
+        raise NotImplementedError("Please use a sub-class to implement the method.")
+
+    def reserve(self, timeout=None):
+        raise NotImplementedError("Please use a sub-class to implement the method.")
+
+    def delete(self, job):
+        raise NotImplementedError("Please use a sub-class to implement the method.")
+
+    def reserve_batch(self, max_jobs, timeout=1):
+        raise NotImplementedError("Please use a sub-class to implement the method.")
+
+    def delete_batch(self, jobs):
+        raise NotImplementedError("Please use a sub-class to implement the method.")
+
+    def use(self, tube):
+        raise NotImplementedError("Please use a sub-class to implement the method.")
+
+    def watch(self, tube):
+        raise NotImplementedError("Please use a sub-class to implement the method.")
+
+    def ignore(self, tube):
+        raise NotImplementedError("Please use a sub-class to implement the method.")
+
+    def tubes(self):
+        raise NotImplementedError("Please use a sub-class to implement the method.")
+
+    def stats_tube(self, tube):
+        raise NotImplementedError("Please use a sub-class to implement the method.")
+
+    def connection(self, use=CONSUMER_THROUGHPUT_TUBE, watch=CONSUMER_THROUGHPUT_TUBE):
+        raise NotImplementedError("Please use a sub-class to implement the method.")
+
+    def close(self):
+        pass
+
+
+class BeanstalkQueue(QueueBackend):
+    """
+    beanstalkd, with the reserves and deletes of a batch pipelined.
+
+    A lost connection (e.g. closed after a failed batch, see fs.beanstalk_batch) is reported as a ConnectionError,
+    and the next call reconnects, using and watching the same tubes.
+    """
+    def __init__(self, host=BEANSTALKD_HOST, port=BEANSTALKD_PORT, use=CONSUMER_THROUGHPUT_TUBE,
+                 watch=CONSUMER_THROUGHPUT_TUBE):
+        self.host = host
+        self.port = port
+        self.using = use
+        self.watching = [watch]
+        self.client = None
+        self.get_client()
+
+    def get_client(self):
+        """
+        :return: the connection, reconnected if the last one was lost
+        """
+        if self.client is None:
+            self.client = greenstalk.Client(host=self.host, port=self.port, use=self.using, watch=self.watching)
+        return self.client
+
+    def disconnect(self):
+        if self.client is not None:
+            try:
+                self.client.close()
+            except OSError:
+                pass
+            self.client = None
+
+    def call(self, operation, *args):
+        try:
+            return operation(self.get_client(), *args)
+        except ConnectionError:
+            self.disconnect()
+            raise
+
+    def put(self, body):
+        return self.call(greenstalk.Client.put, body)
+
+    def reserve(self, timeout=None):
+        return self.call(greenstalk.Client.reserve, timeout)
+
+    def delete(self, job):
+        self.call(greenstalk.Client.delete, job)
+
+    def reserve_batch(self, max_jobs, timeout=1):
+        return self.call(reserve_batch, max_jobs, timeout)
+
+    def delete_batch(self, jobs):
+        return self.call(delete_batch, jobs)
+
+    def use(self, tube):
+        self.call(greenstalk.Client.use, tube)
+        self.using = tube
+
+    def watch(self, tube):
+        watching = self.call(greenstalk.Client.watch, tube)
+        if tube not in self.watching:
+            self.watching.append(tube)
+        return watching
+
+    def ignore(self, tube):
+        watching = self.call(greenstalk.Client.ignore, tube)
+        if tube in self.watching:
+            self.watching.remove(tube)
+        return watching
+
+    def tubes(self):
+        return self.call(greenstalk.Client.tubes)
+
+    def stats_tube(self, tube):
+        return self.call(greenstalk.Client.stats_tube, tube)
+
+    def connection(self, use=CONSUMER_THROUGHPUT_TUBE, watch=CONSUMER_THROUGHPUT_TUBE):
+        return BeanstalkQueue(self.host, self.port, use, watch)
+
+    def close(self):
+        self.disconnect()
+
+
+class InMemoryServer:
+    """
+    The tubes shared by the connections of an InMemoryQueue
+    """
+    def __init__(self):
+        # tube -> deque of ready jobs
+        self.ready_jobs = defaultdict(deque)
+        self.job_ids = itertools.count(1)
+        self.condition = threading.Condition()
+
+
+class InMemoryQueue(QueueBackend):
+    """
+    Queue in this process. Jobs are removed when reserved, so delete is a no-op.
+    """
+    def __init__(self, server=None, use=CONSUMER_THROUGHPUT_TUBE, watch=CONSUMER_THROUGHPUT_TUBE, blocking=True):
+        """
+        :param server: shared with the other connections (default: a new one)
+        :param use:
+        :param watch:
+        :param blocking: if False, reserve never waits (e.g. when the publisher runs in the same thread)
+        """
+        self.server = server if server is not None else InMemoryServer()
+        self.using = use
+        self.watched = [watch]
+        self.blocking = blocking
+
+    def connection(self, use=CONSUMER_THROUGHPUT_TUBE, watch=CONSUMER_THROUGHPUT_TUBE):
+        return type(self)(self.server, use, watch, self.blocking)
+
+    def use(self, tube):
+        self.using = tube
+
+    def watch(self, tube):
+        if tube not in self.watched:
+            self.watched.append(tube)
+        return len(self.watched)
+
+    def ignore(self, tube):
+        if self.watched == [tube]:
+            raise greenstalk.NotIgnoredError()
+        if tube in self.watched:
+            self.watched.remove(tube)
+        return len(self.watched)
+
+    def tubes(self):
+        with self.server.condition:
+            return [tube for tube, jobs in self.server.ready_jobs.items() if len(jobs) > 0]
+
+    def put(self, body):
+        with self.server.condition:
+            job_id = next(self.server.job_ids)
+            self.server.ready_jobs[self.using].append(greenstalk.Job(job_id, body))
+            self.server.condition.notify_all()
+        return job_id
+
+    def take(self, max_jobs):
+        jobs = []
+        for tube in self.watched:
+            ready = self.server.ready_jobs.get(tube)
+            while ready and len(jobs) < max_jobs:
+                jobs.append(ready.popleft())
+
+        return jobs
+
+    def reserve_batch(self, max_jobs, timeout=1):
+        with self.server.condition:
+            jobs = self.take(max_jobs)
+            if len(jobs) == 0 and self.blocking and timeout:
+                self.server.condition.wait_for(lambda: any(self.server.ready_jobs.get(tube) for tube in self.watched),
+                                               timeout)
+                jobs = self.take(max_jobs)
+
+        return jobs
+
+    def reserve(self, timeout=None):
+        jobs = self.reserve_batch(1, timeout)
+        if len(jobs) == 0:
+            raise greenstalk.TimedOutError()
+
+        return jobs[0]
+
+    def delete(self, job):
+        pass
+
+    def delete_batch(self, jobs):
+        return []
+
+    def stats_tube(self, tube):
+        with self.server.condition:
+            return {"name": tube, "current-jobs-ready": len(self.server.ready_jobs.get(tube, ()))}
+
+
+# ring header: bytes written, bytes read (both only ever increase)
+RING_HEADER = struct.Struct("=QQ")
+RING_HEADER_SIZE = 64
+
+# each record is a 4 byte length then the body, the wrap marker says continue from the start of the ring
+RECORD_LENGTH = struct.Struct("=I")
+WRAP_MARKER = 0xFFFFFFFF
+
+
+class SharedMemoryRing:
+    """
+    Single producer, single consumer ring buffer of variable length records, in a shared memory segment.
+
+    No locks: the producer only writes the written count (after the record), the consumer only writes
+    the read count (after reading the record), and each count is a single aligned 8 byte write.
+
+    The segment outlives the processes using it, until unlink() is called (e.g. once the tube is collected).
+    """
+    def __init__(self, name, capacity=DEFAULT_RING_CAPACITY):
+        """
+        Attach to the named segment, creating it if it does not exist yet
+
+        :param name:
+        :param capacity: bytes, if created
+        """
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=RING_HEADER_SIZE + capacity)
+            RING_HEADER.pack_into(self.shm.buf, 0, 0, 0)
+        except FileExistsError:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        # note - otherwise the resource tracker unlinks the segment when this process exits, e.g. a publisher
+        # which has put its reports (before Python 3.13, SharedMemory registers every segment, even when attaching)
+        resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.name = name
+        self.capacity = self.shm.size - RING_HEADER_SIZE
+
+    def counts(self):
+        """
+        :return: (bytes written, bytes read)
+        """
+        return RING_HEADER.unpack_from(self.shm.buf, 0)
+
+    def write(self, data):
+        """
+        :raises QueueFullError: if there is no room for the record
+        """
+        size = RECORD_LENGTH.size + len(data)
+        written, read = self.counts()
+        position = written % self.capacity
+
+        # records are contiguous, so skip the end of the ring if the record does not fit in it
+        skip = self.capacity - position if position + size > self.capacity else 0
+        if written + skip + size - read > self.capacity:
+            raise QueueFullError(f"Ring {self.name} is full")
+
+        buf = self.shm.buf
+        if skip > 0:
+            if skip >= RECORD_LENGTH.size:
+                RECORD_LENGTH.pack_into(buf, RING_HEADER_SIZE + position, WRAP_MARKER)
+            position = 0
+
+        RECORD_LENGTH.pack_into(buf, RING_HEADER_SIZE + position, len(data))
+        buf[RING_HEADER_SIZE + position + RECORD_LENGTH.size:RING_HEADER_SIZE + position + size] = data
+
+        # publish the record
+        struct.pack_into("=Q", buf, 0, written + skip + size)
+
+    def read(self, max_records):
+        """
+        :return: list of (offset, data) of up to max_records records, oldest first
+        """
+        written, read = self.counts()
+        buf = self.shm.buf
+
+        records = []
+        while read < written and len(records) < max_records:
+            position = read % self.capacity
+            if self.capacity - position < RECORD_LENGTH.size:
+                # too little room at the end of the ring for even a wrap marker
+                read += self.capacity - position
+                continue
+
+            length, = RECORD_LENGTH.unpack_from(buf, RING_HEADER_SIZE + position)
+            if length == WRAP_MARKER:
+                read += self.capacity - position
+                continue
+
+            start = RING_HEADER_SIZE + position + RECORD_LENGTH.size
+            records.append((read, bytes(buf[start:start + length])))
+            read += RECORD_LENGTH.size + length
+
+        # release the records
+        struct.pack_into("=Q", buf, 8, read)
+        return records
+
+    def ready(self):
+        written, read = self.counts()
+        return written != read
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        # note - unlink() unregisters the segment from the resource tracker, so it is registered again first
+        resource_tracker.register(self.shm._name, "shared_memory")
+        self.shm.unlink()
+
+
+class SharedMemoryQueue(QueueBackend):
+    """
+    A SharedMemoryRing per tube. There must be a single publisher and a single reader of each tube.
+    Jobs are removed when reserved, so delete is a no-op.
+    """
+    def __init__(self, prefix=DEFAULT_RING_PREFIX, capacity=DEFAULT_RING_CAPACITY, use=CONSUMER_THROUGHPUT_TUBE,
+                 watch=CONSUMER_THROUGHPUT_TUBE, encoding="utf-8"):
+        self.prefix = prefix
+        self.capacity = capacity
+        self.encoding = encoding
+        # tube -> SharedMemoryRing, attached on first use
+        self.rings = {}
+        self.using = use
+        self.watched = [watch]
+
+    def get_ring(self, tube):
+        ring = self.rings.get(tube)
+        if ring is None:
+            ring = self.rings[tube] = SharedMemoryRing(f"{self.prefix}_{tube}", self.capacity)
+
+        return ring
+
+    def connection(self, use=CONSUMER_THROUGHPUT_TUBE, watch=CONSUMER_THROUGHPUT_TUBE):
+        return SharedMemoryQueue(self.prefix, self.capacity, use, watch, self.encoding)
+
+    def use(self, tube):
+        self.using = tube
+
+    def watch(self, tube):
+        if tube not in self.watched:
+            self.watched.append(tube)
+        return len(self.watched)
+
+    def ignore(self, tube):
+        if self.watched == [tube]:
+            raise greenstalk.NotIgnoredError()
+        if tube in self.watched:
+            self.watched.remove(tube)
+        return len(self.watched)
+
+    def tubes(self):
+        """
+        :return: the tubes with a segment (including those left by other, e.g. earlier, processes)
+        """
+        prefix = os.path.join(SHM_DIRECTORY, self.prefix + "_")
+        return sorted(path[len(prefix):] for path in glob.glob(glob.escape(prefix) + "*"))
+
+    def put(self, body):
+        data = body.encode(self.encoding) if isinstance(body, str) else body
+        self.get_ring(self.using).write(data)
+
+    def take(self, max_jobs):
+        jobs = []
+        for tube in self.watched:
+            for offset, data in self.get_ring(tube).read(max_jobs - len(jobs)):
+                jobs.append(greenstalk.Job(offset, data.decode(self.encoding) if self.encoding else data))
+            if len(jobs) == max_jobs:
+                break
+
+        return jobs
+
+    def reserve_batch(self, max_jobs, timeout=1):
+        deadline = time.monotonic() + (timeout or 0)
+        while True:
+            jobs = self.take(max_jobs)
+            if len(jobs) > 0 or time.monotonic() >= deadline:
+                return jobs
+            time.sleep(RING_POLL_INTERVAL_S)
+
+    def reserve(self, timeout=None):
+        jobs = self.reserve_batch(1, timeout)
+        if len(jobs) == 0:
+            raise greenstalk.TimedOutError()
+
+        return jobs[0]
+
+    def delete(self, job):
+        pass
+
+    def delete_batch(self, jobs):
+        return []
+
+    def stats_tube(self, tube):
+        written, read = self.get_ring(tube).counts()
+        return {"name": tube, "current-bytes-ready": written - read}
+
+    def close(self):
+        for ring in self.rings.values():
+            ring.close()
+        self.rings = {}
+
+    def unlink(self, tube):
+        """
+        Remove the tube's shared memory segment (once both ends are done with it, e.g. once collected)
+        """
+        ring = self.get_ring(tube)
+        del self.rings[tube]
+        ring.close()
+        ring.unlink()
+
+
+QUEUE_BACKENDS = {QUEUE_BEANSTALK: BeanstalkQueue, QUEUE_MEMORY: InMemoryQueue, QUEUE_SHM: SharedMemoryQueue}
+
+
+def create_queue(backend=QUEUE_BEANSTALK, **kwargs):
+    """
+    :param backend: one of QUEUE_BACKENDS
+    :param kwargs: passed to the backend, e.g. host/port for beanstalk
+    :return: QueueBackend, watching (and using) the shared consumer throughput tube
+    """
+    try:
+        queue_class = QUEUE_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown queue backend {backend}, expected one of {list(QUEUE_BACKENDS)}")
+
+    return queue_class(**kwargs)
@@ -0,0 +1,138 @@
+"""
+How the stress test steps the producer count towards the saturation point
+(the highest producer count at which every consumer is within tolerance).
+
+Selected per configuration, e.g. {"ramp_strategy": RAMP_EXPONENTIAL}
+"""
+
+# one more producer per producer increment interval, until tolerance is breached
+RAMP_LINEAR = "linear"
+
+# double the step up each interval until tolerance is breached, then bisect back down
+RAMP_EXPONENTIAL = "exponential"
+
+PROBE_OK = "ok"
+PROBE_FAILED = "failed"
+
+
+class RampStrategy:
+    """
+    Decides the next producer count once a probe (a producer count held for the producer increment interval)
+    has passed, or once tolerance has been breached at it.
+
+    Records the probe trajectory: a list of dicts of time, producer_count and outcome.
+    """
+    name = None
+
+    def __init__(self, start_producer_count, max_producer_count=None):
+        """
+        :param start_producer_count:
+        :param max_producer_count: upper bound on the producer count (None for no bound)
+        """
+        self.start_producer_count = start_producer_count
+        self.max_producer_count = max_producer_count
+        self.trajectory = []
+
+        # the highest producer count known to be ok (the saturation point once the ramp is done)
+        self.lower = max(0, start_producer_count - 1)
+        # the lowest producer count known to breach tolerance
+        self.upper = None
+
+    def record(self, now, producer_count, outcome):
+        self.trajectory.append({"time": now, "producer_count": producer_count, "outcome": outcome})
+
+    def probe_ok(self, producer_count, now):
+        """
+        :return: the next producer count, or None if the ramp is done
+        """
+        self.record(now, producer_count, PROBE_OK)
+        self.lower = max(self.lower, producer_count)
+        return self.next_after_ok(producer_count)
+
+    def probe_failed(self, producer_count, now):
+        """
+        :return: the next producer count, or None if the ramp is done
+        """
+        self.record(now, producer_count, PROBE_FAILED)
+        if self.upper is None or producer_count < self.upper:
+            self.upper = producer_count
+        return self.next_after_failed(producer_count)
+
+    def next_after_ok(self, producer_count):
+        raise NotImplementedError("Please use a sub-class to implement the method.")
+
+    def next_after_failed(self, producer_count):
+        raise NotImplementedError("Please use a sub-class to implement the method.")
+
+    def saturation_producer_count(self):
+        return self.lower
+
+
+class LinearRampStrategy(RampStrategy):
+    """
+    The original stress test: one more producer per interval, stopping as soon as tolerance is breached
+    """
+    name = RAMP_LINEAR
+
+    def next_after_ok(self, producer_count):
+        # note - the max producer count has never bounded the linear ramp
+        return producer_count + 1
+
+    def next_after_failed(self, producer_count):
+        return None
+
+
+class ExponentialRampStrategy(RampStrategy):
+    """
+    Step up by 1, 2, 4, 8... producers while the probes pass. Once tolerance is breached,
+    bisect between the highest passing and the lowest failing producer count until they are adjacent.
+
+    The ramp finishes at one of the two (whichever was probed last), so the soak test starts
+    at most one producer above the saturation point, as it does after the linear ramp.
+    """
+    name = RAMP_EXPONENTIAL
+
+    def __init__(self, start_producer_count, max_producer_count=None):
+        super().__init__(start_producer_count, max_producer_count)
+        self.step = 1
+
+    def next_after_ok(self, producer_count):
+        if self.upper is None:
+            if self.max_producer_count is not None and producer_count >= self.max_producer_count:
+                # never saturated
+                return None
+
+            next_producer_count = producer_count + self.step
+            self.step *= 2
+            if self.max_producer_count is not None:
+                next_producer_count = min(next_producer_count, self.max_producer_count)
+            return next_producer_count
+
+        return self.bisect()
+
+    def next_after_failed(self, producer_count):
+        return self.bisect()
+
+    def bisect(self):
+        middle = (self.lower + self.upper) // 2
+        if middle <= self.lower:
+            return None
+
+        return middle
+
+
+RAMP_STRATEGIES = {RAMP_LINEAR: LinearRampStrategy, RAMP_EXPONENTIAL: ExponentialRampStrategy}
+
+
+def get_ramp_strategy(configuration):
+    """
+    :param configuration: ramp_strategy (default linear), start_producer_count and max_producer_count (optional)
+    :return: RampStrategy
+    """
+    name = configuration.get("ramp_strategy", RAMP_LINEAR)
+    try:
+        strategy_class = RAMP_STRATEGIES[name]
+    except KeyError:
+        raise ValueError(f"Unknown ramp strategy {name}, expected one of {list(RAMP_STRATEGIES)}")
+
+    return strategy_class(configuration["start_producer_count"], configuration.get("max_producer_count"))
@@ -0,0 +1,158 @@
+import os
+import queue
+import signal
+import subprocess
+import threading
+
+from fs.clock import system_clock
+from fs.cluster_snapshot import ROLE_PODS
+from fs.pod_count_cache import pod_counts
+from fs.utils import SCRIPT_DIR, addlogger
+
+POD_RUNNING = "Running"
+
+# exponential backoff when polling
+INITIAL_BACKOFF_S = 1
+MAX_BACKOFF_S = 10
+
+
+def watch_pods_command(namespace):
+    return ['/bin/bash', '-e', './watch-pods.sh', namespace]
+
+
+def get_fresh_count(role):
+    # bypass the TTL, we want to know as soon as the count changes
+    pod_counts.invalidate(role)
+    return pod_counts.get(role)
+
+
+@addlogger
+class ReadinessWaiter:
+    """
+    Wait for the running pod count of a role to reach a target, within a deadline.
+
+    Subscribes to pod watch events and returns the moment the target is reached.
+    If the watch cannot be started (or ends early) it falls back to polling with exponential backoff.
+    """
+    def __init__(self, watch_command=watch_pods_command, get_count=get_fresh_count, working_directory=SCRIPT_DIR,
+                 initial_backoff_s=INITIAL_BACKOFF_S, max_backoff_s=MAX_BACKOFF_S, clock=system_clock):
+        """
+        :param watch_command: function(namespace) returning the args of the pod watch command
+        :param get_count: function(role) returning the running pod count, for polling
+        :param working_directory: for the watch command
+        :param initial_backoff_s:
+        :param max_backoff_s:
+        :param clock: for the deadline and the polling backoff
+        """
+        self.watch_command = watch_command
+        self.get_count = get_count
+        self.working_directory = working_directory
+        self.initial_backoff_s = initial_backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.clock = clock
+
+    def wait_for(self, role, target_count, deadline_s):
+        """
+        :param role: e.g. ROLE_BROKER
+        :param target_count: number of running pods to wait for
+        :param deadline_s: overall time budget
+        :return: True if the target was reached before the deadline
+        """
+        deadline = self.clock.monotonic() + deadline_s
+
+        if self.watch_command is not None:
+            ready = self.watch(role, target_count, deadline)
+            if ready is not None:
+                return ready
+
+            self.__log.info(f"Watch unavailable, polling for {role} pods...")
+
+        return self.poll(role, target_count, deadline)
+
+    def watch(self, role, target_count, deadline):
+        """
+        :return: True/False if the target was/was not reached before the deadline, None if the watch ended early
+        """
+        namespace, prefix = ROLE_PODS[role]
+
+        try:
+            # in a session of its own, so the kubectl started by the script can be killed along with it
+            p = subprocess.Popen(self.watch_command(namespace), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                 cwd=self.working_directory, start_new_session=True)
+        except OSError as e:
+            self.__log.warning(f"Warning: unable to start pod watch, {e}")
+            return None
+
+        events = queue.Queue()
+        reader = threading.Thread(target=self.read_events, args=(p.stdout, events), daemon=True)
+        reader.start()
+
+        # pod name -> phase
+        phases = {}
+        running_count = 0
+        try:
+            while True:
+                remaining_s = deadline - self.clock.monotonic()
+                if remaining_s <= 0:
+                    self.__log.info(f"Deadline reached with {running_count}/{target_count} {role} pods running.")
+                    return False
+
+                try:
+                    line = events.get(timeout=remaining_s)
+                except queue.Empty:
+                    continue
+
+                if line is None:
+                    # watch ended
+                    return None
+
+                fields = line.split()
+                if len(fields) == 2:
+                    # no event type, e.g. the initial listing
+                    fields.insert(0, "MODIFIED")
+                if len(fields) != 3 or not fields[1].startswith(prefix):
+                    continue
+
+                event_type, name, phase = fields
+                if event_type == "DELETED":
+                    phases.pop(name, None)
+                else:
+                    phases[name] = phase
+
+                new_running_count = sum(1 for phase in phases.values() if phase == POD_RUNNING)
+                if new_running_count != running_count:
+                    running_count = new_running_count
+                    self.__log.info(f"{running_count}/{target_count} {role} pods running.")
+
+                if running_count == target_count:
+                    return True
+        finally:
+            try:
+                os.killpg(p.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            p.wait()
+
+    @staticmethod
+    def read_events(stream, events):
+        for line in stream:
+            events.put(line.decode("UTF-8"))
+
+        # end of stream
+        events.put(None)
+
+    def poll(self, role, target_count, deadline):
+        backoff_s = self.initial_backoff_s
+        while True:
+            count = self.get_count(role)
+            if count == target_count:
+                return True
+
+            remaining_s = deadline - self.clock.monotonic()
+            if remaining_s <= 0:
+                self.__log.info(f"Deadline reached with {count}/{target_count} {role} pods running.")
+                return False
+
+            self.__log.info(f"Waiting for {role} pods to start...{count}/{target_count}")
+            self.clock.sleep(min(backoff_s, remaining_s))
+            backoff_s = min(backoff_s * 2, self.max_backoff_s)
@@ -0,0 +1,213 @@
+"""
+Replay recorded throughput samples (see SampleRecorder) through the stress/soak test decision logic,
+e.g. to evaluate a change in window size or tolerance against previous runs without a cluster.
+
+  PYTHONPATH=`pwd` python fs/replay.py log/run_AD56F8
+"""
+import argparse
+import glob
+import logging
+import os
+import time
+from collections import defaultdict, namedtuple
+
+from fs.clock import ManualClock
+from fs.run_journal import RunJournal, EVENT_CONFIGURATIONS
+from fs.sample_recorder import read_samples
+from fs.soak_test_process import SoakTestProcess
+from fs.stress_test_process import StressTestProcess
+from fs.utils import addlogger
+
+# cap on the time between consecutive samples, e.g. when a producer count was revisited much later
+MAX_SAMPLE_GAP_S = 30
+
+# trajectory: list of (time, producer count), metrics: list of the metrics written, decisions: per sample
+ReplayResult = namedtuple("ReplayResult", ["trajectory", "metrics", "decisions", "samples", "exhausted", "elapsed_s",
+                                           "producer_count"])
+
+
+def load_sample_streams(prefix, source=None):
+    """
+    The recorded samples, grouped by the producer count reported with them
+
+    :param prefix: as per SampleRecorder
+    :param source: only include samples from this test (e.g. SOURCE_STRESS), otherwise all
+    :return: dict of producer count -> list of (timestamp, consumer_id, throughput), in time order
+    """
+    columns, consumer_ids = read_samples(prefix)
+
+    streams = defaultdict(list)
+    for i in columns["timestamp"].argsort(kind="stable"):
+        if source is None or columns["source"][i] == source:
+            streams[int(columns["producer_count"][i])].append(
+                (float(columns["timestamp"][i]), consumer_ids[columns["consumer"][i]], float(columns["throughput"][i])))
+
+    return dict(streams)
+
+
+class ReplayScaler:
+    """
+    Producer scaler which applies scale requests immediately, recording the producer count trajectory
+    """
+    def __init__(self, clock, producer_count):
+        self.clock = clock
+        self.producer_count = producer_count
+        self.trajectory = [(clock.time(), producer_count)]
+
+    def scale_producers(self, producer_count):
+        self.producer_count = producer_count
+        self.trajectory.append((self.clock.time(), producer_count))
+
+    def get_producer_count(self):
+        return self.producer_count
+
+
+class ReplayMixin:
+    """
+    Mixed in ahead of a throughput process class: metrics, details and sample decisions are kept, rather than written
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = []
+        self.details = []
+        self.decisions = []
+
+    def write_metrics(self, configuration, data):
+        self.metrics.append(data)
+
+    def write_details(self, configuration, data):
+        self.details.append(data)
+
+    def record_sample(self, data, decision):
+        self.decisions.append(decision)
+
+
+def replay(process_class, configuration, streams, producer_count=None, start_time=0.0):
+    """
+    Feed the recorded samples for the current producer count to the process, one at a time,
+    with its clock following the recorded sample times, until the process says stop
+    (or there are no more samples for the producer count it asks for).
+
+    :param process_class: e.g. StressTestProcess (or a sub-class with a different policy)
+    :param configuration:
+    :param streams: as per load_sample_streams
+    :param producer_count: initially running (default: the configuration start_producer_count)
+    :param start_time: of the clock
+    :return: ReplayResult
+    """
+    replay_class = type("Replay" + process_class.__name__, (ReplayMixin, process_class), {})
+    process = replay_class(configuration, None)
+
+    clock = ManualClock(start_time)
+    process.clock = clock
+
+    if producer_count is None:
+        producer_count = configuration["start_producer_count"]
+    scaler = ReplayScaler(clock, producer_count)
+    process.attach_scaler(scaler)
+
+    process.on_start()
+
+    # producer count -> index of the next sample
+    cursors = defaultdict(int)
+    samples = 0
+    exhausted = False
+    previous_timestamp = None
+    previous_producer_count = None
+    while not process.is_stopped():
+        producer_count = scaler.producer_count
+        stream = streams.get(producer_count, [])
+        if cursors[producer_count] >= len(stream):
+            exhausted = True
+            break
+
+        timestamp, consumer_id, throughput = stream[cursors[producer_count]]
+        cursors[producer_count] += 1
+
+        # follow the recorded time between samples (the new producers start immediately)
+        if previous_timestamp is not None and previous_producer_count == producer_count:
+            clock.advance(min(timestamp - previous_timestamp, MAX_SAMPLE_GAP_S))
+        previous_timestamp = timestamp
+        previous_producer_count = producer_count
+
+        samples += 1
+        data = {"consumer_id": consumer_id, "throughput": throughput, "producer_count": producer_count,
+                "timestamp": clock.time()}
+        if process.process_samples([data]):
+            break
+
+    process.complete()
+
+    return ReplayResult(scaler.trajectory, process.metrics, process.decisions, samples, exhausted,
+                        clock.time() - start_time, scaler.producer_count)
+
+
+@addlogger
+class ConfigurationReplay:
+    """
+    Replay the stress test and then the soak test of a recorded configuration
+    """
+    def __init__(self, stress_test_class=StressTestProcess, soak_test_class=SoakTestProcess):
+        self.stress_test_class = stress_test_class
+        self.soak_test_class = soak_test_class
+
+    def run(self, prefix, configuration):
+        """
+        :return: (stress ReplayResult, soak ReplayResult)
+        """
+        streams = load_sample_streams(prefix)
+
+        stress = replay(self.stress_test_class, configuration, streams)
+        soak = replay(self.soak_test_class, configuration, streams, producer_count=stress.producer_count,
+                      start_time=stress.elapsed_s)
+
+        return stress, soak
+
+
+def get_run_configurations(run_directory):
+    """
+    :return: dict of configuration_uid -> configuration, from the run journal
+    """
+    run_uid = os.path.basename(os.path.normpath(run_directory))
+    records = RunJournal.read(os.path.join(run_directory, f"{run_uid}_journal.jsonl"))
+
+    configurations = {}
+    for record in records:
+        if record["event"] == EVENT_CONFIGURATIONS:
+            for sequence_number, configuration in enumerate(record["configurations"], start=1):
+                configurations[configuration["configuration_uid"]] = dict(configuration, sequence_number=sequence_number)
+
+    return configurations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded samples through the stress/soak tests")
+    parser.add_argument("run_directory", help="e.g. log/run_AD56F8")
+    parser.add_argument("--verbose", action="store_true", help="log every decision")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    configurations = get_run_configurations(args.run_directory)
+    for path in sorted(glob.glob(os.path.join(args.run_directory, "*_samples_*.timestamp.bin"))):
+        prefix = path[:-len(".timestamp.bin")]
+        configuration_uid = os.path.basename(prefix).split("_samples_")[0]
+        if configuration_uid not in configurations:
+            print(f"{configuration_uid}: not in the run journal, skipping")
+            continue
+
+        start_s = time.monotonic()
+        stress, soak = ConfigurationReplay().run(prefix, configurations[configuration_uid])
+        elapsed_s = time.monotonic() - start_s
+
+        print(f"{configuration_uid}: replayed {stress.samples + soak.samples} samples, "
+              f"{stress.elapsed_s + soak.elapsed_s:.0f}s in {elapsed_s:.2f}s")
+        print(f"  producer trajectory: {[count for _, count in stress.trajectory + soak.trajectory[1:]]}")
+        for metrics in stress.metrics + soak.metrics:
+            print(f"  {metrics}")
+        if stress.exhausted or soak.exhausted:
+            print("  note - ran out of recorded samples for the requested producer count")
+
+
+if __name__ == "__main__":
+    main()
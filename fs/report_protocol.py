@@ -0,0 +1,54 @@
+"""
+Consumer throughput report bodies, as put on the consumer throughput queue.
+
+Legacy (one sample per job):
+  {"consumer_id": "consumer-0", "throughput": 75.1, "producer_count": 10}
+
+Version 1 (many timestamped samples per job), samples as [timestamp (s), throughput (MB/s), producer count]:
+  {"v": 1, "c": "consumer-0", "s": [[1600000000.0, 75.1, 10], [1600000005.0, 74.9, 10]]}
+"""
+import json
+
+REPORT_VERSION = 1
+
+# the versions decode_report() understands (besides the legacy body)
+SUPPORTED_VERSIONS = [1]
+
+
+def encode_report(consumer_id, samples):
+    """
+    :param consumer_id:
+    :param samples: list of (timestamp, throughput, producer_count)
+    :return: report body (str)
+    """
+    return json.dumps({"v": REPORT_VERSION, "c": consumer_id,
+                       "s": [[timestamp, throughput, producer_count] for timestamp, throughput, producer_count in samples]},
+                      separators=(",", ":"))
+
+
+def decode_report(body):
+    """
+    :param body: legacy or versioned report body (str or bytes)
+    :return: list of samples, each a dict of consumer_id, throughput, producer_count (and timestamp, if reported)
+    :raises ValueError: if the body is not a report (or is of an unsupported version)
+    """
+    report = json.loads(body)
+    if not isinstance(report, dict):
+        raise ValueError(f"Expected a report object, not {type(report).__name__}")
+
+    version = report.get("v")
+    if version is None:
+        # legacy, a single sample
+        if "consumer_id" not in report or "throughput" not in report or "producer_count" not in report:
+            raise ValueError(f"Incomplete legacy report {report}")
+        return [report]
+
+    if version not in SUPPORTED_VERSIONS:
+        raise ValueError(f"Unsupported report version {version}")
+
+    try:
+        consumer_id = report["c"]
+        return [{"consumer_id": consumer_id, "throughput": throughput, "producer_count": producer_count,
+                 "timestamp": timestamp} for timestamp, throughput, producer_count in report["s"]]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Malformed report, {e}")
@@ -0,0 +1,84 @@
+from array import array
+
+
+class RollingWindow:
+    """
+    The last `size` values, in a fixed-size ring buffer, with a running sum and sum of squares:
+    appending and the mean/variance are constant time and allocate nothing.
+    """
+    __slots__ = ["size", "values", "count", "index", "total", "total_squares"]
+
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError(f"Window size must be at least 1, not {size}")
+
+        self.size = size
+        self.values = array('d', bytes(8 * size))
+        self.count = 0
+        # where the next value goes
+        self.index = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+
+    def __len__(self):
+        return self.count
+
+    def is_full(self):
+        return self.count == self.size
+
+    def append(self, value):
+        if self.count == self.size:
+            oldest = self.values[self.index]
+            self.total -= oldest
+            self.total_squares -= oldest * oldest
+        else:
+            self.count += 1
+
+        self.values[self.index] = value
+        self.total += value
+        self.total_squares += value * value
+
+        self.index += 1
+        if self.index == self.size:
+            self.index = 0
+            # recompute the sums once per revolution, so that rounding errors don't accumulate
+            self.total = 0.0
+            self.total_squares = 0.0
+            for v in self.values:
+                self.total += v
+                self.total_squares += v * v
+
+    def mean(self):
+        if self.count == 0:
+            raise ValueError("Mean of an empty window")
+
+        return self.total / self.count
+
+    def variance(self):
+        """
+        :return: sample variance
+        """
+        if self.count < 2:
+            raise ValueError("Variance requires at least two values")
+
+        variance = (self.total_squares - self.total * self.total / self.count) / (self.count - 1)
+        return max(variance, 0.0)
+
+    def last(self):
+        """
+        :return: values, oldest first
+        """
+        if self.count < self.size:
+            return list(self.values[0:self.count])
+
+        return list(self.values[self.index:]) + list(self.values[0:self.index])
+
+    def resized(self, size):
+        """
+        :return: a new window of the given size, holding the most recent values of this one
+        """
+        window = RollingWindow(size)
+        for value in self.last()[-size:]:
+            window.append(value)
+
+        return window
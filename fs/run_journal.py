@@ -0,0 +1,55 @@
+import json
+import os
+import time
+
+# journal record types
+EVENT_CONFIGURATIONS = "configurations"
+EVENT_PHASE = "phase"
+EVENT_CONFIGURATION_COMPLETED = "configuration_completed"
+EVENT_RUN_COMPLETED = "run_completed"
+
+
+class ResumeError(Exception):
+    """
+    An interrupted run cannot be resumed, e.g. it has no journal
+    """
+    pass
+
+
+class RunJournal:
+    """
+    Append-only journal of a run (one JSON record per line), kept alongside the run log.
+
+    Each record is flushed to disk before record() returns, so the journal survives the controller dying.
+    """
+    def __init__(self, path):
+        self.path = path
+
+        # terminate a record truncated by a crash, so that new records start on a new line
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb+") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def record(self, event, **fields):
+        record = dict({"event": event, "time": time.time()}, **fields)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def read(path):
+        """
+        :return: list of records (a truncated last line is ignored)
+        """
+        records = []
+        with open(path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass
+
+        return records
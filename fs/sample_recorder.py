@@ -0,0 +1,138 @@
+import os
+from array import array
+
+import numpy as np
+
+# what was decided about each sample
+DECISION_NONE = 0
+DECISION_DISCARDED_PRODUCER_COUNT = 1
+DECISION_DISCARDED_INITIAL = 2
+DECISION_OK = 3
+DECISION_BELOW_TOLERANCE = 4
+DECISION_STOP = 5
+DECISION_SOAK = 6
+
+DECISION_NAMES = {DECISION_NONE: "none", DECISION_DISCARDED_PRODUCER_COUNT: "discarded_producer_count",
+                  DECISION_DISCARDED_INITIAL: "discarded_initial", DECISION_OK: "ok",
+                  DECISION_BELOW_TOLERANCE: "below_tolerance", DECISION_STOP: "stop", DECISION_SOAK: "soak"}
+
+# which test recorded the sample
+SOURCE_UNKNOWN = 0
+SOURCE_STRESS = 1
+SOURCE_SOAK = 2
+
+# column -> array typecode (and the equivalent NumPy dtype when read back)
+COLUMNS = {"timestamp": ("d", np.float64), "consumer": ("I", np.uint32), "producer_count": ("H", np.uint16),
+           "throughput": ("d", np.float64), "decision": ("B", np.uint8), "source": ("B", np.uint8)}
+
+# samples buffered in memory before they are appended to the column files
+DEFAULT_BUFFER_SIZE = 4096
+
+
+def get_column_path(prefix, column):
+    return f"{prefix}.{column}.bin"
+
+
+def get_consumers_path(prefix):
+    return f"{prefix}.consumers"
+
+
+class SampleRecorder:
+    """
+    Append-only columnar log of the raw throughput samples: one binary file per column,
+    with the consumer ids dictionary encoded (in a text file, one id per line, in index order).
+
+    Samples are buffered in typed arrays and appended to the files in blocks.
+    Files are only opened on the first write, so a recorder can be created before forking.
+    """
+    def __init__(self, prefix, buffer_size=DEFAULT_BUFFER_SIZE):
+        """
+        :param prefix: path prefix of the files, e.g. log/run_AD56F8/B1C2D3_1_samples
+        :param buffer_size:
+        """
+        self.prefix = prefix
+        self.buffer_size = buffer_size
+        self.buffers = {column: array(typecode) for column, (typecode, _) in COLUMNS.items()}
+
+        # consumer_id -> index
+        self.consumers = None
+        self.new_consumers = []
+
+    def load_consumers(self):
+        self.consumers = {}
+        path = get_consumers_path(self.prefix)
+        if os.path.exists(path):
+            # e.g. written by the stress test, for the same configuration
+            with open(path) as f:
+                for line in f:
+                    self.consumers[line.rstrip("\n")] = len(self.consumers)
+
+    def record(self, timestamp, consumer_id, producer_count, throughput, decision, source=SOURCE_UNKNOWN):
+        if self.consumers is None:
+            self.load_consumers()
+
+        consumer = self.consumers.get(consumer_id)
+        if consumer is None:
+            consumer = self.consumers[consumer_id] = len(self.consumers)
+            self.new_consumers.append(consumer_id)
+
+        buffers = self.buffers
+        buffers["timestamp"].append(timestamp)
+        buffers["consumer"].append(consumer)
+        buffers["producer_count"].append(producer_count)
+        buffers["throughput"].append(throughput)
+        buffers["decision"].append(decision)
+        buffers["source"].append(source)
+
+        if len(buffers["timestamp"]) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.buffers["timestamp"]) == 0:
+            return
+
+        # the dictionary first, so that every consumer index written has an id
+        if len(self.new_consumers) > 0:
+            with open(get_consumers_path(self.prefix), "a") as f:
+                for consumer_id in self.new_consumers:
+                    f.write(str(consumer_id) + "\n")
+            self.new_consumers = []
+
+        for column, buffer in self.buffers.items():
+            with open(get_column_path(self.prefix, column), "ab") as f:
+                buffer.tofile(f)
+            del buffer[:]
+
+    def close(self):
+        self.flush()
+
+
+def read_samples(prefix):
+    """
+    :param prefix: as per SampleRecorder
+    :return: (dict of column -> NumPy array, list of consumer ids indexed by the consumer column)
+    """
+    with open(get_consumers_path(prefix)) as f:
+        consumer_ids = [line.rstrip("\n") for line in f]
+
+    columns = {column: np.fromfile(get_column_path(prefix, column), dtype=dtype)
+               for column, (_, dtype) in COLUMNS.items()}
+
+    # should a write have been interrupted, only keep the complete rows
+    rows = min(len(values) for values in columns.values())
+    columns = {column: values[0:rows] for column, values in columns.items()}
+
+    return columns, consumer_ids
+
+
+def read_samples_frame(prefix):
+    """
+    :return: pandas DataFrame of the samples, with consumer_id and decision as categories
+    """
+    import pandas as pd
+
+    columns, consumer_ids = read_samples(prefix)
+    frame = pd.DataFrame(columns)
+    frame["consumer_id"] = pd.Categorical.from_codes(frame.pop("consumer"), categories=consumer_ids)
+    frame["decision"] = frame["decision"].map(DECISION_NAMES).astype("category")
+    return frame
@@ -0,0 +1,95 @@
+import glob
+import os
+import statistics
+from collections import defaultdict
+
+from fs.run_journal import RunJournal, EVENT_PHASE
+from fs.transitions import classify_transition, NODE_POOL_KEYS, KAFKA_KEYS, RESCALE_CONSUMERS, REDEPLOY_KAFKA, \
+    REBUILD_NODE_POOLS
+from fs.utils import addlogger
+
+# rough transition times (teardown + provision + setup) when there is no history
+DEFAULT_TRANSITION_COSTS_S = {RESCALE_CONSUMERS: 120, REDEPLOY_KAFKA: 480, REBUILD_NODE_POOLS: 1500}
+
+
+@addlogger
+class TransitionCostModel:
+    """
+    Cost (seconds) of each kind of transition between configurations,
+    learned from the phase durations recorded in the run journals.
+    """
+    def __init__(self, costs=None):
+        self.costs = dict(DEFAULT_TRANSITION_COSTS_S)
+        self.costs.update(costs or {})
+
+    @classmethod
+    def from_journals(cls, log_directory):
+        """
+        :param log_directory: containing the run_* directories
+        :return: TransitionCostModel
+        """
+        # (phase, transition) -> durations
+        durations = defaultdict(list)
+        for path in glob.glob(os.path.join(log_directory, "run_*", "*_journal.jsonl")):
+            for record in RunJournal.read(path):
+                if record.get("event") == EVENT_PHASE and "transition" in record and record.get("ok", True):
+                    durations[(record["phase"], record["transition"])].append(record["duration_s"])
+
+        # a transition costs the sum of its (mean) phase durations
+        costs = {}
+        for transition in DEFAULT_TRANSITION_COSTS_S:
+            phases = [statistics.mean(d) for (phase, t), d in durations.items() if t == transition]
+            if len(phases) > 0:
+                costs[transition] = sum(phases)
+
+        model = cls(costs)
+        model.__log.info(f"Transition costs (s): {model.costs}, learned: {sorted(costs)}")
+        return model
+
+    def cost(self, transition):
+        return self.costs[transition]
+
+    def total_cost(self, configurations):
+        """
+        Total transition time to run the configurations in the given order,
+        including the setup of the first and the teardown of the last
+        """
+        total = 0
+        previous = None
+        for configuration in configurations + [None]:
+            if previous is not None or configuration is not None:
+                total += self.cost(classify_transition(previous, configuration))
+            previous = configuration
+
+        return total
+
+
+def group_by(configurations, keys):
+    """
+    Stable grouping: configurations with equal values for the keys are made consecutive,
+    groups ordered by first appearance
+    """
+    groups = {}
+    for configuration in configurations:
+        groups.setdefault(tuple(configuration.get(key) for key in keys), []).append(configuration)
+
+    return list(groups.values())
+
+
+def schedule(configurations):
+    """
+    Order the configurations to minimise the total transition cost.
+
+    Since a node pool rebuild includes a kafka redeploy (which includes a consumer rescale),
+    grouping by the node pool keys and then by the kafka keys gives the fewest of each kind of transition,
+    whatever the costs. Otherwise the original order is kept.
+
+    :param configurations:
+    :return: list of configurations
+    """
+    ordered = []
+    for node_pool_group in group_by(configurations, NODE_POOL_KEYS):
+        for kafka_group in group_by(node_pool_group, KAFKA_KEYS):
+            ordered.extend(kafka_group)
+
+    return ordered
@@ -0,0 +1,144 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from fs.clock import system_clock
+from fs.utils import addlogger
+
+
+class SetupStep:
+    """
+    A step in the setup pipeline.
+
+    The action returns False on failure (anything else, including None, is success).
+    """
+    def __init__(self, name, action, depends_on=(), on_failure=None):
+        """
+        :param name:
+        :param action: callable
+        :param depends_on: names of the steps which must succeed before this step starts
+        :param on_failure: optional callable, run if the action fails
+        """
+        self.name = name
+        self.action = action
+        self.depends_on = tuple(depends_on)
+        self.on_failure = on_failure
+
+
+@addlogger
+class SetupPipeline:
+    """
+    Run setup steps as a dependency graph: each step starts as soon as all of its prerequisites have succeeded.
+
+    If a step fails, no further steps are started and the pipeline fails once the running steps finish.
+    """
+    def __init__(self, steps, clock=system_clock):
+        self.clock = clock
+        self.steps = {}
+        for step in steps:
+            if step.name in self.steps:
+                raise ValueError(f"Duplicate step {step.name}")
+            self.steps[step.name] = step
+
+        for step in steps:
+            for dependency in step.depends_on:
+                if dependency not in self.steps:
+                    raise ValueError(f"Step {step.name} depends on unknown step {dependency}")
+
+        self.check_acyclic()
+
+        # name -> (start, finish), relative to the start of the pipeline
+        self.timings = {}
+
+    def check_acyclic(self):
+        visited = set()
+        visiting = set()
+
+        def visit(name):
+            if name in visiting:
+                raise ValueError(f"Cyclic dependency at step {name}")
+            if name not in visited:
+                visiting.add(name)
+                for dependency in self.steps[name].depends_on:
+                    visit(dependency)
+                visiting.remove(name)
+                visited.add(name)
+
+        for name in self.steps:
+            visit(name)
+
+    def run_step(self, step, start_time):
+        started = self.clock.monotonic() - start_time
+        self.__log.info(f"Step {step.name} started.")
+
+        try:
+            ok = step.action() is not False
+        except Exception as e:
+            self.__log.error(f"Step {step.name} raised {e!r}")
+            ok = False
+
+        if not ok and step.on_failure is not None:
+            step.on_failure()
+
+        finished = self.clock.monotonic() - start_time
+        self.timings[step.name] = (started, finished)
+        self.__log.info(f"Step {step.name} {'completed' if ok else 'FAILED'} in {finished - started:.1f}s.")
+        return ok
+
+    def run(self):
+        """
+        :return: True if every step succeeded
+        """
+        start_time = self.clock.monotonic()
+        succeeded = set()
+        failed = []
+        pending = dict(self.steps)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=len(self.steps)) as executor:
+            while True:
+                if len(failed) == 0:
+                    for name, step in list(pending.items()):
+                        if all(dependency in succeeded for dependency in step.depends_on):
+                            del pending[name]
+                            running[executor.submit(self.run_step, step, start_time)] = name
+
+                if len(running) == 0:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    if future.result():
+                        succeeded.add(name)
+                    else:
+                        failed.append(name)
+
+        elapsed = self.clock.monotonic() - start_time
+        if len(failed) > 0:
+            self.__log.info(f"Setup failed at step(s) {failed} after {elapsed:.1f}s, not started: {list(pending)}")
+            return False
+
+        path = self.critical_path()
+        self.__log.info(f"Setup completed in {elapsed:.1f}s, critical path: " +
+                        " -> ".join([f"{name} ({self.timings[name][1] - self.timings[name][0]:.1f}s)" for name in path]))
+        return True
+
+    def critical_path(self):
+        """
+        The chain of steps which determined the overall setup time:
+        from the last step to finish, back through the prerequisite which finished last
+
+        :return: list of step names, in order
+        """
+        if len(self.timings) == 0:
+            return []
+
+        name = max(self.timings, key=lambda n: self.timings[n][1])
+        path = [name]
+        while True:
+            dependencies = [d for d in self.steps[name].depends_on if d in self.timings]
+            if len(dependencies) == 0:
+                break
+            name = max(dependencies, key=lambda n: self.timings[n][1])
+            path.append(name)
+
+        return list(reversed(path))
@@ -0,0 +1,282 @@
+"""
+Pool of long-lived bash sessions for running the scripts, rather than a new /bin/bash -e per call.
+
+Each session is started once (sourcing the GCP credentials) and then runs one script at a time,
+sourced in a subshell of its own (so a script cannot change the session) with set -e, as per /bin/bash -e.
+$0 is set to the script (BASH_SOURCE is set by source), so the scripts behave as if run directly,
+e.g. the deploy scripts outside this repo. The subshell is a fork of the session, so no bash is started
+and the session's environment is already in place.
+The script's stdout and stderr are each framed by a marker unique to the call, the stdout marker
+carrying the exit code. A call which times out has its session killed (with any kubectl it started);
+the pool starts a new session when next needed.
+
+  result = shell_pool.run(["./scale-producers.sh", "3"], SCRIPT_DIR, timeout_s=60)
+
+stdout can also be passed on line by line as it arrives, e.g. to log a long deploy as it runs:
+
+  result = shell_pool.run(["./deploy.sh"], KAFKA_DEPLOY_DIR, on_stdout_line=log.info)
+"""
+import os
+import queue
+import selectors
+import shlex
+import signal
+import subprocess
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from fs.streaming_stats import StreamingStats
+from fs.utils import SCRIPT_DIR, addlogger
+
+# sessions running at once, beyond which callers wait for one to be free
+DEFAULT_POOL_SIZE = 4
+
+# sourced once by each session (if present)
+DEFAULT_INIT_SCRIPTS = [os.path.join(SCRIPT_DIR, "export-gcp-credentials.sh")]
+
+# exit_code is None if the call timed out (or the session died)
+ShellResult = namedtuple("ShellResult", ["exit_code", "stdout", "stderr", "duration_s", "timed_out"])
+
+
+class LineStream:
+    """
+    Passes the stdout of a call on line by line as it arrives, up to the call's marker
+    """
+    def __init__(self, callback, marker):
+        """
+        :param callback: called with each line (without its newline)
+        :param marker: start of the marker line
+        """
+        self.callback = callback
+        self.marker = marker
+        self.start = 0
+        self.blank_lines = 0
+        self.done = False
+
+    def emit(self, line):
+        # note - blank lines are held back, the last one before the marker is the marker's own newline
+        for _ in range(self.blank_lines):
+            self.callback("")
+        self.blank_lines = 0
+        self.callback(line.decode("UTF-8", "replace"))
+
+    def feed(self, stdout):
+        while not self.done:
+            newline = stdout.find(b"\n", self.start)
+            if newline < 0:
+                return
+
+            line = bytes(stdout[self.start:newline])
+            self.start = newline + 1
+            if line.startswith(self.marker):
+                self.blank_lines = max(0, self.blank_lines - 1)
+                for _ in range(self.blank_lines):
+                    self.callback("")
+                self.done = True
+            elif len(line) == 0:
+                self.blank_lines += 1
+            else:
+                self.emit(line)
+
+    def close(self, stdout):
+        """
+        The call ended without its marker (timed out, or the session died)
+        """
+        if not self.done and self.start < len(stdout):
+            self.emit(bytes(stdout[self.start:]))
+        self.done = True
+
+
+class ShellSession:
+    """
+    A bash session, running one call at a time
+    """
+    def __init__(self, init_scripts=DEFAULT_INIT_SCRIPTS):
+        self.process = subprocess.Popen(["/bin/bash", "--noprofile", "--norc"], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+        self.alive = True
+
+        for script in init_scripts:
+            path = shlex.quote(os.path.abspath(script))
+            self.send(f"[ -f {path} ] && source {path}\n")
+
+    def send(self, text):
+        self.process.stdin.write(text.encode("UTF-8"))
+        self.process.stdin.flush()
+
+    def run(self, args, working_directory, timeout_s=None, on_stdout_line=None):
+        """
+        :param args: script (relative to the working directory) and its arguments
+        :param working_directory:
+        :param timeout_s: None to wait for as long as it takes
+        :param on_stdout_line: called with each line of stdout as it arrives (optional)
+        :return: ShellResult
+        """
+        start = time.monotonic()
+        token = uuid.uuid4().hex
+        # note - source looks a bare name up on the PATH, a script is run from the working directory
+        script = args[0] if "/" in args[0] else "./" + args[0]
+        command = " ".join(shlex.quote(arg) for arg in [script] + list(args[1:]))
+
+        # note - a newline ahead of each marker, in case the output does not end with one
+        self.send(f"(\ncd -- {shlex.quote(os.path.abspath(working_directory))} || exit 1\n"
+                  f"BASH_ARGV0={shlex.quote(script)}\nset -e\nsource {command}\n) </dev/null\n"
+                  f"printf '\\n{token} %d\\n' $?; printf '\\n{token}\\n' >&2\n")
+
+        stream = None if on_stdout_line is None else LineStream(on_stdout_line, f"{token} ".encode("UTF-8"))
+        stdout_marker = f"\n{token} ".encode("UTF-8")
+        stderr_marker = f"\n{token}\n".encode("UTF-8")
+        stdout = bytearray()
+        stderr = bytearray()
+        exit_code = None
+        stdout_done = stderr_done = False
+
+        deadline = None if timeout_s is None else start + timeout_s
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.process.stdout, selectors.EVENT_READ, stdout)
+            selector.register(self.process.stderr, selectors.EVENT_READ, stderr)
+
+            while not (stdout_done and stderr_done):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.kill()
+                    if stream is not None:
+                        stream.close(stdout)
+                    break
+
+                for key, _ in selector.select(remaining):
+                    data = os.read(key.fileobj.fileno(), 65536)
+                    if len(data) == 0:
+                        # the session died
+                        self.kill()
+                        if stream is not None:
+                            stream.close(stdout)
+                        return ShellResult(None, stdout.decode("UTF-8", "replace"), stderr.decode("UTF-8", "replace"),
+                                           time.monotonic() - start, False)
+                    key.data.extend(data)
+
+                if stream is not None:
+                    stream.feed(stdout)
+                if not stdout_done:
+                    end = stdout.find(stdout_marker)
+                    if end >= 0 and stdout.find(b"\n", end + len(stdout_marker)) >= 0:
+                        exit_code = int(stdout[end + len(stdout_marker):].strip())
+                        del stdout[end:]
+                        stdout_done = True
+                if not stderr_done and stderr.endswith(stderr_marker):
+                    del stderr[-len(stderr_marker):]
+                    stderr_done = True
+
+        return ShellResult(exit_code, stdout.decode("UTF-8", "replace"), stderr.decode("UTF-8", "replace"),
+                           time.monotonic() - start, exit_code is None)
+
+    def kill(self):
+        """
+        Kill the session and anything it started
+        """
+        self.alive = False
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+        self.close_pipes()
+
+    def close_pipes(self):
+        for pipe in [self.process.stdin, self.process.stdout, self.process.stderr]:
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+
+@addlogger
+class ShellPool:
+    """
+    Sessions are started on demand, up to the pool size, and kept for the next call.
+    Records the latency of each script (see summary).
+
+    The pool is fork-safe: a forked child starts sessions of its own (and closes its copies of the pipes
+    of the parent's sessions, idle or in use).
+    """
+    def __init__(self, size=DEFAULT_POOL_SIZE, init_scripts=DEFAULT_INIT_SCRIPTS):
+        self.size = size
+        self.init_scripts = init_scripts
+        self._reset()
+
+        os.register_at_fork(after_in_child=self._reset_in_child)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._available = threading.Semaphore(self.size)
+        # every live session, idle or in use
+        self._sessions = set()
+
+        # script -> StreamingStats of the call durations (s)
+        self.latency = {}
+        self.sessions_started = 0
+
+    def _reset_in_child(self):
+        # note - the sessions belong to the parent, only our copies of their pipes are closed
+        for session in list(self._sessions):
+            session.close_pipes()
+        self._reset()
+
+    def run(self, args, working_directory, timeout_s=None, on_stdout_line=None):
+        """
+        :param args: script (relative to the working directory) and its arguments
+        :param working_directory:
+        :param timeout_s: None to wait for as long as it takes
+        :param on_stdout_line: called with each line of stdout as it arrives (optional)
+        :return: ShellResult
+        """
+        self._available.acquire()
+        try:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                session = ShellSession(self.init_scripts)
+                with self._lock:
+                    self._sessions.add(session)
+                    self.sessions_started += 1
+
+            result = session.run(args, working_directory, timeout_s, on_stdout_line)
+            if session.alive:
+                self._idle.put(session)
+            else:
+                with self._lock:
+                    self._sessions.discard(session)
+        finally:
+            self._available.release()
+
+        if result.timed_out:
+            self.__log.warning(f"Warning: {args} timed out after {timeout_s}s.")
+
+        script = os.path.basename(args[0])
+        with self._lock:
+            stats = self.latency.get(script)
+            if stats is None:
+                stats = self.latency[script] = StreamingStats()
+            stats.add(result.duration_s)
+
+        return result
+
+    def summary(self):
+        """
+        :return: dict of script -> latency summary (s)
+        """
+        with self._lock:
+            return {script: stats.summary() for script, stats in self.latency.items()}
+
+    def close(self):
+        while not self._idle.empty():
+            session = self._idle.get_nowait()
+            session.kill()
+            with self._lock:
+                self._sessions.discard(session)
+
+
+shell_pool = ShellPool()
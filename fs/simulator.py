@@ -0,0 +1,321 @@
+"""
+Simulated Kafka cluster, for running whole controller configuration matrices locally in fast-forwarded time,
+e.g. to regression test the control logic or benchmark the controller overhead.
+
+  PYTHONPATH=`pwd` python benchmarks/bench_simulated_controller.py --controller consumer
+"""
+import json
+import random
+from collections import deque
+
+from fs.clock import ManualClock
+from fs.cluster_snapshot import ClusterSnapshot
+from fs.queue_backend import InMemoryQueue
+from fs.report_protocol import encode_report
+from fs.utils import DEFAULT_THROUGHPUT_MB_S, PRODUCER_CONSUMER_NAMESPACE, KAFKA_NAMESPACE, CONSUMER_THROUGHPUT_TUBE, \
+    addlogger
+
+# throughput model parameters, roughly as per n1-standard-8 brokers with pd-ssd and n1-standard-2 consumers
+DEFAULT_MODEL_PARAMETERS = {
+    # offered load of each producer
+    "producer_mbps": DEFAULT_THROUGHPUT_MB_S,
+    # disk write throughput of a broker
+    "broker_disk_mbps": 350,
+    # network egress of a broker, shared by the consumers
+    "broker_egress_mbps": 1000,
+    # maximum throughput of a single consumer
+    "consumer_mbps": 250,
+    # partitions per broker needed to use all of its disk throughput
+    "saturation_partitions_per_broker": 3,
+    # per batch and per message overheads
+    "batch_overhead_bytes": 1000000,
+    "message_overhead_kb": 8,
+    # relative standard deviation of each sample
+    "noise": 0.03,
+}
+
+# simulated duration of the cluster operations (seconds)
+DEFAULT_OPERATION_DURATIONS_S = {"provision_node_pools": 300, "unprovision_node_pools": 180, "deploy": 30,
+                                 "scale": 5, "delete_namespace": 20}
+
+# consumers report their throughput every 5s
+DEFAULT_REPORTING_INTERVAL_S = 5
+
+# time for a new producer pod to start sending
+DEFAULT_PRODUCER_START_DELAY_S = 10
+
+# a simulated stress/soak test is stopped if it has not finished after this long
+MAX_SIMULATED_TEST_S = 12 * 60 * 60
+
+
+class ThroughputModel:
+    """
+    Per consumer throughput as a function of the brokers, partitions, replication factor, batch size,
+    message size, producers and consumers: the offered load, limited by the brokers' disk throughput
+    (divided by the replication factor, and reduced by too few partitions and the batch/message overheads),
+    the share of the brokers' egress and the consumer's own maximum.
+    """
+    def __init__(self, parameters=None, seed=0):
+        self.parameters = dict(DEFAULT_MODEL_PARAMETERS, **(parameters or {}))
+        self.random = random.Random(seed)
+
+    def expected_consumer_mbps(self, brokers, partitions, replication_factor, batch_size_bytes, message_size_kb,
+                               producers, consumers):
+        p = self.parameters
+        if brokers == 0 or consumers == 0:
+            return 0.0
+
+        offered = producers * p["producer_mbps"]
+
+        batch_efficiency = batch_size_bytes / (batch_size_bytes + p["batch_overhead_bytes"])
+        message_efficiency = message_size_kb / (message_size_kb + p["message_overhead_kb"])
+        partition_efficiency = min(1.0, partitions / (brokers * p["saturation_partitions_per_broker"]))
+        ingest = (brokers * p["broker_disk_mbps"] / replication_factor) * batch_efficiency * message_efficiency * \
+            partition_efficiency
+
+        egress_share = brokers * p["broker_egress_mbps"] / consumers
+
+        return min(offered, ingest, egress_share, p["consumer_mbps"])
+
+    def sample_consumer_mbps(self, *args):
+        expected = self.expected_consumer_mbps(*args)
+        return max(0.0, self.random.gauss(expected, expected * self.parameters["noise"]))
+
+
+class SimulatedQueue(InMemoryQueue):
+    """
+    In-memory consumer throughput queue. The cluster publishes on the same thread as the test process
+    reserves, so a reserve never waits.
+    """
+    def __init__(self, server=None, use=CONSUMER_THROUGHPUT_TUBE, watch=CONSUMER_THROUGHPUT_TUBE, blocking=False):
+        super().__init__(server, use, watch, blocking)
+
+
+@addlogger
+class SimulatedCluster:
+    """
+    State of the simulated cluster. Also the producer scaler (see BaseProcess.attach_scaler) of the test processes.
+    """
+    def __init__(self, clock, queue, model=None, reporting_interval_s=DEFAULT_REPORTING_INTERVAL_S,
+                 producer_start_delay_s=DEFAULT_PRODUCER_START_DELAY_S, samples_per_report=1):
+        """
+        :param samples_per_report: 1 for the legacy report body, otherwise each consumer reports
+                                   this many timestamped samples at a time (see fs.report_protocol)
+        """
+        self.clock = clock
+        self.queue = queue
+        self.model = model or ThroughputModel()
+        self.reporting_interval_s = reporting_interval_s
+        self.producer_start_delay_s = producer_start_delay_s
+        self.samples_per_report = samples_per_report
+
+        # consumer_id -> samples not yet reported
+        self.unreported = {}
+
+        self.node_pools = []
+        self.zookeepers = 0
+        self.brokers = 0
+        self.kafka = None
+        self.consumers = 0
+        self.producers = 0
+        self.message_size_kb = 0
+
+        # producer scale requests: (time effective, producer count)
+        self.pending_producers = deque()
+
+    def scale_producers(self, producer_count):
+        self.pending_producers.append((self.clock.time() + self.producer_start_delay_s, int(producer_count)))
+
+    def get_producer_count(self):
+        self.apply_pending()
+        return self.producers
+
+    def apply_pending(self):
+        while len(self.pending_producers) > 0 and self.pending_producers[0][0] <= self.clock.time():
+            self.producers = self.pending_producers.popleft()[1]
+
+    def delete_namespace(self, namespace):
+        if namespace == PRODUCER_CONSUMER_NAMESPACE:
+            self.consumers = 0
+            self.producers = 0
+            self.pending_producers.clear()
+            self.unreported.clear()
+        elif namespace == KAFKA_NAMESPACE:
+            self.zookeepers = 0
+            self.brokers = 0
+            self.kafka = None
+
+    def snapshot(self):
+        self.apply_pending()
+        return ClusterSnapshot(self.zookeepers, self.brokers, self.consumers, self.producers, self.clock.time())
+
+    def count(self, role):
+        return self.snapshot().count(role)
+
+    def tick(self):
+        """
+        Advance the clock by one reporting interval, then each consumer reports its throughput
+        """
+        self.clock.advance(self.reporting_interval_s)
+        self.apply_pending()
+
+        if self.kafka is None:
+            return
+
+        partitions, replication_factor, batch_size_bytes = self.kafka
+        for i in range(self.consumers):
+            throughput = self.model.sample_consumer_mbps(self.brokers, partitions, replication_factor, batch_size_bytes,
+                                                         self.message_size_kb, self.producers, self.consumers)
+            self.report(f"consumer-{i}", throughput)
+
+    def report(self, consumer_id, throughput):
+        if self.samples_per_report == 1:
+            self.queue.put(json.dumps({"consumer_id": consumer_id, "throughput": throughput,
+                                       "producer_count": self.producers}))
+            return
+
+        samples = self.unreported.setdefault(consumer_id, [])
+        samples.append((self.clock.time(), throughput, self.producers))
+        if len(samples) >= self.samples_per_report:
+            self.queue.put(encode_report(consumer_id, samples))
+            del self.unreported[consumer_id]
+
+
+@addlogger
+class SimulatedClusterMixin:
+    """
+    Mixed in ahead of a Controller class: the cluster operations act on a SimulatedCluster,
+    and the stress/soak tests run in this process, against the simulated clock.
+
+    e.g. type("SimulatedConsumerController", (SimulatedClusterMixin, ConsumerController), {})
+    """
+    def __init__(self, queue=None, run_uid=None, model=None, operation_durations_s=None, samples_per_report=1):
+        clock = ManualClock()
+        if queue is None:
+            queue = SimulatedQueue()
+        # the consumers publish over a connection of their own, as per the consumer reporting endpoint
+        self.cluster = SimulatedCluster(clock, queue.connection(), model, samples_per_report=samples_per_report)
+        self.operation_durations_s = dict(DEFAULT_OPERATION_DURATIONS_S, **(operation_durations_s or {}))
+
+        super().__init__(queue, run_uid=run_uid, clock=clock)
+
+    def simulate(self, operation):
+        self.clock.advance(self.operation_durations_s[operation])
+
+    # node pools
+
+    def provision_node_pools(self, configuration):
+        self.simulate("provision_node_pools")
+        self.cluster.node_pools = ["kafka-node-pool", "zk-node-pool"]
+        self.node_pools_provisioned = True
+        self.post_provision_node_pools_hook()
+        return True
+
+    def delete_node_pools(self, node_pools):
+        self.simulate("unprovision_node_pools")
+        self.cluster.node_pools = [node_pool for node_pool in self.cluster.node_pools if node_pool not in node_pools]
+        return []
+
+    def get_node_pools(self):
+        return list(self.cluster.node_pools)
+
+    def deploy_local_ssd_provisioner(self):
+        pass
+
+    def undeploy_local_ssd_provisioner(self):
+        pass
+
+    def configure_gcloud(self, cluster_name, cluster_zone):
+        pass
+
+    # deployments
+
+    def k8s_delete_namespace(self, namespace):
+        self.simulate("delete_namespace")
+        self.cluster.delete_namespace(namespace)
+
+    def k8s_deploy_zk(self, num_zk):
+        self.simulate("deploy")
+        self.cluster.zookeepers = int(num_zk)
+
+    def k8s_deploy_kafka(self, num_partitions, replication_factor, batch_size_bytes):
+        self.simulate("deploy")
+        self.cluster.kafka = (int(num_partitions), int(replication_factor), int(batch_size_bytes))
+
+    def k8s_deploy_monitoring(self):
+        pass
+
+    def k8s_deploy_burrow(self):
+        pass
+
+    def get_burrow_ip(self):
+        return "127.0.0.1"
+
+    def k8s_deploy_producers_consumers(self):
+        self.simulate("deploy")
+
+    def k8s_scale_brokers(self, broker_count):
+        self.simulate("scale")
+        self.cluster.brokers = int(broker_count)
+
+    def k8s_configure_producers(self, start_producer_count, message_size):
+        self.cluster.message_size_kb = int(message_size)
+        self.k8s_scale_producers(start_producer_count)
+
+    def k8s_scale_producers(self, producer_count):
+        self.simulate("scale")
+        self.cluster.producers = int(producer_count)
+        self.cluster.pending_producers.clear()
+
+    def k8s_scale_consumers(self, num_consumers):
+        self.simulate("scale")
+        self.cluster.consumers = int(num_consumers)
+
+    def get_cluster_snapshot(self):
+        return self.cluster.snapshot()
+
+    def wait_for_pods(self, role, target_count, deadline_s):
+        return self.cluster.count(role) == target_count
+
+    # reporting
+
+    def post_json(self, endpoint_url, payload):
+        # the consumer reporting endpoint publishes to the configuration's tube
+        self.cluster.queue.use(payload["consumer_throughput_tube"])
+
+    def upload_metrics(self, configuration):
+        pass
+
+    # stress/soak tests
+
+    def run_process(self, process, configuration):
+        """
+        Run the test process in this process: each consumer reports once per (simulated) reporting interval
+        """
+        process.clock = self.clock
+        process.attach_scaler(self.cluster)
+
+        deadline = self.clock.time() + MAX_SIMULATED_TEST_S
+        process.on_start()
+        while not process.is_stopped():
+            if len(process.pending_samples) == 0:
+                if self.clock.time() > deadline:
+                    self.__log.warning("Warning: simulated test did not complete, stopping.")
+                    break
+                self.cluster.tick()
+
+            samples = process.next_samples()
+            if len(samples) == 0:
+                continue
+
+            if process.process_samples(samples):
+                break
+
+        process.complete()
+
+
+def simulated(controller_class):
+    """
+    :return: the controller class, acting on a simulated cluster
+    """
+    return type("Simulated" + controller_class.__name__, (SimulatedClusterMixin, controller_class), {})
@@ -1,5 +1,7 @@
-import time
-from statistics import mean
+from fs.change_point import STOP_DETECTOR_WINDOW
+from fs.cluster_throughput import ClusterThroughputAggregator
+from fs.sample_recorder import SOURCE_SOAK, DECISION_SOAK
+from fs.streaming_stats import StreamingStats, BatchMeans
 from fs.utils import addlogger, SEVENTY_FIVE_MBPS_IN_GBPS
 
 # A 21GB pagefile can cache:
@@ -9,19 +11,56 @@ from fs.throughput_process import ThroughputProcess
 
 SOAK_TEST_S = 313
 
+# the soak throughput of each consumer is the mean of its last 5 samples
+SOAK_WINDOW_SIZE = 5
+
+# soak for the page cache duration (above)
+SOAK_FIXED = "fixed"
+# soak for at least the page cache duration, then until the cluster throughput confidence interval is narrow enough
+SOAK_ADAPTIVE = "adaptive"
+
+# target half-width of the 95% confidence interval on the mean cluster throughput, relative to the mean
+DEFAULT_SOAK_CI_TARGET = 0.02
+
+# an adaptive soak is stopped after this long, whether or not the confidence interval is narrow enough
+DEFAULT_SOAK_MAX_S = 3600
+
+# cluster throughput intervals (5s) per batch mean, i.e. 30s batches
+SOAK_BATCH_INTERVALS = 6
+
+# batches before the confidence interval is trusted
+SOAK_MIN_BATCHES = 5
+
 @addlogger
 class SoakTestProcess(ThroughputProcess):
     """
     Soak test process
     """
+    sample_source = SOURCE_SOAK
+
     def __init__(self, configuration, queue, *args, **kwargs):
         # for a soak test we assume the system is already running
         # i.e. do not discard initial values
         super().__init__(configuration, queue, discard_initial_values=False, *args, **kwargs)
 
-        self.consumer_throughput_averages = []
+        # the rolling averages of all the consumers
+        self.consumer_throughput_averages = StreamingStats()
+        # consumer_id -> StreamingStats of the throughput samples
+        self.consumer_throughput_stats = {}
         self.num_producers = 0
 
+        # soak timings (in seconds), set once throughput stability is achieved
+        self.soak_test_ms = None
+        self.start_time_ms = 0
+        self.run_time_ms = 0
+
+        self.soak_mode = self.configuration.get("soak_mode", SOAK_FIXED)
+        self.soak_ci_target = self.configuration.get("soak_ci_target", DEFAULT_SOAK_CI_TARGET)
+        self.soak_max_s = None
+
+        # batch means of the cluster throughput intervals (fed as they are closed, once the soak has started)
+        self.cluster_throughput_means = BatchMeans(SOAK_BATCH_INTERVALS)
+
     def decrement_producer_count(self):
         actual_producer_count = self.get_producer_count()
         self.__log.info(f"Current producer count is {actual_producer_count}")
@@ -51,12 +90,18 @@ class SoakTestProcess(ThroughputProcess):
 
         # check for consecutive threshold events
         if self.threshold_exceeded[consumer_id] >= 3:
-            actual_producer_count = self.get_producer_count()
-            self.__log.info(f"Threshold exceeded, actual_producer_count {actual_producer_count}, desired_producer_count {self.desired_producer_count}")
+            return self.tolerance_failed(consumer_id)
 
-            if self.desired_producer_count == actual_producer_count:
-                # only decrement the producer count if we haven't already done so
-                self.decrement_producer_count()
+        # we never want to quit due to tolerance events
+        return False
+
+    def tolerance_failed(self, consumer_id):
+        actual_producer_count = self.get_producer_count()
+        self.__log.info(f"Threshold exceeded, actual_producer_count {actual_producer_count}, desired_producer_count {self.desired_producer_count}")
+
+        if self.desired_producer_count == actual_producer_count:
+            # only decrement the producer count if we haven't already done so
+            self.decrement_producer_count()
 
         # we never want to quit due to tolerance events
         return False
@@ -77,25 +122,126 @@ class SoakTestProcess(ThroughputProcess):
 
         return is_stable
 
-    def run(self):
-        self.__log.info("Started.")
+    def soak_sample(self, data, run_time_ms, soak_test_ms):
+        """
+        Record a single sample during the soak
+
+        :param data:
+        :param run_time_ms: elapsed soak time (seconds)
+        :param soak_test_ms: soak duration (seconds)
+        :return:
+        """
+        consumer_id = data["consumer_id"]
+        throughput_in_mbps = data["throughput"]
+        throughput_in_gbps = (throughput_in_mbps * 8) / 1000
+        num_producers = data["producer_count"]
+
+        # store the num_producers
+        if self.num_producers == 0:
+            self.num_producers = num_producers
+
+        self.cluster_throughput.add(consumer_id, throughput_in_gbps, num_producers, self.get_timestamp(data))
+        self.record_sample(data, DECISION_SOAK)
+
+        window = self.get_window(consumer_id, num_producers, SOAK_WINDOW_SIZE)
+        window.append(throughput_in_gbps)
+        consumer_throughput_average = window.mean()
+
+        self.consumer_throughput_averages.add(consumer_throughput_average)
+
+        stats = self.consumer_throughput_stats.get(consumer_id)
+        if stats is None:
+            stats = self.consumer_throughput_stats[consumer_id] = StreamingStats()
+        stats.add(throughput_in_gbps)
+
+        if consumer_throughput_average < self.min_throughput:
+            self.min_throughput = consumer_throughput_average
+
+        if consumer_throughput_average > self.max_throughput:
+            self.max_throughput = consumer_throughput_average
 
+        self.__log.info(
+            f"{run_time_ms:.2f}s of {soak_test_ms:.2f}s Consumer {consumer_id} throughput (average) {consumer_throughput_average}, expected {SEVENTY_FIVE_MBPS_IN_GBPS * num_producers}")
+
+    def on_start(self):
         # set the desired producer count at the beginning
         self.desired_producer_count = self.get_producer_count()
 
-        stop = False
-        while not stop:
+    def process_samples(self, samples):
+        if self.soak_test_ms is None:
             # 8 data points = (8 * 5) = 40s of data
-            stop = self.check_throughput(window_size=8)
+            if not self.check_throughput(samples, window_size=8):
+                return False
+
+            if not self.start_soak():
+                return True
+
+            # the remainder of the batch already belongs to the soak
+            samples = self.pending_samples
+            self.pending_samples = []
+
+        for data in samples:
+            self.soak_sample(data, self.run_time_ms, self.soak_test_ms)
+
+            # update the timings
+            self.run_time_ms = self.clock.time() - self.start_time_ms
+            if self.soak_complete():
+                return True
+
+        return False
+
+    def soak_complete(self):
+        """
+        :return: True once the soak has run for the page cache duration (fixed), or once it has also
+                 narrowed the cluster throughput confidence interval to the target or run out of budget (adaptive)
+        """
+        # the page cache duration is the minimum, whatever the mode
+        if self.run_time_ms <= self.soak_test_ms:
+            return False
+
+        if self.soak_mode == SOAK_FIXED:
+            self.__log.info(f"Soak test complete after {self.soak_test_ms:.2f} s.")
+            return True
+
+        relative_half_width = self.cluster_throughput_means.relative_half_width()
+        if self.cluster_throughput_means.count >= SOAK_MIN_BATCHES and relative_half_width is not None and \
+                relative_half_width <= self.soak_ci_target:
+            self.__log.info(f"Soak test converged after {self.run_time_ms:.2f} s, confidence interval +/- {relative_half_width:.2%}.")
+            return True
+
+        if self.run_time_ms > self.soak_max_s:
+            self.__log.info(f"Soak test budget of {self.soak_max_s:.2f} s reached, confidence interval +/- {relative_half_width}.")
+            return True
+
+        return False
 
+    def on_cluster_throughput_interval(self, time_s, throughput_gbps, producer_count, reporting, imputed):
+        """
+        Add a closed cluster throughput interval to the batch means
+        """
+        # skip any gaps in the reports
+        if reporting > 0:
+            self.cluster_throughput_means.add(throughput_gbps)
+
+    def start_soak(self):
+        """
+        Start the soak once throughput stability has been achieved
+
+        :return: False if the soak test is aborted
+        """
         num_producers = self.get_producer_count()
         self.__log.info(f"Throughput stability achieved @ {num_producers} producers.")
 
         # start soak test once stability achieved
         num_brokers = self.configuration["number_of_brokers"]
         if num_producers > 0:
-            soak_test_ms = ((SOAK_TEST_S * num_brokers) / num_producers)
-            self.__log.info(f"Running soak test for {soak_test_ms:.2f} seconds.")
+            self.soak_test_ms = ((SOAK_TEST_S * num_brokers) / num_producers)
+            if self.soak_mode == SOAK_FIXED:
+                self.__log.info(f"Running soak test for {self.soak_test_ms:.2f} seconds.")
+            else:
+                self.soak_max_s = max(self.configuration.get("soak_max_s", DEFAULT_SOAK_MAX_S), self.soak_test_ms)
+                self.__log.info(f"Running soak test for {self.soak_test_ms:.2f} to {self.soak_max_s:.2f} seconds, "
+                                f"until the confidence interval is within +/- {self.soak_ci_target:.2%}.")
         else:
             self.__log.info("No producers: aborting soak test...")
             self.stop()
@@ -109,52 +255,46 @@ class SoakTestProcess(ThroughputProcess):
                     "soak_average_throughput": 0}
             self.__log.info(f"Soak soak stats: {json}")
             self.write_metrics(self.configuration, json)
-            return
+            return False
 
         # reset min/max, as we are not interested in the values before this point
         self.min_throughput = 99999
         self.max_throughput = 0
+        self.cluster_throughput = ClusterThroughputAggregator(on_close=self.on_cluster_throughput_interval)
+        self.cluster_throughput_means = BatchMeans(SOAK_BATCH_INTERVALS)
 
-        start_time_ms = time.time()
-        run_time_ms = 0
-        while not self.is_stopped():
-            data = self.get_data(self.consumer_throughput_queue)
-            if data is None:
-                # self.__log.info("Nothing on consumer throughput queue...")
-                time.sleep(.10)
-                continue
-
-            consumer_id = data["consumer_id"]
-            throughput_in_mbps = data["throughput"]
-            throughput_in_gbps = (throughput_in_mbps * 8) / 1000
-            num_producers = data["producer_count"]
-
-            # store the num_producers
-            if self.num_producers == 0:
-                self.num_producers = num_producers
-
-            self.consumer_throughput_dict[consumer_id][str(num_producers)].append(throughput_in_gbps)
-            consumer_throughput_average = mean(self.consumer_throughput_dict[consumer_id][str(num_producers)][-5:])
+        self.start_time_ms = self.clock.time()
+        self.run_time_ms = 0
+        return True
 
-            self.consumer_throughput_averages.append(consumer_throughput_average)
+    def on_complete(self):
+        if self.soak_test_ms is None:
+            # aborted (or stopped) before the soak started
+            return
 
-            if consumer_throughput_average < self.min_throughput:
-                self.min_throughput = consumer_throughput_average
+        num_producers = self.get_producer_count()
 
-            if consumer_throughput_average > self.max_throughput:
-                self.max_throughput = consumer_throughput_average
+        average_throughput = 0
+        if self.consumer_throughput_averages.count > 0:
+            average_throughput = self.consumer_throughput_averages.mean
+        self.__log.info(f"Soak test stats: num_producers {self.num_producers}, min_throughput {self.min_throughput}, max_throughput {self.max_throughput}, average_throughput {average_throughput}")
 
-            self.__log.info(
-                f"{run_time_ms:.2f}s of {soak_test_ms:.2f}s Consumer {consumer_id} throughput (average) {consumer_throughput_average}, expected {SEVENTY_FIVE_MBPS_IN_GBPS * num_producers}")
+        # throughput distribution per consumer, and across all the consumers
+        cluster_stats = StreamingStats()
+        consumer_stats = {}
+        for consumer_id, stats in self.consumer_throughput_stats.items():
+            cluster_stats.merge(stats)
+            consumer_stats[consumer_id] = stats.summary()
+        cluster_summary = cluster_stats.summary()
 
-            # update the timings
-            run_time_ms = time.time() - start_time_ms
-            if run_time_ms > soak_test_ms:
-                self.__log.info(f"Soak test complete after {soak_test_ms:.2f} s.")
-                break
+        self.cluster_throughput.flush()
+        aggregate = self.cluster_throughput.summary()
+        self.__log.info(f"Soak test cluster throughput (Gbps): {aggregate}, late samples {self.cluster_throughput.late_samples}")
 
-        average_throughput = mean(self.consumer_throughput_averages)
-        self.__log.info(f"Soak test stats: num_producers {self.num_producers}, min_throughput {self.min_throughput}, max_throughput {self.max_throughput}, average_throughput {average_throughput}")
+        # the confidence interval achieved (whatever the mode)
+        half_width = self.cluster_throughput_means.half_width()
+        relative_half_width = self.cluster_throughput_means.relative_half_width()
+        self.__log.info(f"Soak test ran for {self.run_time_ms:.2f} s, cluster throughput confidence interval +/- {half_width} Gbps ({relative_half_width})")
 
         # write metrics as JSON
         json = {"run_uid": self.configuration["run_uid"],
@@ -163,8 +303,26 @@ class SoakTestProcess(ThroughputProcess):
                 "soak_expected_throughput_gbps": str(num_producers * SEVENTY_FIVE_MBPS_IN_GBPS),
                 "soak_min_throughput": str(self.min_throughput),
                 "soak_max_throughput": str(self.max_throughput),
-                "soak_average_throughput": str(average_throughput)}
+                "soak_average_throughput": str(average_throughput),
+                "soak_throughput_stddev": str(cluster_summary.get("stddev")),
+                "soak_throughput_p50": str(cluster_summary.get("p50")),
+                "soak_throughput_p95": str(cluster_summary.get("p95")),
+                "soak_throughput_p99": str(cluster_summary.get("p99")),
+                "soak_aggregate_throughput_gbps": str(aggregate.get("mean")),
+                "soak_min_aggregate_throughput_gbps": str(aggregate.get("min")),
+                "soak_max_aggregate_throughput_gbps": str(aggregate.get("max")),
+                "soak_mode": self.soak_mode,
+                "soak_duration_s": str(self.run_time_ms),
+                "soak_ci_batches": str(self.cluster_throughput_means.count),
+                "soak_ci_half_width_gbps": str(half_width),
+                "soak_ci_relative_half_width": str(relative_half_width),
+                "soak_stop_detector": self.configuration.get("stop_detector", STOP_DETECTOR_WINDOW),
+                "soak_detection_count": str(len(self.detections))}
         self.__log.info(f"Soak test stats: {json}")
         self.write_metrics(self.configuration, json)
 
-        self.__log.info(f"Completed.")
+        details = {"run_uid": self.configuration["run_uid"],
+                   "configuration_uid": self.configuration["configuration_uid"],
+                   "soak_consumer_throughput_stats": consumer_stats,
+                   "soak_detections": self.detections}
+        self.write_details(self.configuration, details)
@@ -0,0 +1,222 @@
+import math
+
+# quantiles are accurate to within 1% of their value
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# bounds the sketch size, whatever the range of values (the lowest buckets are merged beyond this)
+DEFAULT_MAX_BUCKETS = 2048
+
+# two-sided 95% critical values of Student's t distribution, by degrees of freedom
+T_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+        11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131, 16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093, 20: 2.086,
+        25: 2.060, 30: 2.042, 40: 2.021, 60: 2.000, 120: 1.980}
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with relative error guarantees (as per DDSketch, Masson et al. 2019).
+
+    Values are counted in logarithmically sized buckets, so memory depends on the range of the values
+    rather than on how many there are. Values <= 0 are counted as zero.
+    """
+    __slots__ = ["relative_accuracy", "gamma", "log_gamma", "max_buckets", "buckets", "zero_count", "count"]
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY, max_buckets=DEFAULT_MAX_BUCKETS):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+
+        # bucket index -> count, bucket i holds values in (gamma^(i-1), gamma^i]
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value <= 0:
+            self.zero_count += 1
+            return
+
+        index = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+        if len(self.buckets) > self.max_buckets:
+            self.collapse()
+
+    def collapse(self):
+        """
+        Merge the lowest buckets, keeping the higher quantiles accurate
+        """
+        indexes = sorted(self.buckets)
+        excess = len(indexes) - self.max_buckets
+        target = indexes[excess]
+        for index in indexes[0:excess]:
+            self.buckets[target] += self.buckets.pop(index)
+
+    def merge(self, other):
+        """
+        Add the values of another sketch (with the same relative accuracy)
+        """
+        if other.gamma != self.gamma:
+            raise ValueError("Unable to merge sketches with different relative accuracy")
+
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+        if len(self.buckets) > self.max_buckets:
+            self.collapse()
+
+    def quantile(self, q):
+        """
+        :param q: 0 <= q <= 1
+        :return: the value at quantile q (None if empty)
+        """
+        if self.count == 0:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                # the value in the middle of the bucket (relative to the bucket bounds)
+                return 2 * self.gamma ** index / (self.gamma + 1)
+
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class StreamingStats:
+    """
+    Count, mean, standard deviation (Welford), min/max and quantiles of a stream of values, in constant memory.
+    """
+    __slots__ = ["count", "mean", "m2", "min", "max", "sketch"]
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.count = 0
+        self.mean = 0.0
+        # sum of squared differences from the mean
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+        self.sketch.add(value)
+
+    def merge(self, other):
+        """
+        Add the values of another StreamingStats (Chan et al. parallel variance)
+        """
+        if other.count == 0:
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+        self.sketch.merge(other.sketch)
+
+    def stddev(self):
+        """
+        :return: sample standard deviation (0 if fewer than two values)
+        """
+        if self.count < 2:
+            return 0.0
+
+        return math.sqrt(self.m2 / (self.count - 1))
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    def summary(self):
+        """
+        :return: dict of the statistics, e.g. for the metrics
+        """
+        if self.count == 0:
+            return {"count": 0}
+
+        return {"count": self.count, "mean": self.mean, "stddev": self.stddev(), "min": self.min, "max": self.max,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99)}
+
+
+def t_95(degrees_of_freedom):
+    """
+    :return: two-sided 95% critical value of Student's t (conservatively, of the nearest tabulated lower df)
+    """
+    if degrees_of_freedom > 120:
+        return 1.960
+
+    return T_95[max(df for df in T_95 if df <= degrees_of_freedom)]
+
+
+class BatchMeans:
+    """
+    Confidence interval on the mean of an autocorrelated series (e.g. of throughput intervals), in constant memory:
+    the series is split into consecutive batches of batch_size values, and the batch means are treated as independent.
+    """
+    __slots__ = ["batch_size", "batch_total", "batch_count", "count", "mean", "m2"]
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.batch_total = 0.0
+        self.batch_count = 0
+
+        # Welford over the batch means
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.batch_total += value
+        self.batch_count += 1
+        if self.batch_count < self.batch_size:
+            return
+
+        batch_mean = self.batch_total / self.batch_count
+        self.batch_total = 0.0
+        self.batch_count = 0
+
+        self.count += 1
+        delta = batch_mean - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (batch_mean - self.mean)
+
+    def half_width(self):
+        """
+        :return: half-width of the 95% confidence interval on the mean (None if fewer than two batches)
+        """
+        if self.count < 2:
+            return None
+
+        return t_95(self.count - 1) * math.sqrt(self.m2 / (self.count - 1) / self.count)
+
+    def relative_half_width(self):
+        """
+        :return: half-width relative to the mean (None if fewer than two batches, or a zero mean)
+        """
+        half_width = self.half_width()
+        if half_width is None or self.mean == 0:
+            return None
+
+        return half_width / abs(self.mean)
@@ -1,4 +1,6 @@
-import time
+from fs.change_point import STOP_DETECTOR_WINDOW
+from fs.ramp_strategy import get_ramp_strategy
+from fs.sample_recorder import SOURCE_STRESS
 from fs.throughput_process import ThroughputProcess
 from fs.utils import addlogger, SEVENTY_FIVE_MBPS_IN_GBPS
 
@@ -9,7 +11,11 @@ class StressTestProcess(ThroughputProcess):
     Stress test:
     a) Check throughput for tolerance
     b) Start a new producer if everything is tickety boo and interval has elapsed
+
+    The producer count is stepped as per the configuration ramp_strategy (see fs.ramp_strategy)
     """
+    sample_source = SOURCE_STRESS
+
     def __init__(self, configuration, queue, *args, **kwargs):
         super().__init__(configuration, queue, *args, **kwargs)
 
@@ -19,6 +25,8 @@ class StressTestProcess(ThroughputProcess):
         self.last_producer_start_time = 0
         self.stress_test_max_producers = 0
 
+        self.ramp_strategy = get_ramp_strategy(self.configuration)
+
     def throughput_tolerance_exceeded(self, consumer_id, consumer_throughput_average, consumer_throughput_tolerance):
         """
         Check for throughput below tolerance
@@ -30,13 +38,24 @@ class StressTestProcess(ThroughputProcess):
             f"Consumer {consumer_id} average throughput {consumer_throughput_average} < tolerance {consumer_throughput_tolerance}")
         self.threshold_exceeded[consumer_id] = self.threshold_exceeded.get(consumer_id, 0) + 1
 
-        # stop after 3 consecutive threshold events
+        # the producer count fails after 3 consecutive threshold events
         if self.threshold_exceeded[consumer_id] >= 3:
+            return self.tolerance_failed(consumer_id)
+
+        # only quit if >= 3 tolerance events
+        return False
+
+    def tolerance_failed(self, consumer_id):
+        actual_producer_count = self.get_producer_count()
+        next_producer_count = self.ramp_strategy.probe_failed(actual_producer_count, self.clock.time())
+        if next_producer_count is None:
             self.__log.info("Stopping after multiple throughput below tolerance...")
             # we want to quit due to the tolerance event
             return True
 
-        # only quit if >= 3 tolerance events
+        # e.g. bisect back down
+        self.threshold_exceeded = dict.fromkeys(self.threshold_exceeded.keys(), 0)
+        self.scale_producers(actual_producer_count, next_producer_count)
         return False
 
     def throughput_ok(self, consumer_id, actual_producer_count):
@@ -47,47 +66,81 @@ class StressTestProcess(ThroughputProcess):
         self.threshold_exceeded[consumer_id] = 0
 
         # if interval has elapsed, then start a new producer
-        now = time.time()
+        now = self.clock.time()
         elapsed_time = now - self.last_producer_start_time
         increment_time = self.configuration["producer_increment_interval_sec"]
         # self.__log.info(f"time since last increment {elapsed_time}, increment_time {increment_time}")
         actual_producer_count = self.get_producer_count()
-        if elapsed_time > increment_time:
-            # store the time the new producer was started
-            self.last_producer_start_time = now
-            self.desired_producer_count = actual_producer_count + 1
-            self.__log.info(
-                f"Starting producer, actual_producer_count {actual_producer_count}, desired_producer_count {self.desired_producer_count}")
-            self.k8s_scale_producers(self.desired_producer_count)
+        if elapsed_time > increment_time or self.probe_confirmed(actual_producer_count):
+            next_producer_count = self.ramp_strategy.probe_ok(actual_producer_count, now)
+            if next_producer_count is None:
+                self.__log.info(f"Ramp complete @ {actual_producer_count} producers.")
+                return True
+
+            self.scale_producers(actual_producer_count, next_producer_count)
 
         return False
 
-    def run(self):
-        self.__log.info("Started.")
+    def probe_confirmed(self, actual_producer_count):
+        """
+        :return: True if the stop detector has judged every consumer ok at the producer count
+        """
+        if self.stop_detector is None:
+            return False
 
+        return self.stop_detector.count_ok(actual_producer_count) >= self.configuration["num_consumers"]
+
+    def scale_producers(self, actual_producer_count, desired_producer_count):
+        # store the time the producer count was changed
+        self.last_producer_start_time = self.clock.time()
+        self.desired_producer_count = desired_producer_count
+        self.__log.info(
+            f"Scaling producers, actual_producer_count {actual_producer_count}, desired_producer_count {self.desired_producer_count}")
+        self.k8s_scale_producers(self.desired_producer_count)
+
+    def on_start(self):
         # store the time that the thread is started
-        self.last_producer_start_time = time.time()
+        self.last_producer_start_time = self.clock.time()
 
-        stop = False
-        while not stop:
-            # 8 data points = (8 * 5) = 40s of data
-            stop = self.check_throughput(window_size=8)
+    def process_samples(self, samples):
+        # 8 data points = (8 * 5) = 40s of data
+        return self.check_throughput(samples, window_size=8)
 
+    def on_complete(self):
         actual_producer_count = self.get_producer_count()
         if self.desired_producer_count > actual_producer_count:
             self.__log.info("cancelling outstanding producer increment.")
             # cancel the outstanding increment
             self.k8s_scale_producers(actual_producer_count)
 
+        # cluster throughput at the maximum producer count, and the peak overall
+        self.cluster_throughput.flush()
+        aggregate = self.cluster_throughput.summary(producer_count=actual_producer_count)
+        peak = self.cluster_throughput.summary().get("max")
+        self.__log.info(f"Stress test cluster throughput (Gbps) @ {actual_producer_count} producers: {aggregate}, peak {peak}")
+
+        trajectory = self.ramp_strategy.trajectory
+        self.__log.info(f"Stress test {self.ramp_strategy.name} ramp: {len(trajectory)} probes, saturation @ {self.ramp_strategy.saturation_producer_count()} producers")
+
         # write out the key metrics as JSON
         json = {"run_uid": self.configuration["run_uid"],
                 "configuration_uid": self.configuration["configuration_uid"],
                 "stress_max_producers": str(actual_producer_count),
                 "stress_expected_throughput_gbps": str(actual_producer_count * SEVENTY_FIVE_MBPS_IN_GBPS),
                 "stress_min_throughput": str(self.min_throughput),
-                "stress_max_throughput": str(self.max_throughput)}
+                "stress_max_throughput": str(self.max_throughput),
+                "stress_aggregate_throughput_gbps": str(aggregate.get("mean")),
+                "stress_peak_aggregate_throughput_gbps": str(peak),
+                "stress_ramp_strategy": self.ramp_strategy.name,
+                "stress_saturation_producers": str(self.ramp_strategy.saturation_producer_count()),
+                "stress_probe_count": str(len(trajectory)),
+                "stress_stop_detector": self.configuration.get("stop_detector", STOP_DETECTOR_WINDOW),
+                "stress_detection_count": str(len(self.detections))}
         self.__log.info(f"Stress test stats: {json}")
         self.write_metrics(self.configuration, json)
 
-        self.__log.info("Completed.")
-
+        details = {"run_uid": self.configuration["run_uid"],
+                   "configuration_uid": self.configuration["configuration_uid"],
+                   "stress_probe_trajectory": trajectory,
+                   "stress_detections": self.detections}
+        self.write_details(self.configuration, details)
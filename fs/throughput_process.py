@@ -1,7 +1,10 @@
-from collections import defaultdict
-from statistics import mean
-
-from fs.base_process import BaseProcess
+from fs.base_process import BaseProcess, get_samples_prefix
+from fs.change_point import get_stop_detector, STATE_WARMING_UP, STATE_UNDECIDED, STATE_OK, STATE_SATURATED
+from fs.cluster_throughput import ClusterThroughputAggregator
+from fs.process_stages import SampleIngester, ScalingActuator
+from fs.rolling_window import RollingWindow
+from fs.sample_recorder import SampleRecorder, SOURCE_UNKNOWN, DECISION_NONE, DECISION_DISCARDED_PRODUCER_COUNT, \
+    DECISION_DISCARDED_INITIAL, DECISION_OK, DECISION_BELOW_TOLERANCE, DECISION_STOP
 from fs.utils import SEVENTY_FIVE_MBPS_IN_GBPS, DEFAULT_CONSUMER_TOLERANCE, addlogger
 
 INITIAL_WINDOW_SIZE = 10
@@ -9,16 +12,26 @@ INITIAL_WINDOW_SIZE = 10
 
 @addlogger
 class ThroughputProcess(BaseProcess):
+    # recorded with each sample (see SampleRecorder)
+    sample_source = SOURCE_UNKNOWN
 
     def __init__(self, configuration, queue, discard_initial_values=True, *args, **kwargs):
         super().__init__(configuration, *args, **kwargs)
 
         self.consumer_throughput_queue = queue
         self.threshold_exceeded = {}
-        # initialise empty dict with empty dict of lists
-        self.consumer_throughput_dict = defaultdict(lambda: defaultdict(list))
+        # (consumer_id, num_producers) -> RollingWindow of throughputs (Gbps)
+        self.consumer_throughput_windows = {}
+
+        # throughput summed across all the consumers
+        self.cluster_throughput = ClusterThroughputAggregator()
         self.previous_producer_count = 0
 
+        # the warm-up and stop decisions, if made by a change-point detector rather than the fixed window
+        self.stop_detector = get_stop_detector(configuration)
+        # list of dicts, one per change of detector state of a consumer
+        self.detections = []
+
         # pertaining to discarding initial values (e.g. for stress test)
         self.discard_initial_values = discard_initial_values
         self.throughput_count = 0
@@ -29,9 +42,27 @@ class ThroughputProcess(BaseProcess):
 
         self.desired_producer_count = 0
 
+        # samples drained from the queue but not yet processed
+        self.pending_samples = []
+
+        # drains the queue on a thread of its own, when set (see fs.process_stages)
+        self.ingester = None
+
+        # raw samples, with the decision taken
+        self.sample_recorder = SampleRecorder(get_samples_prefix(self.base_path, configuration))
+
     def throughput_tolerance_exceeded(self, consumer_id, consumer_throughput_average, consumer_throughput_tolerance):
         raise NotImplementedError("Please use a sub-class to implement the method.")
 
+    def tolerance_failed(self, consumer_id):
+        """
+        Called once the throughput of a consumer is judged below tolerance at the current producer count
+
+        :param consumer_id:
+        :return: True to stop
+        """
+        raise NotImplementedError("Please use a sub-class to implement the method.")
+
     def reset_thresholds(self):
         actual_producer_count = self.get_producer_count()
         if self.previous_producer_count != actual_producer_count:
@@ -42,38 +73,97 @@ class ThroughputProcess(BaseProcess):
 
             # discard the initial values for this producer #
             self.throughput_count = 0
+            if self.stop_detector is not None:
+                self.stop_detector.reset()
 
         self.previous_producer_count = actual_producer_count
         return actual_producer_count
 
-    def check_throughput(self, window_size=INITIAL_WINDOW_SIZE):
-        data = self.get_data(self.consumer_throughput_queue)
-        if data is None:
-            return False
+    def next_samples(self):
+        """
+        Return the samples left over from the previous batch (if any), otherwise drain the next batch
 
-        consumer_id = data["consumer_id"]
-        throughput_in_mbps = data["throughput"]
-        throughput_in_gbps = (throughput_in_mbps * 8) / 1000
-        num_producers = data["producer_count"]
+        :return: list of samples
+        """
+        if len(self.pending_samples) > 0:
+            samples = self.pending_samples
+            self.pending_samples = []
+            return samples
+
+        if self.ingester is not None:
+            return self.ingester.get()
+
+        return self.get_data_batch(self.consumer_throughput_queue)
 
+    def check_throughput(self, samples, window_size=INITIAL_WINDOW_SIZE):
+        """
+        Check a batch of samples against the throughput tolerance
+
+        :param samples:
+        :param window_size:
+        :return: True if the check says stop (the rest of the batch is left in pending_samples)
+        """
         # reset thresholds only if the producer count has changed
         # i.e. if a new producer has just started
         self.reset_thresholds()
 
+        for i, data in enumerate(samples):
+            if self.check_sample(data, window_size):
+                # keep the remainder of the batch for whoever runs next
+                self.pending_samples = samples[i + 1:]
+                return True
+
+        return False
+
+    def get_window(self, consumer_id, num_producers, window_size):
+        """
+        The rolling window of throughputs for a consumer at a producer count
+
+        :param window_size: if the window has a different size, it is resized (keeping the most recent values)
+        :return: RollingWindow
+        """
+        key = (consumer_id, num_producers)
+        window = self.consumer_throughput_windows.get(key)
+        if window is None:
+            window = self.consumer_throughput_windows[key] = RollingWindow(window_size)
+        elif window.size != window_size:
+            window = self.consumer_throughput_windows[key] = window.resized(window_size)
+
+        return window
+
+    def check_sample(self, data, window_size):
+        consumer_id = data["consumer_id"]
+        throughput_in_mbps = data["throughput"]
+        throughput_in_gbps = (throughput_in_mbps * 8) / 1000
+        num_producers = data["producer_count"]
+
         self.__log.info(f"Consumer {consumer_id}, throughput {throughput_in_gbps} Gbps, expected {SEVENTY_FIVE_MBPS_IN_GBPS * num_producers} Gbps, num_producers {num_producers}")
 
+        self.cluster_throughput.add(consumer_id, throughput_in_gbps, num_producers, self.get_timestamp(data))
+
         # discard the data if the producer count doesn't match what we are expecting
         if self.desired_producer_count != num_producers:
             self.__log.info(f"num_producers {num_producers} != self.desired_producer_count {self.desired_producer_count}, producer not started/stopped yet? Discarding the data...")
+            self.record_sample(data, DECISION_DISCARDED_PRODUCER_COUNT)
             return False
 
+        if self.stop_detector is not None and not self.configuration["ignore_throughput_threshold"]:
+            stop, decision = self.detect(consumer_id, num_producers, throughput_in_gbps)
+            self.record_sample(data, DECISION_STOP if stop else decision)
+            return stop
+
+        decision = DECISION_NONE
+        stop = False
+
+        window = self.get_window(consumer_id, num_producers, window_size)
+
         # Avoid low throughput on producer # change?
         if self.discard_initial_values:
             # discard 2 * number of consumers
             # since otherwise each consumer may not have stabilised
             if self.throughput_count > (2 * self.configuration["num_consumers"]):
-                # append throughput to specific list (as keyed by num_producers)
-                self.consumer_throughput_dict[consumer_id][str(num_producers)].append(throughput_in_gbps)
+                # append throughput to specific window (as keyed by num_producers)
+                window.append(throughput_in_gbps)
 
                 # update min/max, etc.
                 if throughput_in_gbps < self.min_throughput:
@@ -84,18 +174,16 @@ class ThroughputProcess(BaseProcess):
             else:
                 self.__log.info("Discarding throughput value...")
                 self.throughput_count += 1
+                decision = DECISION_DISCARDED_INITIAL
         else:
-            # append throughput to specific list (as keyed by num_producers)
-            self.consumer_throughput_dict[consumer_id][str(num_producers)].append(throughput_in_gbps)
+            # append throughput to specific window (as keyed by num_producers)
+            window.append(throughput_in_gbps)
 
         if not self.configuration["ignore_throughput_threshold"]:
             # detect threshold event if relevant to actual producer count
-            if len(self.consumer_throughput_dict[consumer_id][str(num_producers)]) >= window_size:
-                # truncate list to last x entries
-                self.consumer_throughput_dict[consumer_id][str(num_producers)] = self.consumer_throughput_dict[consumer_id][str(num_producers)][-window_size:]
-
-                # calculate the mean
-                consumer_throughput_average = mean(self.consumer_throughput_dict[consumer_id][str(num_producers)])
+            if window.is_full():
+                # the mean of the last window_size entries
+                consumer_throughput_average = window.mean()
 
                 # TODO - think about adding a theoretical maximum based on the setup e.g. NVMe SSD = 350MB/s
                 self.__log.info(
@@ -104,9 +192,139 @@ class ThroughputProcess(BaseProcess):
                 consumer_throughput_tolerance = (SEVENTY_FIVE_MBPS_IN_GBPS * num_producers * DEFAULT_CONSUMER_TOLERANCE)
 
                 if consumer_throughput_average < consumer_throughput_tolerance:
-                    return self.throughput_tolerance_exceeded(consumer_id, consumer_throughput_average, consumer_throughput_tolerance)
+                    decision = DECISION_BELOW_TOLERANCE
+                    stop = self.throughput_tolerance_exceeded(consumer_id, consumer_throughput_average, consumer_throughput_tolerance)
                 else:
-                    return self.throughput_ok(consumer_id, num_producers)
+                    decision = DECISION_OK
+                    stop = self.throughput_ok(consumer_id, num_producers)
 
-        return False
+        self.record_sample(data, DECISION_STOP if stop else decision)
+        return stop
+
+    def detect(self, consumer_id, num_producers, throughput_in_gbps):
+        """
+        Warm-up and tolerance decisions as per the stop detector
+
+        :return: (True to stop, decision)
+        """
+        consumer_throughput_tolerance = (SEVENTY_FIVE_MBPS_IN_GBPS * num_producers * DEFAULT_CONSUMER_TOLERANCE)
+        detection = self.stop_detector.add(consumer_id, num_producers, throughput_in_gbps, consumer_throughput_tolerance)
+
+        if detection.changed and detection.state != STATE_UNDECIDED:
+            self.__log.info(f"Consumer {consumer_id} @ {num_producers} producers: {detection.state}, confidence {detection.confidence}")
+            self.detections.append({"time": self.clock.time(), "consumer_id": consumer_id,
+                                    "producer_count": num_producers, "state": detection.state,
+                                    "confidence": detection.confidence})
+
+        if detection.state == STATE_WARMING_UP:
+            return False, DECISION_DISCARDED_INITIAL
+
+        # update min/max, etc.
+        if throughput_in_gbps < self.min_throughput:
+            self.min_throughput = throughput_in_gbps
+
+        if throughput_in_gbps > self.max_throughput:
+            self.max_throughput = throughput_in_gbps
+
+        if detection.state == STATE_SATURATED:
+            # not stable, for as long as it stays saturated
+            self.threshold_exceeded[consumer_id] = self.threshold_exceeded.get(consumer_id, 0) + 1
+            return self.tolerance_failed(consumer_id), DECISION_BELOW_TOLERANCE
+
+        if detection.state == STATE_OK:
+            return self.throughput_ok(consumer_id, num_producers), DECISION_OK
+
+        return False, DECISION_NONE
+
+    def get_timestamp(self, data):
+        """
+        :return: the time of the sample, if reported, otherwise now
+        """
+        timestamp = data.get("timestamp")
+        if timestamp is None:
+            timestamp = self.clock.time()
+
+        return timestamp
+
+    def record_sample(self, data, decision):
+        self.sample_recorder.record(self.get_timestamp(data), data["consumer_id"], data["producer_count"],
+                                    data["throughput"], decision, self.sample_source)
+
+    def on_start(self):
+        """
+        Called once before the first batch of samples.
+        Default implementation is to do nothing
+        :return:
+        """
+        pass
+
+    def process_samples(self, samples):
+        """
+        Process a batch of samples
+
+        :param samples:
+        :return: True once the test is complete
+        """
+        raise NotImplementedError("Please use a sub-class to implement the method.")
+
+    def on_complete(self):
+        """
+        Called once after the test is complete (or stopped).
+        Default implementation is to do nothing
+        :return:
+        """
+        pass
+
+    def complete(self):
+        """
+        Called once the samples have been processed: on_complete() and flush the sample recorder
+        :return:
+        """
+        self.on_complete()
+        self.sample_recorder.close()
+
+    def start_stages(self):
+        """
+        Ingest and actuate on threads of their own, analysing on this one
+        """
+        self.actuator = ScalingActuator(self.apply_producer_count, self.read_producer_count)
+        self.actuator.start()
+
+        self.ingester = SampleIngester(lambda: self.get_data_batch(self.consumer_throughput_queue))
+        self.ingester.start()
+
+    def stop_stages(self):
+        """
+        Stop ingesting, and wait for the outstanding producer count (if any) to be applied
+        """
+        self.ingester.stop()
+        self.actuator.stop()
+        self.__log.info(f"Ingested {self.ingester.batch_count} batches (max lag {self.ingester.max_lag_s:.3f}s), "
+                        f"applied {self.actuator.applied_count} producer counts ({self.actuator.coalesced_count} coalesced)")
+
+        self.ingester = None
+        self.actuator = None
+
+    def run(self):
+        self.__log.info("Started.")
+
+        self.start_stages()
+        try:
+            self.on_start()
+
+            while not self.is_stopped():
+                # note - waits for up to 1s when nothing has been ingested
+                # (raises StageError if ingestion or actuation has failed)
+                samples = self.next_samples()
+                if len(samples) == 0:
+                    continue
+
+                if self.process_samples(samples):
+                    break
+        finally:
+            # note - complete() reads and scales the producer count directly
+            self.stop_stages()
+
+        self.complete()
 
+        self.__log.info("Completed.")
@@ -0,0 +1,37 @@
+# how much of the cluster has to be rebuilt between two configurations, in increasing order of cost
+RESCALE_CONSUMERS = 1
+REDEPLOY_KAFKA = 2
+REBUILD_NODE_POOLS = 3
+
+TRANSITION_NAMES = {RESCALE_CONSUMERS: "rescale consumers", REDEPLOY_KAFKA: "redeploy kafka",
+                    REBUILD_NODE_POOLS: "rebuild node pools"}
+
+# configuration keys which determine the node pools (see Controller.provision_node_pools)
+NODE_POOL_KEYS = ["number_of_brokers", "broker_machine_type", "disk_size", "disk_type", "num_zk"]
+
+# configuration keys which determine the kafka (and ZK) deployment (see Controller.get_setup_steps)
+KAFKA_KEYS = ["number_of_partitions", "replication_factor", "batch_size_bytes"]
+
+
+def changed_keys(previous, next_configuration, keys):
+    return [key for key in keys if previous.get(key) != next_configuration.get(key)]
+
+
+def classify_transition(previous, next_configuration):
+    """
+    The minimal rebuild needed to go from the cluster set up for one configuration to the next
+
+    :param previous: configuration the cluster is currently set up for (None if nothing is standing)
+    :param next_configuration: (None if there is no next configuration)
+    :return: RESCALE_CONSUMERS, REDEPLOY_KAFKA or REBUILD_NODE_POOLS
+    """
+    if previous is None or next_configuration is None:
+        return REBUILD_NODE_POOLS
+
+    if len(changed_keys(previous, next_configuration, NODE_POOL_KEYS)) > 0:
+        return REBUILD_NODE_POOLS
+
+    if len(changed_keys(previous, next_configuration, KAFKA_KEYS)) > 0:
+        return REDEPLOY_KAFKA
+
+    return RESCALE_CONSUMERS
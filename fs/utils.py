@@ -27,6 +27,11 @@ SERVICE_ACCOUNT_EMAIL = "cluster-minimal-3bde6dae01f5@kafka-k8s-trial.iam.gservi
 CLUSTER_NAME = "gke-kafka-cluster"
 CLUSTER_ZONE = "europe-west2-a"
 
+# consumer throughput queue (beanstalkd), see run_beanstalkd.sh
+BEANSTALKD_HOST = "127.0.0.1"
+BEANSTALKD_PORT = 12000
+CONSUMER_THROUGHPUT_TUBE = "consumer_throughput"
+
 ENDPOINT_URL = "http://focussensors.duckdns.org:9000/consumer_reporting_endpoint"
 
 
@@ -1,10 +1,13 @@
+import argparse
 import threading
 import time
 from statistics import mean
 
 import greenstalk
 
-from fs.controller import DEFAULT_THROUGHPUT_MB_S, DEFAULT_CONSUMER_TOLERANCE
+from fs.report_protocol import decode_report, encode_report
+from fs.utils import DEFAULT_THROUGHPUT_MB_S, DEFAULT_CONSUMER_TOLERANCE, CONSUMER_THROUGHPUT_TUBE, BEANSTALKD_HOST, \
+    BEANSTALKD_PORT
 
 
 def threaded(fn):
@@ -16,19 +19,30 @@ def threaded(fn):
 
 
 class MockQueuePusher:
-    consumer_throughput_queue = greenstalk.Client(host='127.0.0.1', port=12000, use='consumer_throughput')
+    def __init__(self, tube=CONSUMER_THROUGHPUT_TUBE, consumer_id="consumer-0", producer_count=1):
+        """
+        :param tube: the configuration's consumer_throughput_tube (the shared tube unless per_configuration_tubes)
+        """
+        self.tube = tube
+        self.consumer_throughput_queue = greenstalk.Client(host=BEANSTALKD_HOST, port=BEANSTALKD_PORT, use=tube)
+        self.consumer_id = consumer_id
+        self.producer_count = producer_count
+
+    def push(self, throughput):
+        self.consumer_throughput_queue.put(encode_report(self.consumer_id, [(time.time(), throughput,
+                                                                             self.producer_count)]))
 
     @threaded
     def run(self, post_interval, degraded_after_interval):
         print(
-            f"[MockQueuePusher] Pushing to consumer_through_put_queue every {post_interval}s, with degradation after_{degraded_after_interval}s")
+            f"[MockQueuePusher] Pushing to {self.tube} every {post_interval}s, with degradation after_{degraded_after_interval}s")
         iterations = degraded_after_interval / post_interval
 
         while True:
             i = 0
             while i < iterations:
                 print(f"[MockQueuePusher] Pushing normal throughput to queue {DEFAULT_THROUGHPUT_MB_S}")
-                self.consumer_throughput_queue.put(str(DEFAULT_THROUGHPUT_MB_S))
+                self.push(DEFAULT_THROUGHPUT_MB_S)
                 time.sleep(post_interval)
                 i += 1
 
@@ -36,13 +50,14 @@ class MockQueuePusher:
             j = 0
             while j <= 2:
                 print(f"[MockQueuePusher] Pushing degradation to queue {below_tolerance}")
-                self.consumer_throughput_queue.put(str(below_tolerance))
+                self.push(below_tolerance)
                 time.sleep(post_interval)
                 j += 1
 
 
 class MockQueuePoller:
-    consumer_throughput_queue = greenstalk.Client(host='127.0.0.1', port=12000, watch='consumer_throughput')
+    def __init__(self, tube=CONSUMER_THROUGHPUT_TUBE):
+        self.consumer_throughput_queue = greenstalk.Client(host=BEANSTALKD_HOST, port=BEANSTALKD_PORT, watch=tube)
 
     @threaded
     def run(self, poll_interval):
@@ -53,7 +68,7 @@ class MockQueuePoller:
         while True:
             try:
                 job = self.consumer_throughput_queue.reserve()
-                throughput = float(job.body)
+                throughput = decode_report(job.body)[-1]["throughput"]
 
                 print(f"[MockQueuePoller] throughput={throughput}")
 
@@ -81,8 +96,18 @@ class MockQueuePoller:
 # For threading approach
 # see https://stackoverflow.com/questions/19846332/python-threading-inside-a-class/19846691
 if __name__ == '__main__':
-    c = MockQueuePusher()
-    #d = MockQueuePoller()
+    parser = argparse.ArgumentParser(description='Mock consumer throughput reports')
+    parser.add_argument('--tube',
+                        type=str,
+                        default=CONSUMER_THROUGHPUT_TUBE,
+                        help="The tube to publish to, e.g. consumer_throughput_<configuration_uid>. "
+                             "Default=consumer_throughput",
+                        required=False
+                        )
+    args = parser.parse_args()
+
+    c = MockQueuePusher(args.tube)
+    #d = MockQueuePoller(args.tube)
     handle1 = c.run(5, 15)
     #handle2 = d.run(5)
     handle1.join()
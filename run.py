@@ -1,11 +1,14 @@
 import argparse
-import greenstalk
+import sys
 
 from fs.batch_size_controller import BatchSizeController
 from fs.consumer_controller import ConsumerController
+from fs.controller import check_resumable
 from fs.debug_controller import DebugController
 from fs.partition_count_controller import PartitionCountController
+from fs.queue_backend import QUEUE_BEANSTALK, QUEUE_SHM, create_queue
 from fs.replication_factor_controller import ReplicationFactorController
+from fs.run_journal import ResumeError
 
 
 def run():
@@ -15,37 +18,61 @@ def run():
                         help="The controller to run. Default=DebugController",
                         required=False
                         )
+    parser.add_argument('--resume',
+                        type=str,
+                        help="The uid of an interrupted run to resume, e.g. run_AD56F8",
+                        required=False
+                        )
+    parser.add_argument('--queue',
+                        type=str,
+                        # note - not the in-memory queue, the test processes are forked (and so have a copy of it)
+                        choices=[QUEUE_BEANSTALK, QUEUE_SHM],
+                        default=QUEUE_BEANSTALK,
+                        help="The consumer throughput queue backend. Default=beanstalk",
+                        required=False
+                        )
     args = parser.parse_args()
 
-    consumer_throughput_queue = greenstalk.Client(host='127.0.0.1', port=12000, watch='consumer_throughput')
+    try:
+        run_controller(args)
+    except ResumeError as e:
+        sys.exit(f"Error: {e}")
+
+
+def run_controller(args):
+    # before connecting to the queue
+    if args.resume is not None:
+        check_resumable(args.resume)
+
+    consumer_throughput_queue = create_queue(args.queue)
 
     if args.controller == "batch-size":
         print("Starting Batch Size Controller")
-        c = BatchSizeController(consumer_throughput_queue)
+        c = BatchSizeController(consumer_throughput_queue, run_uid=args.resume)
         c.flush_consumer_throughput_queue()
         c.run()
         return
     elif args.controller == "consumer":
         print("Starting Consumer Controller")
-        c = ConsumerController(consumer_throughput_queue)
+        c = ConsumerController(consumer_throughput_queue, run_uid=args.resume)
         c.flush_consumer_throughput_queue()
         c.run()
         return
     elif args.controller == "partition-count":
         print("Starting Partition Count Controller")
-        c = PartitionCountController(consumer_throughput_queue)
+        c = PartitionCountController(consumer_throughput_queue, run_uid=args.resume)
         c.flush_consumer_throughput_queue()
         c.run()
         return
     elif args.controller == "replication-factor":
         print("Starting Replication Factor Controller")
-        c = ReplicationFactorController(consumer_throughput_queue)
+        c = ReplicationFactorController(consumer_throughput_queue, run_uid=args.resume)
         c.flush_consumer_throughput_queue()
         c.run()
         return
     elif args.controller == "debug":
         print("Starting Debug Controller")
-        c = DebugController(consumer_throughput_queue)
+        c = DebugController(consumer_throughput_queue, run_uid=args.resume)
         c.flush_consumer_throughput_queue()
         c.run()
         return
@@ -0,0 +1,5 @@
+#!/bin/bash
+source ./export-gcp-credentials.sh
+
+# one line per running pod: "<namespace> <name>"
+kubectl get pods --all-namespaces --field-selector=status.phase==Running -o jsonpath='{range .items[*]}{.metadata.namespace}{" "}{.metadata.name}{"\n"}{end}' --kubeconfig ./kubeconfig.yaml
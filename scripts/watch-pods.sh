@@ -0,0 +1,7 @@
+#!/bin/bash
+NAMESPACE=$1
+
+source ./export-gcp-credentials.sh
+
+# one line per pod event: "<ADDED|MODIFIED|DELETED> <name> <phase>"
+exec kubectl -n $NAMESPACE get pods --watch --output-watch-events -o jsonpath='{.type} {.object.metadata.name} {.object.status.phase}{"\n"}' --kubeconfig ./kubeconfig.yaml
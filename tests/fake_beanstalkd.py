@@ -0,0 +1,189 @@
+"""
+Fake beanstalkd server, run in a background thread of the test process.
+
+Implements the commands used by fs.beanstalk_batch and fs.async_beanstalk
+(use, watch, ignore, put, reserve-with-timeout, delete, release). As per beanstalkd,
+the commands on a connection are answered in order, and the jobs reserved by a
+connection are released when it is closed.
+
+Usage:
+    server = FakeBeanstalkd()
+    server.start()
+    client = greenstalk.Client(server.host, server.port)
+    ...
+    server.stop()
+"""
+import collections
+import itertools
+import socketserver
+import threading
+import time
+
+DEFAULT_TUBE = "default"
+
+
+class FakeBeanstalkd:
+    """
+    - deadline_soon: a reserve which would wait answers DEADLINE_SOON instead
+      (as if a job reserved by the connection was about to time out)
+    - inject(response, after): answer a later reserve or delete with the given response, e.g. b"BOGUS"
+    """
+    def __init__(self, host="127.0.0.1"):
+        self.host = host
+        self.deadline_soon = False
+
+        self.condition = threading.Condition()
+        self.tubes = collections.defaultdict(collections.deque)
+        # job id -> (tube, body)
+        self.reserved = {}
+        self.injected = collections.deque()
+        self.ids = itertools.count(1)
+
+        self.server = socketserver.ThreadingTCPServer((host, 0), FakeBeanstalkdHandler)
+        self.server.daemon_threads = True
+        self.server.fake = self
+        self.port = self.server.server_address[1]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def inject(self, response, after=0):
+        """
+        :param response:
+        :param after: number of reserves/deletes to answer as usual first
+        """
+        with self.condition:
+            self.injected.append([after, response])
+
+    def next_injected(self):
+        if not self.injected:
+            return None
+
+        if self.injected[0][0] > 0:
+            self.injected[0][0] -= 1
+            return None
+
+        return self.injected.popleft()[1]
+
+    def ready_count(self, tube=DEFAULT_TUBE):
+        with self.condition:
+            return len(self.tubes[tube])
+
+    def reserved_count(self):
+        with self.condition:
+            return len(self.reserved)
+
+    def put(self, tube, body):
+        with self.condition:
+            job_id = next(self.ids)
+            self.tubes[tube].append((job_id, body))
+            self.condition.notify_all()
+            return b"INSERTED %d" % job_id
+
+    def reserve(self, watched, timeout, owned):
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            injected = self.next_injected()
+            if injected is not None:
+                return injected
+
+            while True:
+                for tube in watched:
+                    if self.tubes[tube]:
+                        job_id, body = self.tubes[tube].popleft()
+                        self.reserved[job_id] = (tube, body)
+                        owned.add(job_id)
+                        return b"RESERVED %d %d\r\n%b" % (job_id, len(body), body)
+
+                if self.deadline_soon:
+                    return b"DEADLINE_SOON"
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return b"TIMED_OUT"
+                self.condition.wait(remaining)
+
+    def delete(self, job_id, owned):
+        with self.condition:
+            injected = self.next_injected()
+            if injected is not None:
+                return injected
+
+            if job_id not in owned:
+                return b"NOT_FOUND"
+            owned.discard(job_id)
+            del self.reserved[job_id]
+            return b"DELETED"
+
+    def release(self, job_id, owned):
+        with self.condition:
+            if job_id not in owned:
+                return b"NOT_FOUND"
+            owned.discard(job_id)
+            self.release_jobs([job_id])
+            return b"RELEASED"
+
+    def release_jobs(self, job_ids):
+        with self.condition:
+            for job_id in sorted(job_ids, reverse=True):
+                tube, body = self.reserved.pop(job_id)
+                self.tubes[tube].appendleft((job_id, body))
+            self.condition.notify_all()
+
+
+class FakeBeanstalkdHandler(socketserver.StreamRequestHandler):
+    """
+    One client connection
+    """
+    def handle(self):
+        fake = self.server.fake
+        use = DEFAULT_TUBE
+        watched = [DEFAULT_TUBE]
+        owned = set()
+
+        try:
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+
+                command, *args = line.decode("ascii").split()
+                if command == "put":
+                    body = self.rfile.read(int(args[3]) + 2)[:-2]
+                    response = fake.put(use, body)
+                elif command == "use":
+                    use = args[0]
+                    response = b"USING %b" % use.encode("ascii")
+                elif command == "watch":
+                    if args[0] not in watched:
+                        watched.append(args[0])
+                    response = b"WATCHING %d" % len(watched)
+                elif command == "ignore":
+                    if watched == [args[0]]:
+                        response = b"NOT_IGNORED"
+                    else:
+                        if args[0] in watched:
+                            watched.remove(args[0])
+                        response = b"WATCHING %d" % len(watched)
+                elif command == "reserve-with-timeout":
+                    response = fake.reserve(watched, int(args[0]), owned)
+                elif command == "delete":
+                    response = fake.delete(int(args[0]), owned)
+                elif command == "release":
+                    response = fake.release(int(args[0]), owned)
+                else:
+                    response = b"UNKNOWN_COMMAND"
+
+                self.wfile.write(response + b"\r\n")
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            # note - as per beanstalkd, jobs reserved by a closed connection are ready again
+            fake.release_jobs(owned)
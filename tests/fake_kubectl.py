@@ -0,0 +1,31 @@
+"""
+Fake "kubectl get pods --watch" which replays a script of watch output, one line at a time.
+
+Usage: python fake_kubectl.py SCRIPT_FILE
+
+Script lines:
+  sleep <seconds>   pause
+  hold              keep the watch open (until killed)
+  exit <code>       end the watch
+  anything else     printed as a watch event, e.g. "MODIFIED kafka-0 Running"
+"""
+import sys
+import time
+
+
+def run(script_file):
+    with open(script_file) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("sleep "):
+                time.sleep(float(line.split()[1]))
+            elif line == "hold":
+                time.sleep(3600)
+            elif line.startswith("exit "):
+                sys.exit(int(line.split()[1]))
+            elif line:
+                print(line, flush=True)
+
+
+if __name__ == '__main__':
+    run(sys.argv[1])
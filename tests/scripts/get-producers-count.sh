@@ -1 +0,0 @@
-echo "Test script does nothing."
\ No newline at end of file
@@ -0,0 +1,72 @@
+import os
+import random
+import shutil
+import statistics
+import unittest
+
+from fs.consumer_controller import ConsumerController
+from fs.simulator import simulated, ThroughputModel
+from fs.soak_test_process import SoakTestProcess, SOAK_TEST_S, SOAK_FIXED, SOAK_ADAPTIVE
+from fs.streaming_stats import BatchMeans
+
+
+class TestAdaptiveSoak(unittest.TestCase):
+
+    def test_batch_means(self):
+        rng = random.Random(7)
+        values = [rng.gauss(10, 1) for _ in range(600)]
+
+        batch_means = BatchMeans(6)
+        for value in values:
+            batch_means.add(value)
+
+        self.assertEqual(100, batch_means.count)
+        self.assertAlmostEqual(statistics.mean(values), batch_means.mean)
+        # ~ 1.98 * (1 / sqrt(6)) / sqrt(100)
+        self.assertAlmostEqual(0.08, batch_means.half_width(), delta=0.02)
+        self.assertLess(abs(batch_means.mean - 10), batch_means.half_width())
+
+        self.assertIsNone(BatchMeans(6).half_width())
+
+    def soak(self, noise, **configuration):
+        """
+        :return: the soak metrics
+        """
+        controller = simulated(ConsumerController)(model=ThroughputModel({"noise": noise}))
+        self.addCleanup(shutil.rmtree, os.path.join(controller.log_directory, controller.run_uid))
+
+        controller.load_configurations()
+        configuration = dict(controller.configurations[0], sequence_number=1, num_consumers=1, **configuration)
+        self.assertTrue(controller.provision_node_pools(configuration))
+        self.assertTrue(controller.setup_configuration(configuration))
+        controller.k8s_configure_producers(2, configuration["message_size_kb"])
+
+        process = SoakTestProcess(configuration, controller.consumer_throughput_queue)
+        controller.run_process(process, configuration)
+
+        return process.load_jsonl(os.path.join(controller.log_directory, controller.run_uid,
+                                               f"{configuration['configuration_uid']}_metrics_1.csv"))[-1]
+
+    def test_soak_modes(self):
+        floor_s = SOAK_TEST_S * 3 / 2
+
+        # fixed: the page cache duration, with the interval reported
+        metrics = self.soak(0.1, soak_mode=SOAK_FIXED)
+        self.assertAlmostEqual(floor_s, float(metrics["soak_duration_s"]), delta=10)
+        self.assertNotEqual("None", metrics["soak_ci_half_width_gbps"])
+
+        # converged by the end of the page cache duration
+        metrics = self.soak(0.01, soak_mode=SOAK_ADAPTIVE)
+        self.assertAlmostEqual(floor_s, float(metrics["soak_duration_s"]), delta=10)
+        self.assertLessEqual(float(metrics["soak_ci_relative_half_width"]), 0.02)
+
+        # converges later
+        metrics = self.soak(0.2, soak_mode=SOAK_ADAPTIVE)
+        self.assertGreater(float(metrics["soak_duration_s"]), floor_s + 30)
+        self.assertLess(float(metrics["soak_duration_s"]), 3600)
+        self.assertLessEqual(float(metrics["soak_ci_relative_half_width"]), 0.02)
+
+        # out of budget
+        metrics = self.soak(0.5, soak_mode=SOAK_ADAPTIVE, soak_max_s=1200)
+        self.assertAlmostEqual(1200, float(metrics["soak_duration_s"]), delta=10)
+        self.assertGreater(float(metrics["soak_ci_relative_half_width"]), 0.02)
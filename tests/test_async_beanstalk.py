@@ -0,0 +1,100 @@
+import asyncio
+import unittest
+
+import greenstalk
+
+from fs.async_beanstalk import AsyncBeanstalkClient
+from tests.fake_beanstalkd import FakeBeanstalkd
+from tests.test_beanstalk_batch import wait_until
+
+TUBE = "consumer_throughput"
+
+
+class TestAsyncBeanstalkClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeBeanstalkd()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def run_client(self, scenario):
+        async def run():
+            client = await AsyncBeanstalkClient.connect(self.server.host, self.server.port, use=TUBE, watch=TUBE)
+            try:
+                return await scenario(client)
+            finally:
+                await client.close()
+
+        return asyncio.run(run())
+
+    def test_put_reserve_delete(self):
+        async def scenario(client):
+            job_id = await client.put("report")
+            job = await client.reserve(timeout=1)
+            self.assertEqual((job_id, "report"), (job.id, job.body))
+            await client.delete(job)
+            with self.assertRaises(greenstalk.NotFoundError):
+                await client.delete(job)
+
+        self.run_client(scenario)
+
+    def test_reserve_batch(self):
+        async def scenario(client):
+            for i in range(3):
+                await client.put(f"report-{i}")
+
+            # fewer jobs ready than requested, the remaining reserves do not wait
+            jobs = await client.reserve_batch(10, timeout=1)
+            self.assertEqual(["report-0", "report-1", "report-2"], [job.body for job in jobs])
+            self.assertEqual(3, self.server.reserved_count())
+
+            self.assertEqual([], await client.reserve_batch(10, timeout=0))
+            # the connection is still in step
+            self.assertEqual(4, await client.put("report-3"))
+            return jobs
+
+        self.run_client(scenario)
+
+    def test_delete_batch(self):
+        async def scenario(client):
+            for i in range(3):
+                await client.put(f"report-{i}")
+            jobs = await client.reserve_batch(3, timeout=1)
+
+            self.assertEqual([], await client.delete_batch(jobs[0:2]))
+            # already deleted, or never reserved
+            self.assertEqual([jobs[0].id, 99], await client.delete_batch([jobs[0], jobs[2], 99]))
+            self.assertEqual(0, self.server.reserved_count())
+            self.assertEqual([], await client.delete_batch([]))
+
+        self.run_client(scenario)
+
+    def test_deadline_soon(self):
+        async def scenario(client):
+            self.server.deadline_soon = True
+            with self.assertRaises(greenstalk.DeadlineSoonError):
+                await client.reserve_batch(5, timeout=1)
+
+            # not raised while jobs are returned
+            await client.put("report")
+            self.assertEqual(["report"], [job.body for job in await client.reserve_batch(5, timeout=1)])
+
+        self.run_client(scenario)
+
+    def test_reserve_fails_mid_batch(self):
+        async def scenario(client):
+            for i in range(3):
+                await client.put(f"report-{i}")
+            self.server.inject(b"BOGUS", after=1)
+
+            with self.assertRaises(ConnectionError):
+                await client.reserve_batch(3, timeout=0)
+
+        self.run_client(scenario)
+        # closed, so the job reserved before the failure is ready again
+        self.assertTrue(wait_until(lambda: self.server.ready_count(TUBE) == 3))
+        self.assertEqual(0, self.server.reserved_count())
+
+
+if __name__ == '__main__':
+    unittest.main()
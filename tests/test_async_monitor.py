@@ -0,0 +1,184 @@
+import asyncio
+import unittest
+
+import greenstalk
+
+from fs.async_monitor import AsyncProducerScaler, AsyncThroughputMonitor
+from fs.process_stages import StageError
+from fs.queue_backend import BeanstalkQueue, InMemoryQueue
+from fs.report_protocol import encode_report
+from fs.utils import PRODUCER_CONSUMER_NAMESPACE
+from tests.fake_beanstalkd import FakeBeanstalkd
+
+TUBE = "consumer_throughput"
+
+
+class FakeScaler(AsyncProducerScaler):
+    """
+    Runs no scripts: scaling waits until released (as per a slow kubectl call), then sets the running producers
+    """
+    def __init__(self):
+        super().__init__(refresh_interval_s=3600)
+        self.released = asyncio.Event()
+        self.released.set()
+        self.applied = []
+        self.running = 0
+
+    async def run_script(self, *args):
+        if args[0] == "./scale-producers.sh":
+            await self.released.wait()
+            self.applied.append(int(args[1]))
+            self.running = int(args[1])
+            return ""
+
+        return "".join(f"{PRODUCER_CONSUMER_NAMESPACE} producer-{i}\n" for i in range(self.running))
+
+
+class FakeProcess:
+    """
+    Complete after sample_count samples, requesting a final scale on completion
+    """
+    def __init__(self, sample_count, final_producer_count):
+        self.sample_count = sample_count
+        self.final_producer_count = final_producer_count
+        self.samples = []
+        self.scaler = None
+        self.stopped = False
+
+    def attach_scaler(self, scaler):
+        self.scaler = scaler
+
+    def on_start(self):
+        self.scaler.scale_producers(2)
+
+    def process_samples(self, samples):
+        self.samples.extend(samples)
+        return len(self.samples) >= self.sample_count
+
+    def complete(self):
+        self.scaler.scale_producers(self.final_producer_count)
+
+    def stop(self):
+        self.stopped = True
+
+    def is_stopped(self):
+        return self.stopped
+
+
+async def wait_until(condition, timeout_s=5):
+    deadline = asyncio.get_running_loop().time() + timeout_s
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+
+class TestAsyncProducerScaler(unittest.TestCase):
+
+    def test_latest_request_wins(self):
+        async def scenario():
+            scaler = FakeScaler()
+            scaler.released.clear()
+            task = asyncio.create_task(scaler.actuate_loop())
+
+            scaler.scale_producers(2)
+            self.assertTrue(await wait_until(lambda: not scaler._scale_requested.is_set()))
+            # requested while 2 is being applied, only the latest is applied next
+            for producer_count in [3, 4, 5]:
+                scaler.scale_producers(producer_count)
+
+            scaler.released.set()
+            self.assertTrue(await wait_until(lambda: len(scaler.applied) == 2))
+            task.cancel()
+
+            self.assertEqual([2, 5], scaler.applied)
+            # refreshed after scaling
+            self.assertEqual(5, scaler.get_producer_count())
+
+        asyncio.run(scenario())
+
+    def test_flush(self):
+        async def scenario():
+            scaler = FakeScaler()
+            await scaler.flush()
+            self.assertEqual([], scaler.applied)
+
+            scaler.scale_producers(3)
+            scaler.scale_producers(1)
+            await scaler.flush()
+            await scaler.flush()
+            self.assertEqual([1], scaler.applied)
+
+        asyncio.run(scenario())
+
+
+class TestAsyncThroughputMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeBeanstalkd()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def test_flush_on_completion(self):
+        publisher = greenstalk.Client(self.server.host, self.server.port, use=TUBE)
+        self.addCleanup(publisher.close)
+        for i in range(10):
+            publisher.put(encode_report("consumer-0", [(i, 100.0, 1)]))
+
+        scalers = []
+
+        def scaler_factory():
+            scalers.append(FakeScaler())
+            return scalers[0]
+
+        queue = BeanstalkQueue(self.server.host, self.server.port)
+        self.addCleanup(queue.close)
+        process = FakeProcess(sample_count=10, final_producer_count=0)
+        AsyncThroughputMonitor(process, queue, tube=TUBE, batch_size=4, scaler_factory=scaler_factory).run()
+
+        self.assertEqual(10, len(process.samples))
+        self.assertEqual(0, self.server.ready_count(TUBE))
+        self.assertEqual(0, self.server.reserved_count())
+        # the request made on completion is applied before the monitor returns
+        self.assertEqual(0, scalers[0].applied[-1])
+        self.assertEqual(0, scalers[0].get_producer_count())
+
+    def test_ingest_error(self):
+        publisher = greenstalk.Client(self.server.host, self.server.port, use=TUBE)
+        self.addCleanup(publisher.close)
+        publisher.put(encode_report("consumer-0", [(0, 100.0, 1)]))
+        self.server.inject(b"BOGUS")
+
+        queue = BeanstalkQueue(self.server.host, self.server.port)
+        self.addCleanup(queue.close)
+        process = FakeProcess(sample_count=10, final_producer_count=0)
+        with self.assertRaises(StageError):
+            AsyncThroughputMonitor(process, queue, tube=TUBE, scaler_factory=FakeScaler).run()
+
+        self.assertTrue(process.is_stopped())
+        # not completed
+        self.assertEqual([], process.scaler.applied[1:])
+
+
+class TestAsyncThroughputMonitorInMemory(unittest.TestCase):
+
+    def test_configuration_tube(self):
+        queue = InMemoryQueue()
+        publisher = queue.connection(use="consumer_throughput_2")
+        for i in range(10):
+            publisher.put(encode_report("consumer-0", [(i, 100.0, 1)]))
+        # not watched
+        queue.put(encode_report("consumer-1", [(0, 100.0, 1)]))
+
+        process = FakeProcess(sample_count=10, final_producer_count=0)
+        AsyncThroughputMonitor(process, queue, tube="consumer_throughput_2", batch_size=4,
+                               scaler_factory=FakeScaler).run()
+
+        self.assertEqual(["consumer-0"] * 10, [sample["consumer_id"] for sample in process.samples])
+        self.assertEqual([], queue.connection(watch="consumer_throughput_2").reserve_batch(10, timeout=0))
+        self.assertEqual(1, len(queue.reserve_batch(10, timeout=0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
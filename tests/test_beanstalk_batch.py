@@ -0,0 +1,149 @@
+import socket
+import time
+import unittest
+
+import greenstalk
+
+from fs.beanstalk_batch import reserve_batch, delete_batch
+from fs.queue_backend import BeanstalkQueue
+from tests.fake_beanstalkd import FakeBeanstalkd
+
+TUBE = "consumer_throughput"
+
+
+def wait_until(condition, timeout_s=5):
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestBeanstalkBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeBeanstalkd()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+        self.client = greenstalk.Client(self.server.host, self.server.port, use=TUBE, watch=TUBE)
+        self.addCleanup(self.close_client)
+
+    def close_client(self):
+        try:
+            self.client.close()
+        except OSError:
+            pass
+
+    def put(self, count):
+        return [self.client.put(f"report-{i}") for i in range(count)]
+
+    def test_partial_batch(self):
+        job_ids = self.put(3)
+
+        jobs = reserve_batch(self.client, 10, timeout=1)
+        self.assertEqual(job_ids, [job.id for job in jobs])
+        self.assertEqual(["report-0", "report-1", "report-2"], [job.body for job in jobs])
+
+        # the connection is still in step
+        self.assertEqual([], delete_batch(self.client, jobs))
+        self.assertEqual(0, self.server.reserved_count())
+        self.assertEqual([], reserve_batch(self.client, 10, timeout=0))
+
+    def test_first_reserve_times_out(self):
+        start_s = time.monotonic()
+        self.assertEqual([], reserve_batch(self.client, 10, timeout=1))
+        self.assertGreaterEqual(time.monotonic() - start_s, 1)
+
+        self.put(1)
+        self.assertEqual(1, len(reserve_batch(self.client, 10, timeout=1)))
+
+    def test_deadline_soon(self):
+        self.server.deadline_soon = True
+        with self.assertRaises(greenstalk.DeadlineSoonError):
+            reserve_batch(self.client, 5, timeout=1)
+
+        # not raised while jobs are returned, and the remaining responses are read
+        self.put(2)
+        self.assertEqual(2, len(reserve_batch(self.client, 5, timeout=1)))
+        self.assertEqual(3, self.client.put("report-2"))
+
+    def test_delete_not_found(self):
+        self.put(3)
+        jobs = reserve_batch(self.client, 3, timeout=0)
+        self.assertEqual([], delete_batch(self.client, jobs[0:1]))
+
+        # already deleted, or never reserved
+        self.assertEqual([jobs[0].id, 99], delete_batch(self.client, [jobs[0], jobs[1], 99, jobs[2]]))
+        self.assertEqual(0, self.server.reserved_count())
+        self.assertEqual([], delete_batch(self.client, []))
+
+    def test_reserve_fails_mid_batch(self):
+        self.put(3)
+        self.server.inject(b"BOGUS", after=2)
+
+        with self.assertRaises(ConnectionError):
+            reserve_batch(self.client, 3, timeout=0)
+
+        # closed, so the jobs reserved before the failure are ready again
+        self.assertTrue(wait_until(lambda: self.server.ready_count(TUBE) == 3))
+        self.assertEqual(0, self.server.reserved_count())
+
+    def test_delete_fails_mid_batch(self):
+        self.put(3)
+        jobs = reserve_batch(self.client, 3, timeout=0)
+        self.server.inject(b"BOGUS", after=1)
+
+        with self.assertRaises(ConnectionError):
+            delete_batch(self.client, jobs)
+
+        # the job which failed to delete is released
+        # note - the delete pipelined after it may or may not reach the server before the connection is closed
+        self.assertTrue(wait_until(lambda: self.server.reserved_count() == 0))
+        self.assertIn(self.server.ready_count(TUBE), [1, 2])
+
+
+class TestBeanstalkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeBeanstalkd()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+        self.queue = BeanstalkQueue(self.server.host, self.server.port, use=TUBE, watch=TUBE)
+        self.addCleanup(self.queue.close)
+
+    def test_reconnects_after_failed_batch(self):
+        for i in range(4):
+            self.queue.put(f"report-{i}")
+        self.server.inject(b"BOGUS", after=1)
+
+        with self.assertRaises(ConnectionError):
+            self.queue.reserve_batch(2, timeout=0)
+
+        # the next calls reconnect (watching the same tube), and get the released jobs
+        jobs = self.queue.reserve_batch(2, timeout=1)
+        self.assertEqual(["report-0", "report-1"], sorted(job.body for job in jobs))
+        self.assertEqual([], self.queue.delete_batch(jobs))
+        jobs = self.queue.reserve_batch(5, timeout=1)
+        self.assertEqual(["report-2", "report-3"], sorted(job.body for job in jobs))
+        self.assertEqual([], self.queue.delete_batch(jobs))
+        self.assertEqual(0, self.server.ready_count(TUBE))
+
+    def test_reconnect_fails(self):
+        self.server.inject(b"BOGUS")
+        with self.assertRaises(ConnectionError):
+            self.queue.reserve_batch(2, timeout=0)
+
+        # still a ConnectionError (rather than a closed socket) while beanstalkd is down
+        with socket.socket() as s:
+            s.bind((self.server.host, 0))
+            self.queue.port = s.getsockname()[1]
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                self.queue.reserve_batch(2, timeout=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
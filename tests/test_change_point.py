@@ -0,0 +1,87 @@
+import os
+import random
+import shutil
+import unittest
+
+from fs.change_point import ChangePointDetector, get_stop_detector, trend_t, STOP_DETECTOR_CUSUM, \
+    STOP_DETECTOR_WINDOW, STATE_WARMING_UP, STATE_UNDECIDED, STATE_OK, STATE_SATURATED
+from fs.consumer_controller import ConsumerController
+from fs.simulator import simulated
+from fs.stress_test_process import StressTestProcess
+
+
+def detect(detector, values, tolerance=1.0):
+    return [detector.add("consumer-0", 1, value, tolerance) for value in values]
+
+
+class TestChangePoint(unittest.TestCase):
+
+    def test_trend(self):
+        self.assertGreater(trend_t([1.0, 2.1, 2.9, 4.0]), 10)
+        self.assertLess(abs(trend_t([2.0, 2.1, 1.9, 2.0])), 2)
+        self.assertEqual(0.0, trend_t([2.0, 2.0, 2.0, 2.0]))
+
+    def test_warm_up(self):
+        # ramps up, then steady well above the tolerance
+        detections = detect(ChangePointDetector(), [0.2, 0.6, 1.0, 1.4, 1.5, 1.52, 1.49, 1.51, 1.5, 1.5])
+        states = [d.state for d in detections]
+
+        self.assertEqual([STATE_WARMING_UP] * 7 + [STATE_UNDECIDED, STATE_OK, STATE_OK], states)
+        self.assertGreater(detections[-1].confidence, 0.95)
+        self.assertTrue(detections[-2].changed)
+        self.assertFalse(detections[-1].changed)
+
+    def test_saturation(self):
+        rng = random.Random(1)
+        # noisy but above the tolerance: no false stop
+        detector = ChangePointDetector()
+        detections = detect(detector, [rng.gauss(1.05, 0.03) for _ in range(200)])
+        self.assertNotIn(STATE_SATURATED, [d.state for d in detections])
+
+        # then drops below it
+        detections = detect(detector, [rng.gauss(0.9, 0.03) for _ in range(5)])
+        self.assertEqual(STATE_SATURATED, detections[-1].state)
+        self.assertGreater(detections[-1].confidence, 0.99)
+
+    def test_undecided(self):
+        # at the tolerance, neither ok nor saturated
+        detections = detect(ChangePointDetector(), [1.0] * 10)
+        self.assertEqual(STATE_UNDECIDED, detections[-1].state)
+        self.assertIsNone(detections[-1].confidence)
+
+    def test_get_stop_detector(self):
+        self.assertIsNone(get_stop_detector({}))
+        self.assertIsNone(get_stop_detector({"stop_detector": STOP_DETECTOR_WINDOW}))
+        self.assertIsInstance(get_stop_detector({"stop_detector": STOP_DETECTOR_CUSUM}), ChangePointDetector)
+        with self.assertRaises(ValueError):
+            get_stop_detector({"stop_detector": "bayesian"})
+
+    def test_simulated_stress_test(self):
+        # a single consumer saturates at 3 producers
+        controller = simulated(ConsumerController)()
+        self.addCleanup(shutil.rmtree, os.path.join(controller.log_directory, controller.run_uid))
+
+        controller.load_configurations()
+        configuration = dict(controller.configurations[0], sequence_number=1, num_consumers=1, start_producer_count=1)
+        self.assertTrue(controller.provision_node_pools(configuration))
+
+        elapsed_s = {}
+        for stop_detector in [STOP_DETECTOR_WINDOW, STOP_DETECTOR_CUSUM]:
+            configuration["stop_detector"] = stop_detector
+            self.assertTrue(controller.setup_configuration(configuration))
+            controller.k8s_configure_producers(1, configuration["message_size_kb"])
+
+            process = StressTestProcess(configuration, controller.consumer_throughput_queue)
+            start_s = controller.clock.time()
+            controller.run_process(process, configuration)
+            elapsed_s[stop_detector] = controller.clock.time() - start_s
+
+            metrics = process.load_jsonl(os.path.join(controller.log_directory, controller.run_uid,
+                                                      f"{configuration['configuration_uid']}_metrics_1.csv"))[-1]
+            self.assertEqual("3", metrics["stress_saturation_producers"])
+            details = process.load_jsonl(os.path.join(controller.log_directory, controller.run_uid,
+                                                      f"{configuration['configuration_uid']}_details_1.jsonl"))[-1]
+
+        self.assertEqual(STATE_SATURATED, details["stress_detections"][-1]["state"])
+        self.assertEqual(str(len(details["stress_detections"])), metrics["stress_detection_count"])
+        self.assertLess(elapsed_s[STOP_DETECTOR_CUSUM], 0.75 * elapsed_s[STOP_DETECTOR_WINDOW])
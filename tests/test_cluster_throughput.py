@@ -0,0 +1,54 @@
+import unittest
+
+from fs.cluster_throughput import ClusterThroughputAggregator
+
+
+class TestClusterThroughputAggregator(unittest.TestCase):
+
+    def test_missing_late_and_stopped_consumers(self):
+        aggregator = ClusterThroughputAggregator(interval_s=5)
+        for interval in range(10):
+            for consumer in range(3):
+                # consumer 2 misses an interval, consumer 1 stops reporting
+                if (consumer == 2 and interval == 4) or (consumer == 1 and interval >= 7):
+                    continue
+                aggregator.add(f"consumer-{consumer}", 1.0, producer_count=5,
+                               timestamp=1000 + interval * 5 + consumer * 0.5)
+
+        # too late, the first interval has been closed
+        aggregator.add("consumer-0", 9.0, producer_count=5, timestamp=1000)
+        aggregator.flush()
+
+        series = aggregator.series()
+        # the missed report is carried forward, consumer 1 is carried forward once then dropped
+        self.assertEqual([3, 3, 3, 3, 3, 3, 3, 3, 2, 2], series["throughput_gbps"].tolist())
+        self.assertEqual([0, 0, 0, 0, 1, 0, 0, 1, 0, 0], series["imputed"].tolist())
+        self.assertEqual(1, aggregator.late_samples)
+
+        summary = aggregator.summary(producer_count=5)
+        self.assertEqual(10, summary["intervals"])
+        self.assertAlmostEqual(2.8, summary["mean"])
+        self.assertEqual({"intervals": 0}, aggregator.summary(producer_count=6))
+
+    def test_recent_intervals_bounded(self):
+        closed = []
+        aggregator = ClusterThroughputAggregator(interval_s=5, max_recent_intervals=10,
+                                                 on_close=lambda *interval: closed.append(interval))
+        for interval in range(100):
+            aggregator.add("consumer-0", float(interval % 10), producer_count=1 + interval // 50,
+                           timestamp=interval * 5)
+        aggregator.flush()
+
+        # only the recent intervals are kept, all of them are summarised
+        series = aggregator.series()
+        self.assertEqual(list(range(450, 500, 5)), series["time"].tolist())
+        self.assertEqual(100, aggregator.closed_count)
+        self.assertEqual(100, len(closed))
+        self.assertEqual((0, 0.0, 1, 1, 0), closed[0])
+
+        summary = aggregator.summary()
+        self.assertEqual(100, summary["intervals"])
+        self.assertAlmostEqual(4.5, summary["mean"])
+        self.assertEqual((0.0, 9.0), (summary["min"], summary["max"]))
+        self.assertEqual(50, aggregator.summary(producer_count=2)["intervals"])
+
@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import unittest
+
+from fs.consumer_controller import ConsumerController
+from fs.consumer_tubes import TubeCollector, drain_tube, get_consumer_throughput_tube, is_consumer_throughput_tube
+from fs.simulator import simulated, SimulatedQueue
+from fs.utils import CONSUMER_THROUGHPUT_TUBE
+
+
+class TestConsumerTubes(unittest.TestCase):
+
+    def test_tube_names(self):
+        tube = get_consumer_throughput_tube({"configuration_uid": "B1C2D3"})
+        self.assertEqual("consumer_throughput_B1C2D3", tube)
+        self.assertTrue(is_consumer_throughput_tube(tube))
+        self.assertTrue(is_consumer_throughput_tube(CONSUMER_THROUGHPUT_TUBE))
+        self.assertFalse(is_consumer_throughput_tube("default"))
+
+    def test_collector(self):
+        queue = SimulatedQueue()
+        publisher = queue.connection(use="consumer_throughput_A")
+        for i in range(1000):
+            publisher.put(str(i))
+
+        self.assertEqual(0, drain_tube(queue))
+
+        collector = TubeCollector(lambda tube: queue.connection(watch=tube))
+        collector.collect("consumer_throughput_A")
+        collector.join()
+        self.assertEqual([], queue.tubes())
+
+    def test_per_configuration_tubes_flag(self):
+        controller = simulated(ConsumerController)()
+        self.addCleanup(shutil.rmtree, os.path.join(controller.log_directory, controller.run_uid))
+        controller.load_configurations()
+        configuration = dict(controller.configurations[0], sequence_number=1)
+        self.assertTrue(controller.provision_node_pools(configuration))
+
+        # by default, the shared tube (until the reporting endpoint publishes to the configuration tubes)
+        self.assertTrue(controller.setup_configuration(configuration))
+        self.assertEqual(CONSUMER_THROUGHPUT_TUBE, configuration["consumer_throughput_tube"])
+        self.assertEqual([CONSUMER_THROUGHPUT_TUBE], controller.consumer_throughput_queue.watched)
+
+        configuration["per_configuration_tubes"] = True
+        self.assertTrue(controller.setup_configuration(configuration))
+        tube = get_consumer_throughput_tube(configuration)
+        self.assertEqual(tube, configuration["consumer_throughput_tube"])
+        self.assertEqual([tube], controller.consumer_throughput_queue.watched)
+
+    def test_switch_configuration(self):
+        controller = simulated(ConsumerController)()
+        self.addCleanup(shutil.rmtree, os.path.join(controller.log_directory, controller.run_uid))
+
+        publisher = controller.consumer_throughput_queue.connection()
+        publisher.put("stale")
+
+        configurations = [{"configuration_uid": "AAAAAA"}, {"configuration_uid": "BBBBBB"}]
+        for configuration in configurations:
+            tube = get_consumer_throughput_tube(configuration)
+            controller.switch_consumer_throughput_tube(tube)
+
+            publisher.use(tube)
+            publisher.put(json.dumps(configuration))
+
+        # only the samples of the current configuration are read
+        job = controller.consumer_throughput_queue.reserve()
+        self.assertEqual(configurations[1], json.loads(job.body))
+
+        # the others are collected
+        controller.tube_collector.join()
+        self.assertEqual([], controller.consumer_throughput_queue.tubes())
+
+        controller.flush_consumer_throughput_queue()
+        self.assertEqual([CONSUMER_THROUGHPUT_TUBE], controller.consumer_throughput_queue.watched)
@@ -0,0 +1,161 @@
+import json
+import os
+import shutil
+import subprocess
+import unittest
+from datetime import datetime, timezone
+
+from fs.clock import ManualClock
+from fs.consumer_controller import ConsumerController
+from fs.controller import Controller, KAFKA_NODE_POOL, ZK_NODE_POOL
+from fs.gcloud_operations import GcloudOperationTracker
+from fs.simulator import simulated
+
+TARGET_LINK = "https://container.googleapis.com/v1/projects/p/zones/z/clusters/c/nodePools/"
+
+
+class FakeGcloud:
+    """
+    Node pool operations which are done after a number of operation listings
+    """
+    def __init__(self, clock, polls_to_done=2, errors=None, submit_failures=(), names_returned=True,
+                 listing_delay=0):
+        """
+        :param clock: for the start times of the operations
+        :param listing_delay: listings an operation is missing from, once submitted
+        :param errors: dict of node pool -> error message of its operation
+        :param submit_failures: node pools whose command fails to submit
+        :param names_returned: False if --async does not print the operation names
+        """
+        self.clock = clock
+        self.polls_to_done = polls_to_done
+        self.errors = errors or {}
+        self.submit_failures = submit_failures
+        self.names_returned = names_returned
+        self.listing_delay = listing_delay
+        self.operations = []
+        # operation name -> listings before it was submitted
+        self.submitted_at = {}
+        self.polls = 0
+
+    def run_gcloud_command(self, command, parameters):
+        if command == "container operations list":
+            self.polls += 1
+            listed = []
+            for operation in self.operations:
+                polls = self.polls - self.submitted_at[operation["name"]]
+                if polls >= self.polls_to_done:
+                    operation["status"] = "DONE"
+                if polls > self.listing_delay:
+                    listed.append(operation)
+            return json.dumps(list(reversed(listed)))
+
+        action, node_pool = command.split()[2:4]
+        if node_pool in self.submit_failures:
+            raise subprocess.CalledProcessError(1, command)
+
+        name = f"operation-{len(self.operations)}"
+        operation = {"name": name, "operationType": f"{action.upper()}_NODE_POOL", "status": "RUNNING",
+                     "targetLink": TARGET_LINK + node_pool, "startTime": get_start_time(self.clock.time())}
+        if node_pool in self.errors:
+            operation["error"] = {"message": self.errors[node_pool]}
+        self.operations.append(operation)
+        self.submitted_at[name] = self.polls
+
+        return (name + "\n").encode("UTF-8") if self.names_returned else b""
+
+
+def get_start_time(timestamp):
+    # as per gcloud, in nanoseconds
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f000Z")
+
+
+def create_commands(*node_pools):
+    return {node_pool: (f"container node-pools create {node_pool}", {"cluster": "c"}) for node_pool in node_pools}
+
+
+class TestGcloudOperationTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = ManualClock(1591005600.0)
+
+    def get_tracker(self, gcloud, timeout_s=600):
+        return GcloudOperationTracker(gcloud.run_gcloud_command, poll_interval_s=10, timeout_s=timeout_s,
+                                      clock=self.clock)
+
+    def test_all_done(self):
+        gcloud = FakeGcloud(self.clock)
+        results = self.get_tracker(gcloud).run(create_commands(KAFKA_NODE_POOL, ZK_NODE_POOL), "CREATE_NODE_POOL")
+
+        self.assertEqual({KAFKA_NODE_POOL: None, ZK_NODE_POOL: None}, results)
+        # submitted together, so waited for together
+        self.assertEqual(2, gcloud.polls)
+
+    def test_partial_failure(self):
+        gcloud = FakeGcloud(self.clock, errors={ZK_NODE_POOL: "QUOTA_EXCEEDED"}, submit_failures=[KAFKA_NODE_POOL])
+        results = self.get_tracker(gcloud).run(create_commands(KAFKA_NODE_POOL, ZK_NODE_POOL), "CREATE_NODE_POOL")
+
+        self.assertEqual({KAFKA_NODE_POOL: "submission failed", ZK_NODE_POOL: "QUOTA_EXCEEDED"}, results)
+
+    def test_operation_found_by_target(self):
+        gcloud = FakeGcloud(self.clock, names_returned=False)
+        results = self.get_tracker(gcloud).run(create_commands(KAFKA_NODE_POOL), "CREATE_NODE_POOL")
+
+        self.assertEqual({KAFKA_NODE_POOL: None}, results)
+
+    def test_previous_operation_not_found_by_target(self):
+        gcloud = FakeGcloud(self.clock, names_returned=False)
+        tracker = self.get_tracker(gcloud)
+        self.assertEqual({KAFKA_NODE_POOL: None}, tracker.run(create_commands(KAFKA_NODE_POOL), "CREATE_NODE_POOL"))
+
+        # the previous configuration's operation is done, but is not the one submitted (not listed yet)
+        self.clock.advance(3600)
+        gcloud.listing_delay = 1
+        gcloud.errors = {KAFKA_NODE_POOL: "QUOTA_EXCEEDED"}
+        results = tracker.run(create_commands(KAFKA_NODE_POOL), "CREATE_NODE_POOL")
+        self.assertEqual({KAFKA_NODE_POOL: "QUOTA_EXCEEDED"}, results)
+        self.assertEqual(4, gcloud.polls)
+
+    def test_start_time(self):
+        self.assertEqual(1591005600.123456,
+                         GcloudOperationTracker.get_start_time({"startTime": "2020-06-01T10:00:00.123456789Z"}))
+        self.assertEqual(1591005600.0, GcloudOperationTracker.get_start_time({"startTime": "2020-06-01T10:00:00Z"}))
+        self.assertIsNone(GcloudOperationTracker.get_start_time({}))
+
+    def test_timeout(self):
+        gcloud = FakeGcloud(self.clock, polls_to_done=100)
+        results = self.get_tracker(gcloud, timeout_s=60).run(create_commands(KAFKA_NODE_POOL), "CREATE_NODE_POOL")
+
+        self.assertEqual({KAFKA_NODE_POOL: "timed out"}, results)
+
+
+class TestProvisionNodePools(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = simulated(ConsumerController)()
+        self.addCleanup(shutil.rmtree, os.path.join(self.controller.log_directory, self.controller.run_uid))
+        self.controller.load_configurations()
+        self.configuration = self.controller.configurations[0]
+
+        self.deleted = []
+        self.controller.delete_node_pools = lambda node_pools: self.deleted.extend(node_pools) or []
+
+    def provision(self, gcloud):
+        self.controller.run_gcloud_command = gcloud.run_gcloud_command
+        # note - the gcloud implementation, rather than the simulated one
+        return Controller.provision_node_pools(self.controller, self.configuration)
+
+    def test_provisioned(self):
+        self.assertTrue(self.provision(FakeGcloud(self.controller.clock)))
+        self.assertTrue(self.controller.node_pools_provisioned)
+        self.assertEqual([], self.deleted)
+
+    def test_partial_failure_is_cleaned_up(self):
+        self.assertFalse(self.provision(FakeGcloud(self.controller.clock, errors={ZK_NODE_POOL: "QUOTA_EXCEEDED"})))
+        self.assertFalse(self.controller.node_pools_provisioned)
+        # the node pool which was created is removed
+        self.assertEqual([KAFKA_NODE_POOL], self.deleted)
+
+
+if __name__ == '__main__':
+    unittest.main()
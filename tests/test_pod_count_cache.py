@@ -0,0 +1,126 @@
+import threading
+import unittest
+
+from fs.clock import ManualClock
+from fs.cluster_snapshot import ClusterSnapshot, ROLE_BROKER, ROLE_PRODUCER
+from fs.pod_count_cache import PodCountCache, IDLE_TTL_MULTIPLE
+
+TTL_S = 5
+
+
+class CountingFetch:
+    """
+    Snapshots with one more producer each time, optionally held up until released (as per a slow kubectl call)
+    """
+    def __init__(self, blocking=False):
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.started = threading.Event()
+        self.released = threading.Event()
+        if not blocking:
+            self.released.set()
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+            calls = self.calls
+        self.started.set()
+        self.released.wait(10)
+        return ClusterSnapshot(zookeepers=3, brokers=5, consumers=1, producers=calls, taken_at=0)
+
+
+class TestPodCountCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = ManualClock()
+
+    def get_cache(self, fetch, background_refresh=False):
+        return PodCountCache(fetch=fetch, ttl_s=TTL_S, background_refresh=background_refresh, clock=self.clock)
+
+    def test_ttl_expiry(self):
+        fetch = CountingFetch()
+        cache = self.get_cache(fetch)
+
+        self.assertEqual(1, cache.get(ROLE_PRODUCER))
+        self.clock.advance(TTL_S - 1)
+        self.assertEqual(1, cache.get(ROLE_PRODUCER))
+        self.assertEqual(1, fetch.calls)
+
+        self.clock.advance(1)
+        self.assertEqual(2, cache.get(ROLE_PRODUCER))
+        self.assertEqual(2, fetch.calls)
+
+    def test_invalidate(self):
+        fetch = CountingFetch()
+        cache = self.get_cache(fetch)
+        cache.get(ROLE_PRODUCER)
+
+        # one snapshot holds every role, so invalidating one role invalidates them all
+        self.clock.advance(1)
+        cache.invalidate(ROLE_PRODUCER)
+        self.clock.advance(1)
+        self.assertEqual(5, cache.get(ROLE_BROKER))
+        self.assertEqual(2, fetch.calls)
+        self.assertEqual(2, cache.get(ROLE_PRODUCER))
+
+        cache.invalidate()
+        self.clock.advance(1)
+        self.assertEqual(3, cache.get(ROLE_PRODUCER))
+        self.assertEqual(3, fetch.calls)
+
+    def test_invalidated_during_fetch(self):
+        fetch = CountingFetch(blocking=True)
+        cache = self.get_cache(fetch)
+        reader = threading.Thread(target=cache.snapshot)
+        reader.start()
+
+        # e.g. our own scale call while the snapshot is being taken
+        self.assertTrue(fetch.started.wait(5))
+        self.clock.advance(1)
+        cache.invalidate(ROLE_PRODUCER)
+        fetch.released.set()
+        reader.join(5)
+
+        self.assertEqual(2, cache.get(ROLE_PRODUCER))
+
+    def test_concurrent_callers_share_fetch(self):
+        fetch = CountingFetch(blocking=True)
+        cache = self.get_cache(fetch)
+        results = []
+        readers = [threading.Thread(target=lambda: results.append(cache.get(ROLE_PRODUCER))) for _ in range(8)]
+        for reader in readers:
+            reader.start()
+
+        self.assertTrue(fetch.started.wait(5))
+        fetch.released.set()
+        for reader in readers:
+            reader.join(5)
+
+        self.assertEqual(1, fetch.calls)
+        self.assertEqual([1] * 8, results)
+
+    def test_background_refresh_stops_when_idle(self):
+        fetch = CountingFetch()
+        cache = self.get_cache(fetch, background_refresh=True)
+
+        cache.snapshot()
+        thread = cache._refresh_thread
+        # note - the refresh thread's sleeps advance the manual clock until it is idle
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(cache._refresh_thread)
+        self.assertGreaterEqual(self.clock.monotonic(), TTL_S * IDLE_TTL_MULTIPLE)
+
+        # refreshed while in use, then no more kubectl calls
+        calls = fetch.calls
+        self.assertGreater(calls, 1)
+        self.assertLessEqual(calls, 1 + 2 * IDLE_TTL_MULTIPLE)
+
+        # the next read starts it again
+        cache.snapshot()
+        self.assertIsNotNone(cache._refresh_thread)
+        cache._refresh_thread.join(5)
+
+
+if __name__ == '__main__':
+    unittest.main()
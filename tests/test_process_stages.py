@@ -0,0 +1,153 @@
+import os
+import shutil
+import threading
+import time
+import unittest
+
+from fs.consumer_controller import ConsumerController
+from fs.process_stages import SampleIngester, ScalingActuator, StageError
+from fs.queue_backend import InMemoryQueue
+from fs.report_protocol import encode_report
+from fs.simulator import simulated
+from fs.stress_test_process import StressTestProcess
+
+
+class SlowScaler:
+    """
+    Scales once released, as per a slow kubectl call
+    """
+    def __init__(self, producer_count):
+        self.producer_count = producer_count
+        self.released = threading.Event()
+        self.applied = []
+
+    def scale_producers(self, producer_count):
+        self.released.wait(10)
+        self.applied.append(producer_count)
+        self.producer_count = producer_count
+
+    def get_producer_count(self):
+        return self.producer_count
+
+
+def wait_until(condition, timeout_s=5):
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestProcessStages(unittest.TestCase):
+
+    def test_actuator_coalesces(self):
+        scaler = SlowScaler(1)
+        actuator = ScalingActuator(scaler.scale_producers, scaler.get_producer_count)
+        actuator.start()
+
+        actuator.request(2)
+        self.assertTrue(wait_until(lambda: actuator.desired_producer_count is None))
+        # requested while 2 is being applied, only the latest is applied next
+        for producer_count in [3, 4, 5]:
+            actuator.request(producer_count)
+
+        scaler.released.set()
+        actuator.stop()
+        self.assertEqual([2, 5], scaler.applied)
+        self.assertEqual(2, actuator.coalesced_count)
+        self.assertEqual(5, actuator.producer_count)
+
+    def test_ingester_bounded(self):
+        batches = iter([[{"n": n}] for n in range(10)])
+        ingester = SampleIngester(lambda: next(batches, []), max_batches=2)
+        ingester.start()
+
+        self.assertTrue(wait_until(lambda: ingester.batches.full()))
+        self.assertEqual([{"n": 0}], ingester.get())
+        ingester.stop()
+
+    def test_stage_errors(self):
+        def get_batch():
+            raise ConnectionError("beanstalkd went away")
+
+        ingester = SampleIngester(get_batch)
+        ingester.start()
+        with self.assertRaises(StageError):
+            while True:
+                ingester.get(timeout=0.01)
+        ingester.stop()
+
+        def scale(producer_count):
+            raise OSError("kubectl not found")
+
+        actuator = ScalingActuator(scale, lambda: 1)
+        actuator.start()
+        actuator.request(2)
+        actuator.stop()
+        with self.assertRaises(StageError):
+            actuator.get_producer_count()
+        with self.assertRaises(StageError):
+            actuator.request(3)
+
+    def test_process_fails_on_stage_error(self):
+        controller = simulated(ConsumerController)()
+        self.addCleanup(shutil.rmtree, os.path.join(controller.log_directory, controller.run_uid))
+        controller.load_configurations()
+        configuration = dict(controller.configurations[0], sequence_number=1)
+
+        class BrokenQueue(InMemoryQueue):
+            def reserve_batch(self, max_jobs, timeout=1):
+                raise RuntimeError("unexpected response")
+
+        process = StressTestProcess(configuration, BrokenQueue())
+        process.attach_scaler(SlowScaler(1))
+        errors = []
+
+        def run():
+            try:
+                process.run()
+            except StageError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(1, len(errors))
+
+    def test_ingest_while_scaling(self):
+        controller = simulated(ConsumerController)()
+        self.addCleanup(shutil.rmtree, os.path.join(controller.log_directory, controller.run_uid))
+        controller.load_configurations()
+        configuration = dict(controller.configurations[0], sequence_number=1, num_consumers=1, start_producer_count=1,
+                             producer_increment_interval_sec=0)
+
+        queue = InMemoryQueue()
+        publisher = queue.connection()
+        scaler = SlowScaler(1)
+        process = StressTestProcess(configuration, queue)
+        process.attach_scaler(scaler)
+        thread = threading.Thread(target=process.run)
+        thread.start()
+
+        # enough samples for the first probe to pass, then the next producer is requested (and held up)
+        for i in range(20):
+            publisher.put(encode_report("consumer-0", [(i, 100.0, 1)]))
+        self.assertTrue(wait_until(lambda: process.desired_producer_count == 2))
+
+        # still ingested (and analysed) while the scale is in flight
+        for i in range(20, 1000):
+            publisher.put(encode_report("consumer-0", [(i, 100.0, 1)]))
+        self.assertTrue(wait_until(lambda: queue.stats_tube("consumer_throughput")["current-jobs-ready"] == 0))
+        self.assertEqual([], scaler.applied)
+
+        process.stop()
+        scaler.released.set()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([2], scaler.applied)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest
+import uuid
+from multiprocessing import resource_tracker
+
+import greenstalk
+
+from fs.consumer_tubes import TubeCollector
+
+from fs.queue_backend import InMemoryQueue, SharedMemoryQueue, SharedMemoryRing, QueueFullError, create_queue, \
+    QUEUE_MEMORY, QUEUE_SHM
+from fs.report_protocol import decode_report, encode_report
+
+
+def publish(prefix, count):
+    queue = SharedMemoryQueue(prefix, capacity=4096, use="consumer_throughput_A")
+    try:
+        sent = 0
+        while sent < count:
+            try:
+                queue.put(encode_report("consumer-0", [(sent, 75.0, 10)]))
+                sent += 1
+            except QueueFullError:
+                time.sleep(0.001)
+    finally:
+        queue.close()
+
+
+def publish_and_exit(prefix, count):
+    publish(prefix, count)
+    # as at exit, and wait for the resource tracker to clean up after this process
+    resource_tracker._resource_tracker._stop()
+
+
+class TestInMemoryQueue(unittest.TestCase):
+
+    def test_fifo_and_tubes(self):
+        queue = create_queue(QUEUE_MEMORY)
+        publisher = queue.connection(use="consumer_throughput_A")
+        for i in range(5):
+            publisher.put(str(i))
+        queue.put("shared")
+
+        self.assertEqual(["shared"], [job.body for job in queue.reserve_batch(10, 0)])
+
+        queue.watch("consumer_throughput_A")
+        queue.ignore("consumer_throughput")
+        self.assertEqual(["0", "1", "2"], [job.body for job in queue.reserve_batch(3, 0)])
+        self.assertEqual("3", queue.reserve(0).body)
+        self.assertEqual(["consumer_throughput_A"], queue.tubes())
+
+    def test_reserve_waits_for_put(self):
+        queue = InMemoryQueue()
+        publisher = queue.connection()
+        threading.Timer(0.05, publisher.put, ["late"]).start()
+
+        self.assertEqual("late", queue.reserve(5).body)
+        with self.assertRaises(greenstalk.TimedOutError):
+            queue.reserve(0.01)
+
+
+class TestSharedMemoryQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.prefix = f"fs_test_{uuid.uuid4().hex[:8]}"
+
+    def test_wraparound(self):
+        ring = SharedMemoryRing(self.prefix, capacity=64)
+        self.addCleanup(ring.unlink)
+        self.addCleanup(ring.close)
+
+        received = []
+        for i in range(100):
+            ring.write(b"x" * (i % 20))
+            received.extend(data for _, data in ring.read(10))
+        self.assertEqual([b"x" * (i % 20) for i in range(100)], received)
+
+        with self.assertRaises(QueueFullError):
+            for i in range(10):
+                ring.write(bytes([i]) * 12)
+        self.assertEqual([bytes([i]) * 12 for i in range(i)], [data for _, data in ring.read(10)])
+        ring.write(b"x" * 20)
+
+    def test_collect_unlinks_segments(self):
+        # e.g. left behind by an earlier run
+        stale = SharedMemoryQueue(self.prefix, capacity=4096, use="consumer_throughput_A")
+        stale.put("stale")
+        stale.close()
+
+        queue = SharedMemoryQueue(self.prefix, capacity=4096)
+        self.addCleanup(queue.unlink, "consumer_throughput")
+        queue.get_ring("consumer_throughput")
+        self.assertEqual(["consumer_throughput", "consumer_throughput_A"], queue.tubes())
+
+        collector = TubeCollector(lambda tube: queue.connection(watch=tube))
+        collector.collect("consumer_throughput_A")
+        collector.join()
+        self.assertEqual(["consumer_throughput"], queue.tubes())
+
+    def test_cross_process(self):
+        queue = create_queue(QUEUE_SHM, prefix=self.prefix, capacity=4096, watch="consumer_throughput_A")
+        self.addCleanup(queue.unlink, "consumer_throughput_A")
+        queue.get_ring("consumer_throughput_A")
+
+        publisher = multiprocessing.Process(target=publish, args=(self.prefix, 1000))
+        publisher.start()
+
+        samples = []
+        while len(samples) < 1000:
+            jobs = queue.reserve_batch(100, 5)
+            self.assertTrue(len(jobs) > 0)
+            for job in jobs:
+                samples.extend(decode_report(job.body))
+        publisher.join()
+
+        self.assertEqual(list(range(1000)), [sample["timestamp"] for sample in samples])
+        with self.assertRaises(greenstalk.TimedOutError):
+            queue.reserve(0.01)
+
+    def test_segment_outlives_publisher(self):
+        # a publisher in a separate interpreter (with a resource tracker of its own), which exits once it has put
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        subprocess.run([sys.executable, "-c", f"from tests.test_queue_backend import publish_and_exit; "
+                                              f"publish_and_exit('{self.prefix}', 3)"],
+                       cwd=root, check=True, env=dict(os.environ, PYTHONPATH=root))
+
+        queue = create_queue(QUEUE_SHM, prefix=self.prefix, capacity=4096, watch="consumer_throughput_A")
+        self.addCleanup(queue.unlink, "consumer_throughput_A")
+        self.assertEqual(["consumer_throughput_A"], queue.tubes())
+        self.assertEqual([0, 1, 2], [decode_report(job.body)[0]["timestamp"] for job in queue.reserve_batch(10, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
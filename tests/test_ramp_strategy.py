@@ -0,0 +1,82 @@
+import os
+import shutil
+import unittest
+
+from fs.consumer_controller import ConsumerController
+from fs.ramp_strategy import get_ramp_strategy, RAMP_LINEAR, RAMP_EXPONENTIAL, PROBE_FAILED
+from fs.simulator import simulated
+from fs.stress_test_process import StressTestProcess
+
+
+def ramp(strategy, saturation_producer_count):
+    """
+    :return: the producer counts probed, until the strategy is done
+    """
+    producer_count = strategy.start_producer_count
+    probes = []
+    while producer_count is not None:
+        probes.append(producer_count)
+        if producer_count <= saturation_producer_count:
+            producer_count = strategy.probe_ok(producer_count, len(probes))
+        else:
+            producer_count = strategy.probe_failed(producer_count, len(probes))
+
+    return probes
+
+
+class TestRampStrategy(unittest.TestCase):
+
+    def test_linear(self):
+        strategy = get_ramp_strategy({"start_producer_count": 1})
+        self.assertEqual(list(range(1, 22)), ramp(strategy, 20))
+        self.assertEqual(20, strategy.saturation_producer_count())
+
+    def test_exponential(self):
+        strategy = get_ramp_strategy({"start_producer_count": 1, "max_producer_count": 26,
+                                      "ramp_strategy": RAMP_EXPONENTIAL})
+        self.assertEqual([1, 2, 4, 8, 16, 26, 21, 18, 19, 20], ramp(strategy, 20))
+        self.assertEqual(20, strategy.saturation_producer_count())
+        self.assertEqual([PROBE_FAILED], list({p["outcome"] for p in strategy.trajectory if p["producer_count"] > 20}))
+
+        # saturated at the start
+        strategy = get_ramp_strategy({"start_producer_count": 5, "ramp_strategy": RAMP_EXPONENTIAL})
+        self.assertEqual([5], ramp(strategy, 3))
+        self.assertEqual(4, strategy.saturation_producer_count())
+
+        # never saturated
+        strategy = get_ramp_strategy({"start_producer_count": 1, "max_producer_count": 10,
+                                      "ramp_strategy": RAMP_EXPONENTIAL})
+        self.assertEqual([1, 2, 4, 8, 10], ramp(strategy, 30))
+        self.assertEqual(10, strategy.saturation_producer_count())
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            get_ramp_strategy({"start_producer_count": 1, "ramp_strategy": "quadratic"})
+
+    def test_simulated_stress_test(self):
+        # a single consumer saturates at 3 producers
+        controller = simulated(ConsumerController)()
+        self.addCleanup(shutil.rmtree, os.path.join(controller.log_directory, controller.run_uid))
+
+        controller.load_configurations()
+        configuration = dict(controller.configurations[0], sequence_number=1, num_consumers=1, start_producer_count=1)
+        self.assertTrue(controller.provision_node_pools(configuration))
+
+        for ramp_strategy in [RAMP_LINEAR, RAMP_EXPONENTIAL]:
+            configuration["ramp_strategy"] = ramp_strategy
+            self.assertTrue(controller.setup_configuration(configuration))
+            controller.k8s_configure_producers(1, configuration["message_size_kb"])
+
+            process = StressTestProcess(configuration, controller.consumer_throughput_queue)
+            controller.run_process(process, configuration)
+
+            metrics = process.load_jsonl(os.path.join(controller.log_directory, controller.run_uid,
+                                                      f"{configuration['configuration_uid']}_metrics_1.csv"))[-1]
+            self.assertEqual(ramp_strategy, metrics["stress_ramp_strategy"])
+            self.assertEqual("3", metrics["stress_saturation_producers"])
+
+            details = process.load_jsonl(os.path.join(controller.log_directory, controller.run_uid,
+                                                      f"{configuration['configuration_uid']}_details_1.jsonl"))[-1]
+            trajectory = details["stress_probe_trajectory"]
+            self.assertEqual(str(len(trajectory)), metrics["stress_probe_count"])
+            self.assertIn(PROBE_FAILED, [probe["outcome"] for probe in trajectory])
@@ -0,0 +1,95 @@
+import os
+import shlex
+import sys
+import tempfile
+import time
+import unittest
+
+from fs.cluster_snapshot import ROLE_BROKER, ROLE_ZOOKEEPER
+from fs.readiness import ReadinessWaiter
+
+FAKE_KUBECTL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_kubectl.py")
+
+
+class TestReadinessWaiter(unittest.TestCase):
+
+    def setUp(self):
+        self.script = tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False)
+
+    def tearDown(self):
+        os.unlink(self.script.name)
+
+    def get_waiter(self, lines, get_count=None, wrapper=None):
+        self.script.write("\n".join(lines))
+        self.script.close()
+
+        def watch_command(namespace):
+            command = [sys.executable, FAKE_KUBECTL, self.script.name]
+            if wrapper is not None:
+                return ['/bin/bash', '-e', '-c', wrapper.format(" ".join(shlex.quote(arg) for arg in command))]
+            return command
+
+        return ReadinessWaiter(watch_command=watch_command, get_count=get_count, working_directory=None,
+                               initial_backoff_s=0.01, max_backoff_s=0.05)
+
+    def test_returns_when_target_reached(self):
+        waiter = self.get_waiter(["ADDED kafka-0 Pending",
+                                  "ADDED kafka-1 Pending",
+                                  "ADDED zookeeper-0 Running",
+                                  "sleep 0.2",
+                                  "MODIFIED kafka-0 Running",
+                                  "MODIFIED kafka-1 Running",
+                                  "hold"])
+
+        start_s = time.monotonic()
+        self.assertTrue(waiter.wait_for(ROLE_BROKER, 2, deadline_s=30))
+        self.assertLess(time.monotonic() - start_s, 5)
+
+    def test_deleted_pods_are_not_counted(self):
+        waiter = self.get_waiter(["ADDED zookeeper-0 Running",
+                                  "DELETED zookeeper-0 Running",
+                                  "ADDED zookeeper-1 Running",
+                                  "hold"])
+
+        self.assertFalse(waiter.wait_for(ROLE_ZOOKEEPER, 2, deadline_s=0.5))
+
+    def test_deadline(self):
+        waiter = self.get_waiter(["ADDED kafka-0 Running", "hold"])
+
+        start_s = time.monotonic()
+        self.assertFalse(waiter.wait_for(ROLE_BROKER, 3, deadline_s=0.5))
+        self.assertLess(time.monotonic() - start_s, 5)
+
+    def test_falls_back_to_polling(self):
+        counts = [0, 1, 2, 3]
+
+        def get_count(role):
+            return counts.pop(0) if len(counts) > 1 else counts[0]
+
+        waiter = self.get_waiter(["exit 1"], get_count=get_count)
+
+        self.assertTrue(waiter.wait_for(ROLE_BROKER, 3, deadline_s=5))
+        self.assertEqual([3], counts)
+
+    def test_kills_watch_started_by_script(self):
+        # as per watch-pods.sh, kubectl is a child of the bash running the script
+        pid_file = self.script.name + ".pid"
+        self.addCleanup(os.unlink, pid_file)
+        waiter = self.get_waiter(["ADDED kafka-0 Running", "hold"], wrapper="{} & echo $! > " + pid_file + "; wait")
+
+        self.assertTrue(waiter.wait_for(ROLE_BROKER, 1, deadline_s=30))
+
+        with open(pid_file) as f:
+            pid = int(f.read())
+        self.assertFalse(is_running(pid))
+
+
+def is_running(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # the state follows the (parenthesised) command
+            state = f.read().rsplit(")", 1)[1].split()[0]
+    except FileNotFoundError:
+        return False
+
+    return state != "Z"
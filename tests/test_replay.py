@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from fs.replay import ConfigurationReplay
+from fs.sample_recorder import SampleRecorder, SOURCE_STRESS
+
+
+class TestReplay(unittest.TestCase):
+
+    configuration = {"num_consumers": 2, "ignore_throughput_threshold": False, "producer_increment_interval_sec": 60,
+                     "max_producer_count": 26, "start_producer_count": 1, "run_uid": "run_REPLAY",
+                     "configuration_uid": "ABC123", "sequence_number": 1, "number_of_brokers": 3}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.directory, "ABC123_samples_1")
+
+        # each consumer keeps up with the producers until there are more than 4 of them
+        recorder = SampleRecorder(self.prefix)
+        timestamp = 1000.0
+        for producer_count in range(1, 9):
+            for _ in range(60):
+                for consumer in range(2):
+                    recorder.record(timestamp, f"consumer-{consumer}", producer_count, 75.0 * min(producer_count, 4),
+                                    0, SOURCE_STRESS)
+                    timestamp += 2.5
+        recorder.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        base_directory = os.path.dirname(os.path.abspath(__file__))
+        shutil.rmtree(os.path.join(base_directory, "..", "log", "run_REPLAY"), ignore_errors=True)
+
+    def test_replay(self):
+        stress, soak = ConfigurationReplay().run(self.prefix, self.configuration)
+
+        # a producer is added every increment interval until the consumers fall behind
+        self.assertEqual([1, 2, 3, 4, 5], [count for _, count in stress.trajectory])
+        self.assertEqual("5", stress.metrics[0]["stress_max_producers"])
+        self.assertFalse(stress.exhausted)
+
+        # the soak backs off to the last producer count the consumers keep up with
+        self.assertEqual(4, soak.producer_count)
+        self.assertEqual("2.4", soak.metrics[0]["soak_average_throughput"])
+        self.assertGreater(soak.elapsed_s, 313 * 3 / 4)
@@ -0,0 +1,61 @@
+import json
+import os
+import shutil
+import unittest
+
+from fs.consumer_controller import ConsumerController
+from fs.report_protocol import encode_report, decode_report
+from fs.simulator import simulated, SimulatedQueue
+from fs.stress_test_process import StressTestProcess
+
+
+class TestReportProtocol(unittest.TestCase):
+
+    def test_round_trip(self):
+        samples = [(1600000000.0, 75.5, 3), (1600000005.0, 74.25, 4)]
+        decoded = decode_report(encode_report("consumer-0", samples))
+
+        self.assertEqual([{"consumer_id": "consumer-0", "throughput": 75.5, "producer_count": 3,
+                           "timestamp": 1600000000.0},
+                          {"consumer_id": "consumer-0", "throughput": 74.25, "producer_count": 4,
+                           "timestamp": 1600000005.0}], decoded)
+
+    def test_legacy(self):
+        sample = {"consumer_id": "consumer-0", "throughput": 75, "producer_count": 1}
+        self.assertEqual([sample], decode_report(json.dumps(sample)))
+        self.assertEqual([sample], decode_report(json.dumps(sample).encode()))
+
+    def test_invalid(self):
+        for body in ["75", "not json", '{"consumer_id": "consumer-0"}', '{"v": 99, "c": "consumer-0", "s": []}',
+                     '{"v": 1, "s": []}', '{"v": 1, "c": "consumer-0", "s": [[1, 2]]}']:
+            with self.assertRaises(ValueError):
+                decode_report(body)
+
+    def test_get_data_batch(self):
+        queue = SimulatedQueue()
+        queue.put(json.dumps({"consumer_id": "consumer-0", "throughput": 75, "producer_count": 1}))
+        queue.put(encode_report("consumer-1", [(1.0, 75, 1), (6.0, 76, 1)]))
+        queue.put("garbage")
+
+        process = StressTestProcess({"run_uid": "run_test_report_protocol", "configuration_uid": "AAAAAA",
+                                     "sequence_number": 1, "start_producer_count": 1}, queue)
+        self.addCleanup(shutil.rmtree, process.base_path)
+
+        samples = process.get_data_batch(queue)
+        self.assertEqual(["consumer-0", "consumer-1", "consumer-1"], [s["consumer_id"] for s in samples])
+        self.assertEqual([None, 1.0, 6.0], [s.get("timestamp") for s in samples])
+
+    def test_simulated_controller(self):
+        controller = simulated(ConsumerController)(samples_per_report=6)
+        self.addCleanup(shutil.rmtree, os.path.join(controller.log_directory, controller.run_uid))
+
+        controller.load_configurations()
+        configuration = dict(controller.configurations[0], sequence_number=1)
+        self.assertTrue(controller.provision_node_pools(configuration))
+        self.assertTrue(controller.setup_configuration(configuration))
+        controller.run_configuration(configuration)
+
+        metrics = controller.soak_test_process.load_jsonl(os.path.join(
+            controller.log_directory, controller.run_uid, f"{configuration['configuration_uid']}_metrics_1.csv"))
+        self.assertEqual(2, len(metrics))
+        self.assertNotEqual("0", metrics[1]["soak_num_producers"])
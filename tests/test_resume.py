@@ -0,0 +1,94 @@
+import os
+import shutil
+import unittest
+
+from fs.base_process import get_metrics_path, get_samples_prefix
+from fs.controller import Controller, LOG_DIRECTORY
+from fs.run_journal import ResumeError
+
+
+class RunInterrupted(Exception):
+    pass
+
+
+class StubController(Controller):
+    """
+    Controller with the cluster operations stubbed out, recording which configurations run
+    """
+    def __init__(self, run_uid=None, fail_at=None):
+        super().__init__(None, run_uid=run_uid)
+        self.fail_at = fail_at
+        self.run_configurations = []
+        self.reconciled = None
+
+    def get_configuration_description(self):
+        return "Resume test."
+
+    def load_configurations(self):
+        template = dict(self.configuration_template, run_uid=self.run_uid)
+        self.configurations.extend(self.get_configurations(template, 3)[0:3])
+
+    def provision_node_pools(self, configuration):
+        self.node_pools_provisioned = True
+        return True
+
+    def setup_configuration(self, configuration, transition=None):
+        return True
+
+    def run_configuration(self, configuration):
+        # as per the stress test, before the soak test is interrupted
+        base_path = os.path.join(self.log_directory, self.run_uid)
+        with open(get_metrics_path(base_path, configuration), "a") as f:
+            f.write("{}\n")
+        with open(get_samples_prefix(base_path, configuration) + ".consumers", "a") as f:
+            f.write("consumer-0\n")
+
+        if configuration["sequence_number"] == self.fail_at:
+            raise RunInterrupted()
+        self.run_configurations.append(configuration["configuration_uid"])
+
+    def upload_metrics(self, configuration):
+        pass
+
+    def teardown_configuration(self, configuration, next_configuration=None, setup_ok=True):
+        pass
+
+    def reconcile_cluster(self, next_configuration):
+        self.reconciled = next_configuration
+
+    def collect_stale_tubes(self):
+        pass
+
+
+class TestResume(unittest.TestCase):
+
+    def test_resume_skips_completed_configurations(self):
+        c = StubController(fail_at=2)
+        self.addCleanup(shutil.rmtree, c.log_directory + "/" + c.run_uid)
+        with self.assertRaises(RunInterrupted):
+            c.run()
+        self.assertEqual(1, len(c.run_configurations))
+
+        resumed = StubController(run_uid=c.run_uid)
+        resumed.run()
+
+        # same configurations (and uids), in the same order, without the first
+        self.assertEqual([configuration["configuration_uid"] for configuration in c.configurations[1:]],
+                         resumed.run_configurations)
+        self.assertEqual(c.configurations[1]["configuration_uid"], resumed.reconciled["configuration_uid"])
+
+        # the interrupted configuration's results are from the second attempt only
+        base_path = os.path.join(c.log_directory, c.run_uid)
+        for sequence_number, configuration in enumerate(c.configurations, 1):
+            configuration = dict(configuration, sequence_number=sequence_number)
+            with open(get_metrics_path(base_path, configuration)) as f:
+                self.assertEqual(1, len(f.readlines()))
+            with open(get_samples_prefix(base_path, configuration) + ".consumers") as f:
+                self.assertEqual(1, len(f.readlines()))
+
+    def test_resume_unknown_run(self):
+        with self.assertRaises(ResumeError):
+            StubController(run_uid="run_UNKNOWN")
+
+        # nothing is created for it
+        self.assertFalse(os.path.exists(os.path.join(LOG_DIRECTORY, "run_UNKNOWN")))
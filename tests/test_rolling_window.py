@@ -0,0 +1,30 @@
+import statistics
+import unittest
+
+from fs.rolling_window import RollingWindow
+
+
+class TestRollingWindow(unittest.TestCase):
+
+    def test_matches_last_values(self):
+        values = [0.5 + (i * 7 % 11) / 10 for i in range(100)]
+
+        window = RollingWindow(8)
+        for i, value in enumerate(values):
+            window.append(value)
+            last = values[max(0, i - 7):i + 1]
+
+            self.assertEqual(last, window.last())
+            self.assertAlmostEqual(statistics.mean(last), window.mean())
+            if len(last) > 1:
+                self.assertAlmostEqual(statistics.variance(last), window.variance())
+
+        self.assertTrue(window.is_full())
+
+    def test_resized(self):
+        window = RollingWindow(8)
+        for value in range(10):
+            window.append(value)
+
+        self.assertEqual([5.0, 6.0, 7.0, 8.0, 9.0], window.resized(5).last())
+        self.assertEqual([2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0], window.resized(12).last())
@@ -0,0 +1,37 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from fs.sample_recorder import SampleRecorder, read_samples, DECISION_OK, DECISION_SOAK, SOURCE_STRESS, SOURCE_SOAK
+
+
+class TestSampleRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.directory, "ABC123_samples_1")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        recorder = SampleRecorder(self.prefix, buffer_size=3)
+        for i in range(10):
+            recorder.record(1000.0 + i, f"consumer-{i % 2}", 4, 75.0 + i, DECISION_OK, SOURCE_STRESS)
+        recorder.close()
+
+        # e.g. the soak test, appending to the same configuration
+        recorder = SampleRecorder(self.prefix)
+        recorder.record(2000.0, "consumer-2", 4, 60.0, DECISION_SOAK, SOURCE_SOAK)
+        recorder.record(2001.0, "consumer-1", 4, 61.0, DECISION_SOAK, SOURCE_SOAK)
+        recorder.close()
+
+        columns, consumer_ids = read_samples(self.prefix)
+
+        self.assertEqual(["consumer-0", "consumer-1", "consumer-2"], consumer_ids)
+        self.assertEqual(12, len(columns["timestamp"]))
+        self.assertEqual([75.0 + i for i in range(10)] + [60.0, 61.0], columns["throughput"].tolist())
+        self.assertEqual(["consumer-1", "consumer-2", "consumer-1"],
+                         [consumer_ids[c] for c in columns["consumer"][-3:]])
+        self.assertEqual([SOURCE_STRESS] * 10 + [SOURCE_SOAK] * 2, columns["source"].tolist())
@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from fs.run_journal import RunJournal, EVENT_PHASE
+from fs.scheduler import TransitionCostModel, schedule, DEFAULT_TRANSITION_COSTS_S
+from fs.transitions import RESCALE_CONSUMERS, REBUILD_NODE_POOLS
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.log_directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.log_directory)
+
+    def test_schedule_groups_node_pools(self):
+        configurations = [{"number_of_brokers": b, "number_of_partitions": 18, "num_consumers": c}
+                          for c in (1, 3, 6) for b in (3, 5)]
+
+        scheduled = schedule(configurations)
+
+        self.assertEqual([(3, 1), (3, 3), (3, 6), (5, 1), (5, 3), (5, 6)],
+                         [(c["number_of_brokers"], c["num_consumers"]) for c in scheduled])
+
+        cost_model = TransitionCostModel()
+        self.assertLess(cost_model.total_cost(scheduled), cost_model.total_cost(configurations))
+
+    def test_costs_learned_from_journals(self):
+        os.makedirs(os.path.join(self.log_directory, "run_A"))
+        journal = RunJournal(os.path.join(self.log_directory, "run_A", "run_A_journal.jsonl"))
+        journal.record(EVENT_PHASE, phase="teardown", transition=RESCALE_CONSUMERS, duration_s=20, ok=True)
+        journal.record(EVENT_PHASE, phase="setup", transition=RESCALE_CONSUMERS, duration_s=40, ok=True)
+        journal.record(EVENT_PHASE, phase="setup", transition=RESCALE_CONSUMERS, duration_s=60, ok=True)
+        # failed phases are ignored
+        journal.record(EVENT_PHASE, phase="setup", transition=RESCALE_CONSUMERS, duration_s=900, ok=False)
+
+        cost_model = TransitionCostModel.from_journals(self.log_directory)
+
+        self.assertEqual(70, cost_model.cost(RESCALE_CONSUMERS))
+        self.assertEqual(DEFAULT_TRANSITION_COSTS_S[REBUILD_NODE_POOLS], cost_model.cost(REBUILD_NODE_POOLS))
@@ -0,0 +1,97 @@
+import os
+import shutil
+import threading
+import unittest
+
+from fs.clock import ManualClock
+from fs.consumer_controller import ConsumerController
+from fs.controller import Controller, BURROW_IP_DEADLINE_S
+from fs.setup_pipeline import SetupPipeline, SetupStep
+from fs.simulator import simulated
+
+
+class TestSetupPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = ManualClock()
+        self.lock = threading.Lock()
+        self.started = []
+
+    def step(self, name, duration_s=0, ok=True, depends_on=()):
+        def action():
+            with self.lock:
+                self.started.append(name)
+            self.clock.sleep(duration_s)
+            return ok
+
+        return SetupStep(name, action, depends_on=depends_on)
+
+    def test_dependency_order(self):
+        pipeline = SetupPipeline([self.step("scale_brokers", depends_on=["deploy_kafka"]),
+                                  self.step("deploy_zk"),
+                                  self.step("deploy_kafka", depends_on=["deploy_zk"]),
+                                  self.step("deploy_burrow", depends_on=["deploy_kafka"])], clock=self.clock)
+
+        self.assertTrue(pipeline.run())
+        self.assertEqual(["deploy_zk", "deploy_kafka"], self.started[0:2])
+        self.assertEqual({"scale_brokers", "deploy_burrow"}, set(self.started[2:]))
+
+    def test_failure_stops_later_steps(self):
+        failures = []
+        steps = [self.step("deploy_zk"),
+                 self.step("zk_ok", ok=False, depends_on=["deploy_zk"]),
+                 self.step("deploy_kafka", depends_on=["zk_ok"])]
+        steps[1].on_failure = lambda: failures.append("zk_ok")
+
+        self.assertFalse(SetupPipeline(steps, clock=self.clock).run())
+        self.assertEqual(["deploy_zk", "zk_ok"], self.started)
+        self.assertEqual(["zk_ok"], failures)
+
+    def test_exception_is_failure(self):
+        def action():
+            raise RuntimeError("kubectl not found")
+
+        self.assertFalse(SetupPipeline([SetupStep("deploy_zk", action)], clock=self.clock).run())
+
+    def test_invalid_graph(self):
+        with self.assertRaises(ValueError):
+            SetupPipeline([self.step("a", depends_on=["b"]), self.step("b", depends_on=["a"])])
+        with self.assertRaises(ValueError):
+            SetupPipeline([self.step("a", depends_on=["c"])])
+        with self.assertRaises(ValueError):
+            SetupPipeline([self.step("a"), self.step("a")])
+
+    def test_critical_path(self):
+        pipeline = SetupPipeline([self.step("deploy_zk", 10),
+                                  self.step("deploy_kafka", 5, depends_on=["deploy_zk"]),
+                                  self.step("deploy_burrow", 1, depends_on=["deploy_kafka"]),
+                                  self.step("scale_brokers", 1, depends_on=["deploy_kafka"]),
+                                  self.step("brokers_ok", 100, depends_on=["scale_brokers", "deploy_burrow"])],
+                                 clock=self.clock)
+        self.assertEqual([], pipeline.critical_path())
+
+        self.assertTrue(pipeline.run())
+        self.assertEqual(["deploy_zk", "deploy_kafka"], pipeline.critical_path()[0:2])
+        self.assertEqual("brokers_ok", pipeline.critical_path()[-1])
+
+        # through the prerequisite which finished last
+        pipeline.timings = {"deploy_zk": (0, 10), "deploy_kafka": (10, 15), "deploy_burrow": (15, 40),
+                            "scale_brokers": (15, 16), "brokers_ok": (40, 140)}
+        self.assertEqual(["deploy_zk", "deploy_kafka", "deploy_burrow", "brokers_ok"], pipeline.critical_path())
+
+    def test_burrow_deadline(self):
+        controller = simulated(ConsumerController)()
+        self.addCleanup(shutil.rmtree, os.path.join(controller.log_directory, controller.run_uid))
+        controller.bash_command_with_wait = lambda args, working_directory: True
+        controller.get_burrow_ip = lambda: ""
+
+        start_s = controller.clock.monotonic()
+        self.assertFalse(Controller.k8s_deploy_burrow(controller))
+        self.assertGreaterEqual(controller.clock.monotonic() - start_s, BURROW_IP_DEADLINE_S)
+
+        controller.get_burrow_ip = lambda: "10.0.0.1"
+        self.assertTrue(Controller.k8s_deploy_burrow(controller))
+
+
+if __name__ == '__main__':
+    unittest.main()
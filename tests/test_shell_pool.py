@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from fs.shell_pool import ShellPool
+from tests.test_beanstalk_batch import wait_until
+
+
+class TestShellPool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        self.write_script("report.sh", 'echo "producers $1"\necho "warning" >&2\nprintf "partial"\n')
+        self.write_script("fail.sh", "echo before\nfalse\necho after\n")
+        self.write_script("hang.sh", "sleep 30\n")
+        self.write_script("name.sh", 'echo "$(basename "$0") $(basename "${BASH_SOURCE[0]}") $#"\nexit 3\n')
+        self.write_script("parent.sh", 'echo "$PPID"\n')
+        self.write_script("slow.sh", 'echo "deploying"\necho\nsleep 0.5\necho "deployed"\nprintf "done"\n')
+
+        self.pool = ShellPool(size=2, init_scripts=[os.path.join(self.directory, "init.sh")])
+        self.addCleanup(self.pool.close)
+
+    def write_script(self, name, body):
+        with open(os.path.join(self.directory, name), "w") as f:
+            f.write("#!/bin/bash\n" + body)
+
+    def test_output_and_exit_code(self):
+        result = self.pool.run(["./report.sh", "3 4"], self.directory)
+        self.assertEqual(0, result.exit_code)
+        self.assertEqual("producers 3 4\npartial", result.stdout)
+        self.assertEqual("warning\n", result.stderr)
+
+        # as per /bin/bash -e
+        result = self.pool.run(["./fail.sh"], self.directory)
+        self.assertEqual(1, result.exit_code)
+        self.assertEqual("before\n", result.stdout)
+
+        self.assertEqual(1, self.pool.sessions_started)
+        self.assertEqual(1, self.pool.summary()["report.sh"]["count"])
+
+    def test_run_as_script(self):
+        # as if run directly, rather than sourced
+        result = self.pool.run(["./name.sh", "a", "b"], self.directory)
+        self.assertEqual("name.sh name.sh 2\n", result.stdout)
+        self.assertEqual(3, result.exit_code)
+
+        # the session survives the exit
+        self.assertEqual(0, self.pool.run(["./report.sh", "1"], self.directory).exit_code)
+        self.assertEqual(1, self.pool.sessions_started)
+
+    def test_no_bash_per_call(self):
+        # run in a fork of the session, rather than a bash started by it (or by us)
+        for _ in range(2):
+            self.assertEqual(f"{os.getpid()}\n", self.pool.run(["parent.sh"], self.directory).stdout)
+
+    def test_fork_closes_sessions_in_use(self):
+
+        def run():
+            self.pool.run(["./slow.sh"], self.directory)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.assertTrue(wait_until(lambda: len(self.pool._sessions) == 1))
+        session = next(iter(self.pool._sessions))
+        fds = [session.process.stdin.fileno(), session.process.stdout.fileno(), session.process.stderr.fileno()]
+
+        pid = os.fork()
+        if pid == 0:
+            open_fds = 0
+            for fd in fds:
+                try:
+                    os.fstat(fd)
+                    open_fds += 1
+                except OSError:
+                    pass
+            os._exit(open_fds)
+
+        _, status = os.waitpid(pid, 0)
+        thread.join(5)
+        self.assertEqual(0, os.waitstatus_to_exitcode(status))
+
+    def test_stdout_streamed(self):
+        lines = []
+        start_s = time.monotonic()
+        result = self.pool.run(["./slow.sh"], self.directory,
+                               on_stdout_line=lambda line: lines.append((line, time.monotonic() - start_s)))
+
+        self.assertEqual(["deploying", "", "deployed", "done"], [line for line, _ in lines])
+        self.assertEqual("deploying\n\ndeployed\ndone", result.stdout)
+        # the first line well before the script finished
+        self.assertGreater(lines[2][1] - lines[0][1], 0.4)
+
+        lines = []
+        self.pool.run(["./report.sh", "2"], self.directory, on_stdout_line=lambda line: lines.append(line))
+        self.assertEqual(["producers 2", "partial"], lines)
+
+    def test_init_scripts(self):
+        self.write_script("init.sh", "export TRIAL=kafka\nCLUSTER=gke\n")
+        self.write_script("env.sh", "echo $TRIAL $CLUSTER\n")
+        pool = ShellPool(size=1, init_scripts=[os.path.join(self.directory, "init.sh")])
+        self.addCleanup(pool.close)
+
+        # the session's environment is in place, exported or not
+        self.assertEqual("kafka gke\n", pool.run(["./env.sh"], self.directory).stdout)
+
+    def test_timeout(self):
+        result = self.pool.run(["./hang.sh"], self.directory, timeout_s=0.2)
+        self.assertTrue(result.timed_out)
+        self.assertIsNone(result.exit_code)
+
+        # a new session is started for the next call
+        self.assertEqual(0, self.pool.run(["./report.sh", "1"], self.directory).exit_code)
+        self.assertEqual(2, self.pool.sessions_started)
+
+
+if __name__ == '__main__':
+    unittest.main()
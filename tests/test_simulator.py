@@ -0,0 +1,59 @@
+import glob
+import json
+import os
+import shutil
+import unittest
+
+from fs.consumer_controller import ConsumerController
+from fs.run_journal import RunJournal, EVENT_CONFIGURATION_COMPLETED
+from fs.simulator import simulated, ThroughputModel
+
+
+class TestSimulator(unittest.TestCase):
+
+    def test_throughput_model(self):
+        model = ThroughputModel()
+        args = dict(brokers=3, partitions=18, replication_factor=1, batch_size_bytes=7680000, message_size_kb=750,
+                    consumers=1)
+
+        # keeps up with a few producers, then limited by the consumer
+        self.assertEqual(150, model.expected_consumer_mbps(producers=2, **args))
+        self.assertEqual(250, model.expected_consumer_mbps(producers=10, **args))
+
+        # replication divides the broker throughput
+        model = ThroughputModel({"consumer_mbps": 2000})
+        self.assertAlmostEqual(model.expected_consumer_mbps(producers=20, **args) / 3,
+                               model.expected_consumer_mbps(producers=20, **dict(args, replication_factor=3)))
+
+    def test_simulated_controller(self):
+        controller = simulated(ConsumerController)()
+        self.addCleanup(shutil.rmtree, os.path.join(controller.log_directory, controller.run_uid))
+
+        controller.run()
+
+        records = RunJournal.read(controller.journal.path)
+        completed = [r for r in records if r["event"] == EVENT_CONFIGURATION_COMPLETED]
+        self.assertEqual(len(controller.configurations), len(completed))
+        self.assertTrue(all(r["ok"] for r in completed))
+
+        # stress and soak metrics for every configuration
+        metrics_files = glob.glob(os.path.join(controller.log_directory, controller.run_uid, "*_metrics_*.csv"))
+        self.assertEqual(len(controller.configurations), len(metrics_files))
+        for metrics_file in metrics_files:
+            with open(metrics_file) as f:
+                rows = [json.loads(line) for line in f]
+            self.assertEqual(2, len(rows))
+            # one value per CSV column (see aggregate-stats.py)
+            for row in rows:
+                self.assertEqual([], [key for key, value in row.items() if isinstance(value, (dict, list))])
+
+        # the per consumer statistics are kept out of the metrics
+        details_files = glob.glob(os.path.join(controller.log_directory, controller.run_uid, "*_details_*.jsonl"))
+        self.assertEqual(len(controller.configurations), len(details_files))
+        for details_file in details_files:
+            with open(details_file) as f:
+                details = [json.loads(line) for line in f]
+            self.assertTrue(any(len(d.get("soak_consumer_throughput_stats", {})) > 0 for d in details))
+
+        # the node pools are removed at the end of the run
+        self.assertEqual([], controller.get_node_pools())
@@ -0,0 +1,38 @@
+import random
+import statistics
+import unittest
+
+from fs.streaming_stats import StreamingStats, QuantileSketch
+
+
+class TestStreamingStats(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(42)
+        self.values = [rng.lognormvariate(0, 0.5) for _ in range(10000)]
+
+    def test_merged_stats(self):
+        first, second = StreamingStats(), StreamingStats()
+        for value in self.values[0:3000]:
+            first.add(value)
+        for value in self.values[3000:]:
+            second.add(value)
+        first.merge(second)
+
+        self.assertEqual(len(self.values), first.count)
+        self.assertAlmostEqual(statistics.mean(self.values), first.mean)
+        self.assertAlmostEqual(statistics.stdev(self.values), first.stddev())
+        self.assertEqual(min(self.values), first.min)
+
+        ordered = sorted(self.values)
+        for q in (0.5, 0.95, 0.99):
+            exact = ordered[int(q * (len(ordered) - 1))]
+            self.assertLess(abs(first.quantile(q) - exact) / exact, 0.02)
+
+    def test_bounded_buckets(self):
+        sketch = QuantileSketch(max_buckets=32)
+        for value in self.values:
+            sketch.add(value)
+
+        self.assertLessEqual(len(sketch.buckets), 32)
+        self.assertEqual(len(self.values), sketch.count)
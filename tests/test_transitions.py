@@ -0,0 +1,22 @@
+import unittest
+
+from fs.transitions import classify_transition, RESCALE_CONSUMERS, REDEPLOY_KAFKA, REBUILD_NODE_POOLS
+
+
+class TestTransitions(unittest.TestCase):
+
+    configuration = {"number_of_brokers": 3, "broker_machine_type": "n1-standard-8", "disk_size": 100,
+                     "disk_type": "pd-ssd", "num_zk": 1, "number_of_partitions": 18, "replication_factor": 1,
+                     "batch_size_bytes": 7680000, "num_consumers": 1, "start_producer_count": 1}
+
+    def test_classify_transition(self):
+        c = self.configuration
+        self.assertEqual(RESCALE_CONSUMERS, classify_transition(c, dict(c, num_consumers=4, start_producer_count=8)))
+        self.assertEqual(REDEPLOY_KAFKA, classify_transition(c, dict(c, number_of_partitions=36)))
+        self.assertEqual(REBUILD_NODE_POOLS, classify_transition(c, dict(c, number_of_brokers=5)))
+        self.assertEqual(REBUILD_NODE_POOLS, classify_transition(c, dict(c, disk_type="pd-standard",
+                                                                          replication_factor=3)))
+
+    def test_nothing_standing(self):
+        self.assertEqual(REBUILD_NODE_POOLS, classify_transition(None, self.configuration))
+        self.assertEqual(REBUILD_NODE_POOLS, classify_transition(self.configuration, None))
@@ -0,0 +1,50 @@
+import os
+import shutil
+import time
+import unittest
+
+from fs.clock import ManualClock
+from fs.cluster_snapshot import ROLE_BROKER
+from fs.consumer_controller import ConsumerController
+from fs.readiness import ReadinessWaiter
+from fs.simulator import simulated
+from fs.soak_test_process import SOAK_TEST_S
+
+
+class TestVirtualClock(unittest.TestCase):
+
+    def test_readiness_polling(self):
+        clock = ManualClock()
+
+        def get_count(role):
+            # one broker starts every 30s
+            return min(3, int(clock.time() // 30))
+
+        waiter = ReadinessWaiter(watch_command=None, get_count=get_count, clock=clock)
+
+        self.assertTrue(waiter.wait_for(ROLE_BROKER, 3, deadline_s=600))
+        self.assertGreaterEqual(clock.time(), 90)
+
+        self.assertFalse(waiter.wait_for(ROLE_BROKER, 4, deadline_s=600))
+        self.assertGreaterEqual(clock.time(), 690)
+
+    def test_stress_and_soak(self):
+        controller = simulated(ConsumerController)()
+        self.addCleanup(shutil.rmtree, os.path.join(controller.log_directory, controller.run_uid))
+
+        controller.load_configurations()
+        configuration = dict(controller.configurations[0], sequence_number=1)
+        self.assertTrue(controller.provision_node_pools(configuration))
+        self.assertTrue(controller.setup_configuration(configuration))
+
+        start_s = time.monotonic()
+        start_virtual_s = controller.clock.time()
+        controller.run_configuration(configuration)
+
+        self.assertLess(time.monotonic() - start_s, 5)
+        # at least the soak duration has passed in virtual time
+        soak_test_s = SOAK_TEST_S * configuration["number_of_brokers"] / controller.soak_test_process.num_producers
+        self.assertGreater(controller.clock.time() - start_virtual_s, soak_test_s)
+        self.assertEqual(2, len(controller.soak_test_process.load_jsonl(os.path.join(
+            controller.log_directory, controller.run_uid,
+            f"{configuration['configuration_uid']}_metrics_1.csv"))))